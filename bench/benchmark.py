@@ -0,0 +1,252 @@
+"""
+End-to-end benchmark for Kodi Now Playing against the fake Kodi server.
+
+Measures /nowplaying cold and warm latency per media type, time to the first byte of the
+streamed page, the artwork time (rest of the stream), Kodi traffic per page load, /nowplaying?json=1 latency
+and /poll_playback throughput. Results are written as JSON and can be compared with a
+previous run to catch regressions:
+
+    python bench/benchmark.py --output bench/results/new.json --compare bench/results/old.json
+"""
+import argparse
+import datetime
+import json
+import platform
+import sys
+import threading
+import time
+
+import requests
+
+import fake_kodi
+from common import AppProcess, git_revision, parse_server_timing, save_json, summarize
+
+MEDIA_TYPES = ("movie", "episode", "song")
+
+
+def kodi_stats(kodi):
+    with kodi.lock:
+        return dict(kodi.stats)
+
+
+def timed_get(session, url, **kwargs):
+    start = time.perf_counter()
+    response = session.get(url, timeout=60, **kwargs)
+    return response, time.perf_counter() - start
+
+
+def wait_for_item(session, app_url, media_type, itemid, timeout=10):
+    """
+    Wait until the app's poller reports the item that was just started.
+
+    /poll_playback is asked rather than /api/nowplaying, which would build the item's snapshot
+    and download its artwork before the cold page is measured.
+    """
+    prefix = f"{media_type}:{itemid}:"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        key = session.get(f"{app_url}/poll_playback", timeout=10).json().get("key")
+        if key and key.startswith(prefix):
+            return
+        time.sleep(0.05)
+    raise RuntimeError(f"App did not pick up {prefix} in time")
+
+
+def timed_page(session, url):
+    """Fetch a streamed page; returns the response, body size, total time and time to the first byte."""
+    start = time.perf_counter()
+    response = session.get(url, timeout=60, stream=True)
+    chunks = response.iter_content(chunk_size=None)
+    size = len(next(chunks, b""))
+    first_byte = time.perf_counter() - start
+    size += sum(len(chunk) for chunk in chunks)
+    return response, size, time.perf_counter() - start, first_byte
+
+
+def bench_nowplaying(app_url, kodi, media_type, cold_items, iterations):
+    """
+    Cold requests hit a freshly started item, warm requests repeat the last one.
+
+    The page is sent before its artwork is downloaded; the rest of the stream reports the
+    downloads, so artwork is measured from the first byte to the end of the response.
+    """
+    session = requests.Session()
+    cold, warm, first_byte, artwork, render = [], [], [], [], []
+    rpc_calls, image_requests, html_bytes = [], [], []
+
+    for itemid in range(1, cold_items + 1):
+        kodi.play(media_type, itemid)
+        wait_for_item(session, app_url, media_type, itemid)
+        before = kodi_stats(kodi)
+        response, size, elapsed, ttfb = timed_page(session, f"{app_url}/nowplaying")
+        after = kodi_stats(kodi)
+        cold.append(elapsed)
+        first_byte.append(ttfb)
+        artwork.append(elapsed - ttfb)
+        rpc_calls.append(after.get("rpc.total", 0) - before.get("rpc.total", 0))
+        image_requests.append(after.get("image.requests", 0) - before.get("image.requests", 0))
+        html_bytes.append(size)
+        timings = parse_server_timing(response.headers.get("Server-Timing"))
+        render.append(timings.get("render", 0) / 1000)
+
+    for _ in range(iterations):
+        response, size, elapsed, ttfb = timed_page(session, f"{app_url}/nowplaying")
+        warm.append(elapsed)
+        first_byte.append(ttfb)
+        artwork.append(elapsed - ttfb)
+        timings = parse_server_timing(response.headers.get("Server-Timing"))
+        render.append(timings.get("render", 0) / 1000)
+
+    return {
+        "cold": summarize(cold),
+        "warm": summarize(warm),
+        "first_byte": summarize(first_byte),
+        "artwork": summarize(artwork),
+        "render": summarize(render),
+        "rpc_calls_per_cold_page": round(sum(rpc_calls) / len(rpc_calls), 2),
+        "image_requests_per_cold_page": round(sum(image_requests) / len(image_requests), 2),
+        "html_bytes": max(html_bytes),
+    }
+
+
+def bench_progress(app_url, iterations):
+    session = requests.Session()
+    samples = [timed_get(session, f"{app_url}/nowplaying", params={"json": "1"})[1] for _ in range(iterations)]
+    return summarize(samples)
+
+
+def bench_poll(app_url, clients, seconds):
+    """Hammer /poll_playback from several threads and report throughput and latency."""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def worker():
+        session = requests.Session()
+        local, failed = [], 0
+        while time.monotonic() < deadline:
+            try:
+                response, elapsed = timed_get(session, f"{app_url}/poll_playback")
+                if response.status_code != 200 or response.json().get("error"):
+                    failed += 1
+                local.append(elapsed)
+            except requests.RequestException:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.monotonic() - start
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": errors[0],
+        "throughput_rps": round(len(latencies) / wall, 1),
+        "latency": summarize(latencies),
+    }
+
+
+def flatten(data, prefix=""):
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(old, new, threshold):
+    """
+    Print metric deltas between two result files.
+
+    Returns:
+        list: Names of metrics that got worse by more than threshold percent
+    """
+    old_flat, new_flat = flatten(old.get("results", {})), flatten(new.get("results", {}))
+    regressions = []
+    print(f"\nComparison with {old.get('meta', {}).get('revision', '?')} (threshold {threshold}%)")
+    for name in sorted(set(old_flat) & set(new_flat)):
+        before, after = old_flat[name], new_flat[name]
+        higher_is_better = name.endswith("throughput_rps")
+        if not (name.endswith("_ms") or name.endswith("_rps") or name.endswith("_page") or name.endswith("_bytes")):
+            continue
+        if before == 0:
+            continue
+        change = (after - before) / before * 100
+        worse = change < -threshold if higher_is_better else change > threshold
+        marker = "  REGRESSION" if worse else ""
+        print(f"  {name:55s} {before:>10} -> {after:>10} ({change:+.1f}%){marker}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10, help="Warm requests per media type")
+    parser.add_argument("--cold-items", type=int, default=3, help="Distinct items requested cold per media type")
+    parser.add_argument("--poll-clients", type=int, default=8)
+    parser.add_argument("--poll-seconds", type=float, default=5)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="Previous result file to compare against")
+    parser.add_argument("--threshold", type=float, default=10, help="Regression threshold in percent")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    fake_kodi.add_arguments(parser)
+    args = parser.parse_args()
+
+    kodi = fake_kodi.from_arguments(args)
+    kodi_server = fake_kodi.ServerThread(kodi.app)
+    kodi_server.start()
+
+    results = {}
+    try:
+        with AppProcess(kodi_server.url, env={"TRACING": "1"}) as app:
+            for media_type in MEDIA_TYPES:
+                print(f"/nowplaying {media_type} ...", flush=True)
+                results.setdefault("nowplaying", {})[media_type] = bench_nowplaying(
+                    app.url, kodi, media_type, args.cold_items, args.iterations)
+            print("/nowplaying?json=1 ...", flush=True)
+            results["progress_json"] = bench_progress(app.url, args.iterations * 3)
+            print("/poll_playback ...", flush=True)
+            results["poll_playback"] = bench_poll(app.url, args.poll_clients, args.poll_seconds)
+    finally:
+        kodi_server.shutdown()
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "results": results,
+    }
+    save_json(args.output, report)
+
+    for media_type, data in results["nowplaying"].items():
+        print(f"{media_type:8s} cold p50 {data['cold']['p50_ms']:8.1f} ms  warm p50 {data['warm']['p50_ms']:8.1f} ms  "
+              f"first byte p50 {data['first_byte']['p50_ms']:8.1f} ms  "
+              f"artwork p50 {data['artwork']['p50_ms']:8.1f} ms  {data['rpc_calls_per_cold_page']} RPCs, "
+              f"{data['image_requests_per_cold_page']} images per cold page")
+    poll = results["poll_playback"]
+    print(f"poll     {poll['throughput_rps']} req/s, p99 {poll['latency']['p99_ms']} ms, {poll['errors']} errors")
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Shared helpers for the Kodi Now Playing benchmark and load generator.
+"""
+import json
+import math
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(REPO_ROOT, "nowplaying")
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(values):
+    """
+    Summarize latencies given in seconds.
+
+    Returns:
+        dict: count, mean, p50, p95, p99 and max, in milliseconds
+    """
+    ms = [v * 1000 for v in values]
+    return {
+        "count": len(ms),
+        "mean_ms": round(sum(ms) / len(ms), 2) if ms else 0,
+        "p50_ms": round(percentile(ms, 50), 2),
+        "p95_ms": round(percentile(ms, 95), 2),
+        "p99_ms": round(percentile(ms, 99), 2),
+        "max_ms": round(max(ms), 2) if ms else 0,
+    }
+
+
+def parse_server_timing(header):
+    """Turn a Server-Timing header into {name: milliseconds}."""
+    timings = {}
+    for entry in (header or "").split(","):
+        parts = [p.strip() for p in entry.split(";")]
+        if not parts[0]:
+            continue
+        for part in parts[1:]:
+            if part.startswith("dur="):
+                timings[parts[0]] = float(part[4:])
+    return timings
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+class AppProcess:
+    """
+    Run kodi-nowplaying.py in a subprocess against a given Kodi URL.
+
+    Each process gets its own artwork directory and store, so every run starts cold and
+    the store's cleanup never touches files in the shared /tmp.
+    """
+
+    def __init__(self, kodi_url, port=None, env=None):
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.art_dir = tempfile.mkdtemp(prefix="nowplaying-bench-")
+        self.env = {
+            **os.environ,
+            "KODI_HOST": kodi_url,
+            "KODI_USER": "kodi",
+            "KODI_PASS": "kodi",
+            "PORT": str(self.port),
+            "LOG_LEVEL": "ERROR",
+            "ART_DIR": self.art_dir,
+            "STORE_PATH": os.path.join(self.art_dir, "nowplaying.db"),
+            **(env or {}),
+        }
+        self.process = None
+
+    def start(self, timeout=30):
+        self.process = subprocess.Popen([sys.executable, "kodi-nowplaying.py"], cwd=APP_DIR, env=self.env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"App exited with code {self.process.returncode}")
+            try:
+                requests.get(f"{self.url}/favicon.ico", timeout=1)
+                return self
+            except requests.RequestException:
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError("App did not start in time")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        shutil.rmtree(self.art_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+
+def save_json(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
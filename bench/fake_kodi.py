@@ -0,0 +1,555 @@
+"""
+Fake Kodi JSON-RPC server for benchmarking Kodi Now Playing.
+Implements the Player, VideoLibrary, AudioLibrary, Files and Textures methods the app calls, serves
+artwork from /vfs/ and /image/, and injects configurable latency, jitter and failures.
+
+Run standalone:
+    python bench/fake_kodi.py --port 8080 --latency 20 --jitter 10 --failure-rate 0.01
+
+Control endpoints (used by benchmark.py and loadgen.py):
+    POST /_control/play     {"type": "movie" | "episode" | "song", "id": 1}
+    POST /_control/stop
+    POST /_control/replace  {"path": "nfs://..."} changes an image file (new ETag, content and texture hash)
+    POST /_control/config   {"latency_ms": 50, "failure_rate": 0.1, ...}
+    GET  /_control/stats    RPC and image counters
+    POST /_control/reset    Clear counters
+"""
+import argparse
+import base64
+import email.utils
+import hashlib
+import logging
+import random
+import threading
+import time
+import urllib.parse
+
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import make_server
+
+# 8x8 baseline JPEG; artwork is padded after the EOI marker up to the configured size
+_TINY_JPEG = base64.b64decode(
+    "/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDABALDA4MChAODQ4SERATGCgaGBYWGDEjJR0oOjM9PDkzODdASFxOQERXRTc4UG1RV19iZ2hnPk1xeXBkeFxlZ2P/"
+    "2wBDARESEhgVGC8aGi9jQjhCY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2P/wAARCAAIAAgDASIAAhEBAxEB/8QA"
+    "HwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUFBAQAAAF9AQIDAAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkK"
+    "FhcYGRolJicoKSo0NTY3ODk6Q0RFRkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXG"
+    "x8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/8QAHwEAAwEBAQEBAQEBAQAAAAAAAAECAwQFBgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3AAEC"
+    "AxEEBSExBhJBUQdhcRMiMoEIFEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRomJygpKjU2Nzg5OkNERUZHSElKU1RVVldYWVpjZGVmZ2hpanN0dXZ3eHl6goOE"
+    "hYaHiImKkpOUlZaXmJmaoqOkpaanqKmqsrO0tba3uLm6wsPExcbHyMnK0tPU1dbX2Nna4uPk5ebn6Onq8vP09fb3+Pn6/9oADAMBAAIRAxEAPwCpRRRXQYn/2Q=="
+)
+
+# Modification time of the synthetic files; each replacement adds a minute
+_FILE_TIME = 1_700_000_000
+# Dimensions of the thumbnail cache copies (Kodi's default fanart and image resolutions)
+TEXTURE_SIZES = {"fanart": (1920, 1080), "poster": (1000, 1500), "thumb": (1000, 1000), "banner": (1000, 185)}
+# Approximate on-disk sizes of each kind of artwork, in bytes
+ART_SIZES = {
+    "fanart": 2_500_000,
+    "poster": 600_000,
+    "thumb": 300_000,
+    "clearlogo": 120_000,
+    "clearart": 200_000,
+    "discart": 400_000,
+    "banner": 150_000,
+}
+
+_WORDS = ("the", "night", "river", "signal", "empire", "quiet", "storm", "glass", "orbit", "harbor",
+          "ember", "atlas", "velvet", "echo", "north", "paper", "circuit", "wild", "silver", "garden")
+
+
+def _image_uri(path):
+    return f"image://{urllib.parse.quote(path, safe='')}/"
+
+
+class Library:
+    """Deterministic synthetic movie, TV and music library."""
+
+    def __init__(self, movies=50, shows=5, seasons=3, episodes_per_season=10, artists=10,
+                 albums_per_artist=3, songs_per_album=10, cast_size=20, plot_chars=600,
+                 lyrics_chars=3000, bio_chars=2000, extra_fanart=3, seed=1):
+        rng = random.Random(seed)
+
+        def text(chars):
+            words = []
+            while sum(len(w) + 1 for w in words) < chars:
+                words.append(rng.choice(_WORDS))
+            return " ".join(words).capitalize() + "."
+
+        def title():
+            return " ".join(rng.choice(_WORDS).capitalize() for _ in range(rng.randint(1, 3)))
+
+        self.files = {}
+        # Times a file was replaced, for ETag and Last-Modified
+        self.versions = {}
+        self.textures = {}
+        self.movies = {}
+        self.episodes = {}
+        self.songs = {}
+        self.albums = {}
+        self.artists = {}
+
+        def add_art(folder, kinds, names=None):
+            art = {}
+            for kind in kinds:
+                name = (names or {}).get(kind, kind)
+                path = f"{folder}/{name}.jpg"
+                self.files[path] = ART_SIZES.get(kind.split(".")[-1], 200_000)
+                add_texture(path, kind.split(".")[-1])
+                art[kind] = _image_uri(path)
+            return art
+
+        def add_texture(path, kind):
+            # Kodi's thumbnail cache holds a smaller copy of every image it has shown
+            digest = hashlib.md5(path.encode()).hexdigest()[:8]
+            cached = f"{digest[0]}/{digest}.jpg"
+            width, height = TEXTURE_SIZES.get(kind, (800, 600))
+            self.files[f"special://thumbnails/{cached}"] = self.files[path] // 4
+            self.textures[path] = {"textureid": len(self.textures) + 1, "url": path, "cachedurl": cached,
+                                   "imagehash": f"d0-{self.files[path]}",
+                                   "sizes": [{"size": 0, "width": width, "height": height, "usecount": 1, "lastused": ""}]}
+
+        def add_extra_fanart(folder):
+            # Kodi's extrafanart folder convention; these are only found by listing the folder
+            for number in range(1, extra_fanart + 1):
+                self.files[f"{folder}/extrafanart/fanart{number}.jpg"] = ART_SIZES["fanart"]
+                add_texture(f"{folder}/extrafanart/fanart{number}.jpg", "fanart")
+
+        def streamdetails(video=True):
+            details = {
+                "audio": [{"codec": rng.choice(["ac3", "dts", "truehd", "eac3"]), "channels": rng.choice([2, 6, 8]),
+                           "language": rng.choice(["eng", "ger", "fre", "spa"])} for _ in range(rng.randint(1, 4))],
+                "subtitle": [{"language": rng.choice(["eng", "ger", "fre", "spa", "ita"])} for _ in range(rng.randint(0, 6))],
+                "video": [],
+            }
+            if video:
+                details["video"] = [{"codec": rng.choice(["hevc", "h264"]), "height": rng.choice([720, 1080, 2160]),
+                                     "width": 1920, "hdrtype": rng.choice(["", "hdr10", "dolbyvision"])}]
+            return details
+
+        def cast():
+            return [{"name": f"{title()} {title()}", "role": title(), "order": i,
+                     "thumbnail": _image_uri(f"nfs://nas/media/.actors/actor{i}.jpg")} for i in range(cast_size)]
+
+        for movieid in range(1, movies + 1):
+            name = title()
+            year = rng.randint(1970, 2024)
+            folder = f"nfs://nas/media/Movies/{name} ({year})"
+            self.movies[movieid] = {
+                "movieid": movieid, "type": "movie", "label": name, "title": name, "year": year,
+                "file": f"{folder}/{name}.mkv", "plot": text(plot_chars), "rating": round(rng.uniform(4, 9), 1),
+                "genre": [rng.choice(["drama", "comedy", "thriller", "sci-fi"]) for _ in range(2)],
+                "director": [f"{title()} {title()}"], "cast": cast(), "streamdetails": streamdetails(),
+                "uniqueid": {"imdb": f"tt{movieid:07d}"}, "duration": rng.randint(5400, 9000),
+                "art": add_art(folder, ["poster", "fanart", "clearlogo", "clearart", "discart", "banner"]
+                               + [f"fanart{number}" for number in range(1, extra_fanart + 1)]),
+                "resume": {"position": 0, "total": 0},
+            }
+
+        episodeid = 0
+        for tvshowid in range(1, shows + 1):
+            show = title()
+            show_folder = f"nfs://nas/media/TV/{show}"
+            show_art = add_art(show_folder, ["poster", "fanart", "clearlogo", "banner"])
+            add_extra_fanart(show_folder)
+            for season in range(1, seasons + 1):
+                season_art = add_art(show_folder, ["poster"], {"poster": f"season{season:02d}-poster"})
+                for number in range(1, episodes_per_season + 1):
+                    episodeid += 1
+                    name = title()
+                    folder = f"{show_folder}/Season {season}"
+                    art = {f"tvshow.{k}": v for k, v in show_art.items()}
+                    art["season.poster"] = season_art["poster"]
+                    art.update(add_art(folder, ["thumb"], {"thumb": f"S{season:02d}E{number:02d}-thumb"}))
+                    self.episodes[episodeid] = {
+                        "episodeid": episodeid, "type": "episode", "label": name, "title": name,
+                        "showtitle": show, "tvshowid": tvshowid, "season": season, "episode": number,
+                        "year": 2000 + season, "file": f"{folder}/{show} S{season:02d}E{number:02d}.mkv",
+                        "plot": text(plot_chars), "rating": round(rng.uniform(5, 9), 1),
+                        "genre": ["drama"], "director": [f"{title()} {title()}"], "cast": cast(),
+                        "streamdetails": streamdetails(), "uniqueid": {"imdb": f"tt{episodeid + 5000000:07d}"},
+                        "duration": rng.randint(1200, 3600), "art": art, "resume": {"position": 0, "total": 0},
+                    }
+
+        songid = 0
+        albumid = 0
+        for artistid in range(1, artists + 1):
+            artist = title()
+            artist_folder = f"nfs://nas/media/Music/{artist}"
+            artist_art = add_art(artist_folder, ["fanart", "clearlogo", "banner", "thumb"])
+            add_extra_fanart(artist_folder)
+            self.artists[artistid] = {
+                "artistid": artistid, "label": artist, "artist": artist, "description": text(bio_chars),
+                "born": str(rng.randint(1940, 1990)), "formed": "", "died": "", "disbanded": "",
+                "genre": ["Rock"], "mood": ["Energetic"], "style": ["Alternative"], "yearsactive": ["1990-2020"],
+                "fanart": artist_art["fanart"], "thumbnail": artist_art["thumb"],
+            }
+            for _ in range(albums_per_artist):
+                albumid += 1
+                album = title()
+                year = rng.randint(1970, 2024)
+                album_folder = f"{artist_folder}/{album} ({year})"
+                album_art = add_art(album_folder, ["thumb", "discart"])
+                self.albums[albumid] = {
+                    "albumid": albumid, "label": album, "title": album, "artist": [artist], "year": year,
+                    "rating": round(rng.uniform(5, 9), 1), "description": text(bio_chars // 2),
+                    "genre": ["Rock"], "mood": [], "style": [], "theme": [], "albumduration": 2400,
+                    "playcount": 0, "albumlabel": "Label", "compilation": False, "totaldiscs": 1,
+                    "fanart": artist_art["fanart"], "thumbnail": album_art["thumb"],
+                }
+                for track in range(1, songs_per_album + 1):
+                    songid += 1
+                    name = title()
+                    art = {"thumb": album_art["thumb"], "album.thumb": album_art["thumb"],
+                           "album.discart": album_art["discart"]}
+                    art.update({f"artist.{k}": v for k, v in artist_art.items()})
+                    art.update({f"albumartist.{k}": v for k, v in artist_art.items()})
+                    self.songs[songid] = {
+                        "songid": songid, "type": "song", "label": name, "title": name, "album": album,
+                        "albumid": albumid, "artist": [artist], "artistid": [artistid], "year": year,
+                        "track": track, "disc": 1, "duration": rng.randint(150, 420),
+                        "file": f"{album_folder}/{track:02d} - {name}.flac", "genre": ["Rock"],
+                        "rating": round(rng.uniform(0, 10), 1), "lyrics": text(lyrics_chars),
+                        "comment": text(200), "bitrate": 1411, "channels": 2, "samplerate": 44100,
+                        "bpm": rng.randint(80, 160), "mood": "", "playcount": 0,
+                        "fanart": artist_art["fanart"], "thumbnail": album_art["thumb"], "art": art,
+                    }
+
+    def list_directory(self, directory):
+        """Files and folders directly inside a directory, or None if nothing is stored below it."""
+        prefix = directory.rstrip("/") + "/"
+        files, folders = [], set()
+        for path in self.files:
+            if path.startswith(prefix):
+                name, _, rest = path[len(prefix):].partition("/")
+                if rest:
+                    folders.add(prefix + name + "/")
+                else:
+                    files.append(path)
+        if not files and not folders:
+            return None
+        return sorted(files), sorted(folders)
+
+    def replace(self, path):
+        """Simulate someone replacing an image file in the library."""
+        version = self.versions.get(path, 0) + 1
+        self.versions[path] = version
+        if path in self.textures:
+            # Kodi notices the change and caches a new copy
+            self.textures[path]["imagehash"] = f"d{version}-{self.files[path]}"
+            cached = f"special://thumbnails/{self.textures[path]['cachedurl']}"
+            self.versions[cached] = self.versions.get(cached, 0) + 1
+        return version
+
+    def get(self, media_type, itemid):
+        table = {"movie": self.movies, "episode": self.episodes, "song": self.songs}[media_type]
+        return table.get(itemid)
+
+
+class FakeKodi:
+    """Kodi stand-in: player state, synthetic library and fault injection behind a Flask app."""
+
+    def __init__(self, library=None, latency_ms=0, jitter_ms=0, failure_rate=0.0, image_failure_rate=0.0,
+                 bandwidth_mbps=0, image_scale=1.0, image_endpoint=True, textures=True, seed=None):
+        self.library = library or Library()
+        self.config = {
+            "latency_ms": latency_ms,
+            "jitter_ms": jitter_ms,
+            "failure_rate": failure_rate,
+            "image_failure_rate": image_failure_rate,
+            "bandwidth_mbps": bandwidth_mbps,
+            "image_scale": image_scale,
+            "image_endpoint": image_endpoint,
+            "textures": textures,
+        }
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.playing = None
+        self.stats = {}
+        self.app = self._build_app()
+
+    # Player state
+
+    def play(self, media_type, itemid, elapsed=0, paused=False):
+        item = self.library.get(media_type, itemid)
+        if item is None:
+            raise KeyError(f"No {media_type} with id {itemid}")
+        playerid = 0 if media_type == "song" else 1
+        with self.lock:
+            self.playing = {"type": media_type, "id": itemid, "playerid": playerid,
+                            "started": time.monotonic() - elapsed, "paused_at": elapsed if paused else None}
+
+    def stop(self):
+        with self.lock:
+            self.playing = None
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {}
+
+    def _count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + amount
+
+    def _delay(self, size=0):
+        latency = self.config["latency_ms"] + self.rng.uniform(-1, 1) * self.config["jitter_ms"]
+        if self.config["bandwidth_mbps"] and size:
+            latency += size * 8 / (self.config["bandwidth_mbps"] * 1000)
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    def _fail(self, rate):
+        return rate > 0 and self.rng.random() < rate
+
+    # JSON-RPC
+
+    def _current(self):
+        with self.lock:
+            playing = dict(self.playing) if self.playing else None
+        if playing is None:
+            return None, None
+        return playing, self.library.get(playing["type"], playing["id"])
+
+    @staticmethod
+    def _pick(item, properties):
+        result = {"id": item.get(f"{item['type']}id"), "type": item["type"], "label": item["label"]}
+        for prop in properties or []:
+            if prop in item:
+                result[prop] = item[prop]
+            elif prop == "thumbnail":
+                result[prop] = item.get("art", {}).get("thumb", "")
+            elif prop == "showtitle":
+                result[prop] = ""
+        return result
+
+    @staticmethod
+    def _details(record, properties, idkey):
+        result = {idkey: record[idkey], "label": record["label"]}
+        for prop in properties or []:
+            if prop in record:
+                result[prop] = record[prop]
+        return result
+
+    def rpc(self, method, params):
+        playing, item = self._current()
+        if method == "JSONRPC.Ping":
+            return "pong"
+        if method == "JSONRPC.Version":
+            # Kodi 21 (Omega)
+            return {"version": {"major": 13, "minor": 5, "patch": 0}}
+        if method == "Player.GetActivePlayers":
+            if not playing:
+                return []
+            kind = "audio" if playing["type"] == "song" else "video"
+            return [{"playerid": playing["playerid"], "playertype": "internal", "type": kind}]
+        if method == "Player.GetItem":
+            if not playing:
+                return {"item": {"label": "", "type": "unknown"}}
+            return {"item": self._pick(item, params.get("properties"))}
+        if method == "Player.GetProperties":
+            if not playing:
+                raise LookupError("Failed to execute method.")
+            if playing["paused_at"] is not None:
+                elapsed, speed = playing["paused_at"], 0
+            else:
+                elapsed, speed = time.monotonic() - playing["started"], 1
+            elapsed = min(int(elapsed), item["duration"])
+            as_time = lambda s: {"hours": s // 3600, "minutes": s % 3600 // 60, "seconds": s % 60, "milliseconds": 0}
+            values = {"time": as_time(elapsed), "totaltime": as_time(item["duration"]), "speed": speed,
+                      "percentage": elapsed * 100 / item["duration"]}
+            return {k: v for k, v in values.items() if k in (params.get("properties") or values)}
+        if method == "VideoLibrary.GetMovieDetails":
+            return {"moviedetails": self._details(self.library.movies[params["movieid"]], params.get("properties"), "movieid")}
+        if method == "VideoLibrary.GetEpisodeDetails":
+            return {"episodedetails": self._details(self.library.episodes[params["episodeid"]], params.get("properties"), "episodeid")}
+        if method == "AudioLibrary.GetSongDetails":
+            return {"songdetails": self._details(self.library.songs[params["songid"]], params.get("properties"), "songid")}
+        if method == "AudioLibrary.GetAlbumDetails":
+            return {"albumdetails": self._details(self.library.albums[params["albumid"]], params.get("properties"), "albumid")}
+        if method == "AudioLibrary.GetArtistDetails":
+            return {"artistdetails": self._details(self.library.artists[params["artistid"]], params.get("properties"), "artistid")}
+        if method == "Files.PrepareDownload":
+            path = params.get("path", "")
+            if path.startswith("image://"):
+                path = urllib.parse.unquote(path[len("image://"):]).rstrip("/")
+            # Like Kodi, a download path is handed out whether or not the file exists
+            return {"details": {"path": f"vfs/{urllib.parse.quote(path, safe='')}"}, "mode": "redirect", "protocol": "http"}
+        if method == "Textures.GetTextures":
+            if not self.config["textures"]:
+                raise NotImplementedError(method)
+            rules = params.get("filter", {})
+            rules = rules.get("or", [rules])
+            urls = [rule["value"] for rule in rules if rule.get("field") == "url" and rule.get("operator") == "is"]
+            textures = [self.library.textures[url] for url in urls if url in self.library.textures]
+            return {"textures": textures, "limits": {"start": 0, "end": len(textures), "total": len(textures)}}
+        if method == "Files.GetDirectory":
+            listing = self.library.list_directory(params["directory"])
+            if listing is None:
+                raise LookupError("Invalid params.")
+            files, folders = listing
+            entries = [{"file": path, "filetype": "directory", "label": path.rstrip("/").rsplit("/", 1)[-1]} for path in folders]
+            entries += [{"file": path, "filetype": "file", "label": path.rsplit("/", 1)[-1]} for path in files]
+            return {"files": entries, "limits": {"start": 0, "end": len(entries), "total": len(entries)}}
+        raise NotImplementedError(method)
+
+    # Artwork
+
+    def image_bytes(self, path):
+        size = self.library.files.get(path)
+        if size is None:
+            return None
+        size = max(len(_TINY_JPEG), int(size * self.config["image_scale"]))
+        # A replaced file gets different bytes after the JPEG end marker
+        padding = bytes([self.library.versions.get(path, 0) % 256])
+        return _TINY_JPEG + padding * (size - len(_TINY_JPEG))
+
+    def _build_app(self):
+        app = Flask("fake_kodi")
+
+        @app.route("/jsonrpc", methods=["POST"])
+        def jsonrpc():
+            payload = request.get_json(force=True, silent=True) or {}
+            method = payload.get("method", "")
+            self._count(f"rpc.{method}")
+            self._count("rpc.total")
+            self._delay()
+            if self._fail(self.config["failure_rate"]):
+                self._count("rpc.failed")
+                return "Injected failure", 500
+            try:
+                result = self.rpc(method, payload.get("params") or {})
+                body = {"id": payload.get("id"), "jsonrpc": "2.0", "result": result}
+            except NotImplementedError:
+                body = {"id": payload.get("id"), "jsonrpc": "2.0", "error": {"code": -32601, "message": "Method not found."}}
+            except (KeyError, LookupError, TypeError) as e:
+                body = {"id": payload.get("id"), "jsonrpc": "2.0", "error": {"code": -32602, "message": str(e)}}
+            response = jsonify(body)
+            self._count("rpc.bytes", len(response.get_data()))
+            return response
+
+        @app.route("/vfs/<path:encoded>")
+        def vfs(encoded):
+            self._count("image.requests")
+            path = urllib.parse.unquote(encoded)
+            data = self.image_bytes(path)
+            if data is None:
+                self._count("image.not_found")
+                return "File not found", 404
+            version = self.library.versions.get(path, 0)
+            validators = {
+                "ETag": f'"{hashlib.md5(path.encode()).hexdigest()[:8]}-{version}"',
+                "Last-Modified": email.utils.formatdate(_FILE_TIME + version * 60, usegmt=True),
+            }
+            if request.headers.get("If-None-Match") == validators["ETag"] or (
+                    "If-None-Match" not in request.headers
+                    and request.headers.get("If-Modified-Since") == validators["Last-Modified"]):
+                self._count("image.not_modified")
+                self._delay(0)
+                return Response(status=304, headers=validators)
+            self._delay(len(data))
+            if self._fail(self.config["image_failure_rate"]):
+                self._count("image.failed")
+                return "Injected failure", 500
+            self._count("image.bytes", len(data))
+            return Response(data, mimetype="image/jpeg", headers=validators)
+
+        @app.route("/image/<path:encoded>")
+        def image(encoded):
+            # image://<quoted path>/, served from the texture cache without a PrepareDownload token
+            if not self.config["image_endpoint"]:
+                return "Not found", 404
+            self._count("image.endpoint")
+            uri = encoded if encoded.startswith("image://") else urllib.parse.unquote(encoded)
+            return vfs(urllib.parse.unquote(uri[len("image://"):]).rstrip("/"))
+
+        @app.route("/_control/play", methods=["POST"])
+        def control_play():
+            body = request.get_json(force=True)
+            self.play(body["type"], int(body["id"]), body.get("elapsed", 0), body.get("paused", False))
+            return jsonify({"ok": True})
+
+        @app.route("/_control/replace", methods=["POST"])
+        def control_replace():
+            body = request.get_json(force=True)
+            return jsonify({"version": self.library.replace(body["path"])})
+
+        @app.route("/_control/stop", methods=["POST"])
+        def control_stop():
+            self.stop()
+            return jsonify({"ok": True})
+
+        @app.route("/_control/config", methods=["POST"])
+        def control_config():
+            body = request.get_json(force=True)
+            self.config.update({k: v for k, v in body.items() if k in self.config})
+            return jsonify(self.config)
+
+        @app.route("/_control/stats")
+        def control_stats():
+            with self.lock:
+                return jsonify(dict(self.stats))
+
+        @app.route("/_control/reset", methods=["POST"])
+        def control_reset():
+            self.reset_stats()
+            return jsonify({"ok": True})
+
+        return app
+
+
+class ServerThread(threading.Thread):
+    """Run a WSGI app on a background thread until shutdown() is called."""
+
+    def __init__(self, app, host="127.0.0.1", port=0):
+        super().__init__(daemon=True)
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        self.server = make_server(host, port, app, threaded=True)
+        self.url = f"http://{host}:{self.server.server_port}"
+
+    def run(self):
+        self.server.serve_forever()
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+def add_arguments(parser):
+    """Add the fake Kodi options shared by the benchmark and load generator."""
+    parser.add_argument("--latency", type=float, default=5, help="Base latency per Kodi request in ms")
+    parser.add_argument("--jitter", type=float, default=2, help="Uniform +/- jitter in ms")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of RPC calls answered with HTTP 500")
+    parser.add_argument("--image-failure-rate", type=float, default=0.0, help="Share of image requests answered with HTTP 500")
+    parser.add_argument("--bandwidth", type=float, default=0, help="Simulated image bandwidth in Mbit/s, 0 for unlimited")
+    parser.add_argument("--image-scale", type=float, default=1.0, help="Multiplier for synthetic artwork sizes")
+    parser.add_argument("--no-image-endpoint", dest="image_endpoint", action="store_false",
+                        help="Answer /image/ with 404, like a Kodi behind a proxy that does not pass it")
+    parser.add_argument("--no-textures", dest="textures", action="store_false",
+                        help="Answer Textures.GetTextures as unknown, like Kodi before version 13")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the synthetic library and fault injection")
+
+
+def from_arguments(args):
+    return FakeKodi(Library(seed=args.seed), latency_ms=args.latency, jitter_ms=args.jitter,
+                    failure_rate=args.failure_rate, image_failure_rate=args.image_failure_rate,
+                    bandwidth_mbps=args.bandwidth, image_scale=args.image_scale,
+                    image_endpoint=args.image_endpoint, textures=args.textures, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--play", default="song:1", help="Item playing at start as type:id, or 'none'")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    kodi = from_arguments(args)
+    if args.play != "none":
+        media_type, itemid = args.play.split(":")
+        kodi.play(media_type, int(itemid))
+    print(f"Fake Kodi on http://{args.host}:{args.port} "
+          f"({len(kodi.library.movies)} movies, {len(kodi.library.episodes)} episodes, {len(kodi.library.songs)} songs)")
+    make_server(args.host, args.port, kodi.app, threaded=True).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+Multi-client load generator for Kodi Now Playing.
+
+Each simulated client behaves like a browser showing the now playing page (a wall display
+or a Homarr iframe tile): it loads /nowplaying and its /media artwork, ticks locally every
+second, resyncs progress with /nowplaying?json=1 every 5 s and long-polls /api/nowplaying
+like nowplaying.js. Deferred sections and the slideshow list are fetched after each page
+load. A new item of the same type is swapped in place (fragment, artwork and sections); a
+stop or a switch of layout does a full reload through the idle page.
+
+The client count is stepped up and server latency, Kodi-side RPC rate and error rates are
+reported per step:
+
+    python bench/loadgen.py --clients 1,5,10,25,50 --duration 30
+"""
+import argparse
+import datetime
+import json
+import random
+import re
+import threading
+import time
+
+import requests
+
+import fake_kodi
+from common import AppProcess, git_revision, save_json, summarize
+
+_MEDIA_URL = re.compile(r"""(?<=['"(])/media/[^'")\s]+""")
+_RUNTIME_CONFIG = re.compile(r"NowPlaying\.start\((.*?)\);")
+_SECTION = re.compile(r'data-section="(\w+)"')
+# Matches nowplaying.js; long-poll latencies are kept out of the printed percentiles
+LONG_POLL_SECONDS = 25
+LONG_POLL_ROUTE = "/api/nowplaying?wait"
+
+
+class Recorder:
+    """Thread-safe collection of request latencies and errors per route."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.reloads = 0
+        self.swaps = 0
+        self.ticks = 0
+
+    def add(self, route, elapsed, ok):
+        with self.lock:
+            self.latencies.setdefault(route, []).append(elapsed)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+class Client(threading.Thread):
+    """One simulated browser running the page's timers until stop is set."""
+
+    def __init__(self, app_url, recorder, stop, fetch_media=True):
+        super().__init__(daemon=True)
+        self.app_url = app_url
+        self.recorder = recorder
+        self.stop_event = stop
+        self.fetch_media = fetch_media
+        self.session = requests.Session()
+        self.key = self.type = None
+
+    def get(self, route, path=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.get(f"{self.app_url}{path or route}", timeout=30, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        self.recorder.add(route, time.perf_counter() - start, ok)
+        return response
+
+    def load_page(self):
+        response = self.get("/nowplaying")
+        self.key = self.type = None
+        if response is None:
+            return
+        match = _RUNTIME_CONFIG.search(response.text)
+        if match:
+            config = json.loads(match.group(1))
+            self.key, self.type = config["key"], config["type"]
+        if self.fetch_media:
+            for url in sorted(set(_MEDIA_URL.findall(response.text))):
+                self.get("/media", url)
+        self.load_sections(response.text)
+
+    def load_sections(self, html):
+        for name in _SECTION.findall(html):
+            self.get("/nowplaying?section", "/nowplaying", params={"section": name, "key": self.key})
+        self.get("/nowplaying?slides", "/nowplaying", params={"slides": "1", "key": self.key})
+
+    def swap(self):
+        """Fetch the next item's fragment and artwork, as the runtime does before crossfading."""
+        response = self.get("/nowplaying?fragment=1", "/nowplaying", params={"fragment": "1"})
+        if response is None or not response.ok:
+            return
+        fragment = response.json()
+        self.key = fragment.get("key")
+        if self.fetch_media:
+            for url in fragment.get("images", []):
+                self.get("/media", url)
+        self.load_sections(fragment.get("content", ""))
+
+    def wait_for_playback(self):
+        """Sit on the idle page, polling /poll_playback until something plays."""
+        self.get("/")
+        while not self.stop_event.wait(2):
+            response = self.get("/poll_playback")
+            if response is not None and response.ok and response.json().get("playing"):
+                return True
+        return False
+
+    def watch(self):
+        etag = None
+        while not self.stop_event.is_set():
+            headers = {"If-None-Match": etag} if etag else {}
+            params = {"details": "0", "wait": LONG_POLL_SECONDS if etag else 0}
+            response = self.get(LONG_POLL_ROUTE if etag else "/api/nowplaying", "/api/nowplaying",
+                                params=params, headers=headers)
+            if response is None or response.status_code >= 400:
+                self.stop_event.wait(2)
+                continue
+            if response.status_code == 304:
+                continue
+            etag = response.headers.get("ETag")
+            snapshot = response.json()
+            if snapshot.get("error"):
+                self.stop_event.wait(0.25)
+                continue
+            if not snapshot["playing"]:
+                self.recorder.count("reloads")
+                if self.wait_for_playback():
+                    self.load_page()
+                etag = None
+            elif snapshot["item"]["key"] != self.key:
+                if snapshot["item"]["type"] == self.type:
+                    self.recorder.count("swaps")
+                    self.swap()
+                else:
+                    self.recorder.count("reloads")
+                    self.load_page()
+            self.stop_event.wait(0.25)
+
+    def run(self):
+        # Stagger clients so they do not all tick in lockstep
+        if self.stop_event.wait(random.uniform(0, 2)):
+            return
+        self.load_page()
+        watcher = threading.Thread(target=self.watch, daemon=True)
+        watcher.start()
+        next_tick = next_resync = time.monotonic()
+        next_resync += 5
+        while not self.stop_event.is_set():
+            now = time.monotonic()
+            if now >= next_tick:
+                self.recorder.count("ticks")
+                next_tick += 1
+            if now >= next_resync:
+                self.get("/nowplaying?json=1", "/nowplaying", params={"json": "1"})
+                next_resync += 5
+            self.stop_event.wait(max(0.0, min(next_tick, next_resync) - time.monotonic()))
+        watcher.join(timeout=LONG_POLL_SECONDS + 5)
+
+
+def kodi_counters(kodi_url):
+    try:
+        return requests.get(f"{kodi_url}/_control/stats", timeout=5).json()
+    except (requests.RequestException, ValueError):
+        return {}
+
+
+def run_step(app_url, kodi_url, clients, duration, fetch_media, kodi=None, change_every=0, stop_every=0):
+    recorder = Recorder()
+    stop = threading.Event()
+    before = kodi_counters(kodi_url) if kodi_url else {}
+    threads = [Client(app_url, recorder, stop, fetch_media) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+
+    # Optionally drive the fake Kodi through track changes and stop/start transitions
+    start = time.monotonic()
+    next_change = start + change_every if change_every else None
+    next_stop = start + stop_every if stop_every else None
+    itemid, playing = 1, True
+    while time.monotonic() - start < duration:
+        time.sleep(0.2)
+        now = time.monotonic()
+        if kodi and next_change and now >= next_change:
+            itemid += 1
+            kodi.play("song", itemid)
+            next_change += change_every
+        if kodi and next_stop and now >= next_stop:
+            if playing:
+                kodi.stop()
+            else:
+                kodi.play("song", itemid)
+            playing = not playing
+            next_stop += stop_every
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=LONG_POLL_SECONDS + 10)
+    elapsed = time.monotonic() - start
+
+    after = kodi_counters(kodi_url) if kodi_url else {}
+    routes = {}
+    for route, samples in sorted(recorder.latencies.items()):
+        routes[route] = {
+            **summarize(samples),
+            "rate_rps": round(len(samples) / elapsed, 2),
+            "errors": recorder.errors.get(route, 0),
+            "error_rate": round(recorder.errors.get(route, 0) / len(samples), 4),
+        }
+    total_requests = sum(len(s) for s in recorder.latencies.values())
+    total_errors = sum(recorder.errors.values())
+    kodi_rpcs = after.get("rpc.total", 0) - before.get("rpc.total", 0)
+    kodi_failed = after.get("rpc.failed", 0) - before.get("rpc.failed", 0)
+    return {
+        "clients": clients,
+        "duration_s": round(elapsed, 1),
+        "requests": total_requests,
+        "request_rate_rps": round(total_requests / elapsed, 2),
+        "error_rate": round(total_errors / total_requests, 4) if total_requests else 0,
+        "reloads": recorder.reloads,
+        "swaps": recorder.swaps,
+        "kodi_rpc_rate_rps": round(kodi_rpcs / elapsed, 2),
+        "kodi_rpc_error_rate": round(kodi_failed / kodi_rpcs, 4) if kodi_rpcs else 0,
+        "kodi_image_requests": after.get("image.requests", 0) - before.get("image.requests", 0),
+        "routes": routes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", default="1,5,10,25", help="Comma separated client counts, one step each")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per step")
+    parser.add_argument("--app-url", help="Use an already running app instead of starting one")
+    parser.add_argument("--kodi-url", help="Fake Kodi to read RPC counters from when --app-url is given")
+    parser.add_argument("--no-media", action="store_true", help="Skip /media artwork fetches on page load")
+    parser.add_argument("--change-every", type=float, default=0, help="Start the next song every N seconds")
+    parser.add_argument("--stop-every", type=float, default=0, help="Toggle stop/play every N seconds")
+    parser.add_argument("--output", help="Write results as JSON")
+    fake_kodi.add_arguments(parser)
+    args = parser.parse_args()
+    steps = [int(c) for c in args.clients.split(",") if c.strip()]
+
+    kodi = kodi_server = app = None
+    if args.app_url:
+        app_url, kodi_url = args.app_url.rstrip("/"), args.kodi_url
+    else:
+        kodi = fake_kodi.from_arguments(args)
+        kodi.play("song", 1)
+        kodi_server = fake_kodi.ServerThread(kodi.app)
+        kodi_server.start()
+        app = AppProcess(kodi_server.url).start()
+        app_url, kodi_url = app.url, kodi_server.url
+
+    results = []
+    try:
+        print(f"{'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'kodi rpc/s':>10} "
+              f"{'reloads':>7} {'swaps':>6}")
+        for clients in steps:
+            step = run_step(app_url, kodi_url, clients, args.duration, not args.no_media,
+                            kodi, args.change_every, args.stop_every)
+            results.append(step)
+            samples = [r for route, r in step["routes"].items() if route not in ("/media", LONG_POLL_ROUTE)]
+            p50 = max((r["p50_ms"] for r in samples), default=0)
+            p99 = max((r["p99_ms"] for r in samples), default=0)
+            print(f"{clients:>7} {step['request_rate_rps']:>8} {p50:>8} {p99:>8} {step['error_rate']:>7} "
+                  f"{step['kodi_rpc_rate_rps']:>10} {step['reloads']:>7} {step['swaps']:>6}", flush=True)
+    finally:
+        if app:
+            app.stop()
+        if kodi_server:
+            kodi_server.shutdown()
+
+    if args.output:
+        save_json(args.output, {
+            "meta": {
+                "revision": git_revision(),
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                "config": {k: v for k, v in vars(args).items() if k != "output"},
+            },
+            "steps": results,
+        })
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
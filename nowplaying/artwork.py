@@ -0,0 +1,827 @@
+"""
+Artwork handling for Kodi Now Playing application.
+Resolves Kodi art paths to download URLs and stores the images locally for the /media route.
+Files are named after the host and art path and indexed in the store, so they are downloaded once.
+"""
+import contextvars
+import hashlib
+import os
+import re
+import threading
+import time
+import urllib.parse
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import log
+import metrics
+import placeholders
+import store
+import tracing
+from cache import TTLCache
+
+ART_TYPES = ["poster", "fanart", "clearlogo", "clearart", "discart", "cdart", "banner", "season.poster", "thumbnail"]
+# Most background slides offered per item
+EXTRA_FANART_LIMIT = 20
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+# Numbered fanart art keys (fanart1, tvshow.fanart2, artist.fanart3 ...)
+_NUMBERED_FANART = re.compile(r"^(?:(?:tvshow|artist|albumartist)\.)?fanart(\d+)$")
+# Art types of one item are downloaded in parallel
+ART_WORKERS = int(os.getenv("ART_WORKERS", "4"))
+# Longest a /media request waits for a download that is still running
+ART_WAIT_TIMEOUT = 20
+# How Kodi art paths become URLs: "image" asks Kodi's /image/ endpoint directly, "prepare" spends a
+# Files.PrepareDownload call per image, "auto" uses /image/ where the Kodi version has it
+ART_RESOLVER = os.getenv("ART_RESOLVER", "auto").lower()
+# JSON-RPC API version of Kodi 12, the first web server with /image/
+IMAGE_ENDPOINT_VERSION = (6, 0, 0)
+# Download Kodi's resized thumbnail cache copy of an image when it is large enough for the display
+ART_TEXTURES = os.getenv("ART_TEXTURES", "1").lower() in ("1", "true", "yes", "on")
+# Width of the screens showing the page; art types need a share of it (posters are far narrower)
+DISPLAY_WIDTH = int(os.getenv("DISPLAY_WIDTH", "1920"))
+_DISPLAY_SHARE = {"fanart": 1.0, "extrafanart": 1.0, "banner": 0.5, "clearlogo": 0.4, "clearart": 0.4}
+_DEFAULT_DISPLAY_SHARE = 0.35
+# Stored artwork older than this is checked against Kodi in the background (0 never checks)
+REVALIDATE_AFTER = float(os.getenv("ART_REVALIDATE_HOURS", "24")) * 3600
+# Most of those checks started per minute, so a page full of old art does not flood Kodi
+REVALIDATE_PER_MINUTE = int(os.getenv("ART_REVALIDATE_RATE", "30"))
+
+_pool = ThreadPoolExecutor(max_workers=ART_WORKERS, thread_name_prefix="artwork")
+# File name to Future of downloads that are still running
+_pending = {}
+_pending_lock = threading.Lock()
+# Host name to the resolver that turned out to work for it ("image" or "prepare")
+_resolvers = {}
+# Cached textures by (host name, Kodi path), and hosts without Textures.GetTextures
+_textures = TTLCache("textures", maxsize=512, ttl=600)
+_no_textures = set()
+# File names being revalidated, and the token bucket limiting how many start
+_revalidating = set()
+_revalidate_tokens = [float(REVALIDATE_PER_MINUTE), time.monotonic()]
+
+
+def art_sources(item):
+    """
+    Find the artwork paths of an item, merging TV show and album/artist art into the plain types.
+
+    Args:
+        item (dict): Media item from Kodi API
+
+    Returns:
+        dict: Art type to raw Kodi art path, in ART_TYPES order
+    """
+    art_map = dict(item.get("art", {}))
+    if item.get("thumbnail") and not art_map.get("poster"):
+        art_map["poster"] = item["thumbnail"]
+
+    # Handle TV show artwork with tvshow. prefix
+    tvshow_art_map = {}
+    for key, value in art_map.items():
+        if key.startswith("tvshow."):
+            # Map tvshow.poster to poster, tvshow.fanart to fanart, etc.
+            clean_key = key.replace("tvshow.", "")
+            tvshow_art_map[clean_key] = value
+
+    # Handle music artwork with album., artist., and albumartist. prefixes
+    music_art_map = {}
+    for key, value in art_map.items():
+        if key.startswith("album."):
+            # Map album.thumb to thumbnail, album.poster to poster, etc.
+            clean_key = key.replace("album.", "")
+            if clean_key == "thumb":
+                clean_key = "thumbnail"
+            music_art_map[clean_key] = value
+        elif key.startswith("artist."):
+            # Map artist.fanart to fanart, artist.clearlogo to clearlogo, etc.
+            clean_key = key.replace("artist.", "")
+            music_art_map[clean_key] = value
+        elif key.startswith("albumartist."):
+            # Map albumartist.fanart to fanart, albumartist.clearlogo to clearlogo, etc.
+            clean_key = key.replace("albumartist.", "")
+            music_art_map[clean_key] = value
+
+    # Merge all artwork (music takes precedence, then TV show, then regular)
+    art_map = {**art_map, **tvshow_art_map, **music_art_map}
+    
+    # Debug logging for artwork
+    log.debug("Original art_map keys", keys=list(item.get("art", {}).keys()))
+    log.debug("Final art_map keys", keys=list(art_map.keys()))
+
+    return {art_type: art_map[art_type] for art_type in ART_TYPES if art_map.get(art_type)}
+
+
+# Art types that are looked up in the folders above the playing file when Kodi has no path for them
+FALLBACK_ART_TYPES = ["fanart", "clearlogo", "clearart", "banner"]
+# Preferred file extensions of artwork found next to the media, best first
+FALLBACK_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+# Folders above the playing file that are listed, and how long a listing is reused
+FALLBACK_LEVELS = 8
+LISTING_TTL = 600
+
+_LOCAL_PATH = re.compile(r"^(?:/|[A-Za-z]:\\)")
+# Folder listings by (host name, folder): lower-case file name to Kodi path
+_listings = TTLCache("art_listings", maxsize=256, ttl=LISTING_TTL)
+
+
+def _extrafanart_folders(item):
+    """Folders that may hold an extrafanart folder: the movie folder, or show/artist folder first."""
+    current_file = item.get("file", "")
+    if not current_file or current_file.startswith(("stack://", "plugin://", "http://", "https://")):
+        return []
+    folder = os.path.dirname(current_file)
+    if item.get("type") in ("episode", "song"):
+        # Season and album folders sit inside the show and artist folders
+        return [os.path.dirname(folder), folder]
+    return [folder]
+
+
+def extra_fanart(host, item):
+    """
+    Find the additional fanart of an item for the background slideshow.
+
+    Numbered fanart art keys come first, then the images in the extrafanart folder next to
+    the media. Folder listings are cached like library lookups.
+
+    Args:
+        host (KodiHost): Kodi the item is playing on
+        item (dict): Media item from Kodi API
+
+    Returns:
+        list: Raw Kodi art paths, without the main fanart
+    """
+    numbered = []
+    for key, value in item.get("art", {}).items():
+        match = _NUMBERED_FANART.match(key)
+        if match and value:
+            numbered.append((int(match.group(1)), value))
+    paths = [value for _, value in sorted(numbered)]
+
+    for folder in _extrafanart_folders(item):
+        try:
+            response = host.rpc_cached("Files.GetDirectory", {"directory": f"{folder}/extrafanart/", "media": "files"})
+        except Exception as e:
+            log.debug("Could not list extrafanart folder", folder=folder, error=e)
+            continue
+        files = ((response or {}).get("result") or {}).get("files") or []
+        images = sorted(entry["file"] for entry in files
+                        if entry.get("filetype") == "file" and entry.get("file", "").lower().endswith(IMAGE_EXTENSIONS))
+        if images:
+            paths.extend(images)
+            break
+
+    unique = list(dict.fromkeys(paths))
+    return unique[:EXTRA_FANART_LIMIT]
+
+
+def _unwrap(raw_path):
+    """Plain Kodi path of an image:// art path."""
+    if raw_path.startswith("image://"):
+        raw_path = urllib.parse.unquote(raw_path[len("image://"):])
+    if raw_path.endswith("/"):
+        raw_path = raw_path[:-1]
+    return raw_path
+
+
+def _uses_image_endpoint(host):
+    """Whether art of this Kodi is fetched through /image/ rather than Files.PrepareDownload."""
+    if ART_RESOLVER != "auto":
+        return ART_RESOLVER == "image"
+    resolver = _resolvers.get(host.name)
+    if resolver:
+        return resolver == "image"
+    # While the version is unknown, Files.PrepareDownload works with any Kodi
+    version = host.known_version()
+    return bool(version) and version >= IMAGE_ENDPOINT_VERSION
+
+
+def _is_image_endpoint(host, url):
+    return url.startswith(f"{host.url}/image/")
+
+
+def _kodi_url(host, path):
+    """
+    URL on the Kodi web server for a plain Kodi path.
+
+    Kodi serves image:// URLs at /image/ from its texture cache, so no RPC is needed; older
+    versions and hosts where that failed get a Files.PrepareDownload token instead.
+    """
+    if _uses_image_endpoint(host):
+        image_uri = f"image://{urllib.parse.quote(path, safe='')}/"
+        return f"{host.url}/image/{urllib.parse.quote(image_uri, safe='')}"
+    return _prepare_download(host, path)
+
+
+def needed_width(art_type):
+    """Width in pixels an art type is shown at, at most, on a DISPLAY_WIDTH screen."""
+    return round(DISPLAY_WIDTH * _DISPLAY_SHARE.get(art_type, _DEFAULT_DISPLAY_SHARE))
+
+
+def prefetch_textures(host, raw_paths):
+    """
+    Look up Kodi's thumbnail cache entries of several art paths with one Textures.GetTextures call.
+
+    Args:
+        host (KodiHost): Kodi the art belongs to
+        raw_paths (list): Kodi art paths, image:// or plain
+    """
+    if not ART_TEXTURES or host.name in _no_textures:
+        return
+    paths = [path for path in dict.fromkeys(_unwrap(raw_path) for raw_path in raw_paths)
+             if _textures.get((host.name, path)) is None]
+    if not paths:
+        return
+    rules = [{"field": "url", "operator": "is", "value": path} for path in paths]
+    response = host.rpc("Textures.GetTextures", {
+        "properties": ["url", "cachedurl", "sizes", "imagehash"],
+        "filter": rules[0] if len(rules) == 1 else {"or": rules},
+    })
+    if response is None:
+        return
+    if "error" in response:
+        # Kodi before version 13 has no Textures namespace
+        log.info("Kodi has no texture lookup, downloading original artwork", host=host.name, error=response["error"])
+        _no_textures.add(host.name)
+        return
+    found = {}
+    for texture in (response.get("result") or {}).get("textures") or []:
+        found.setdefault(texture.get("url"), []).append(texture)
+    for path in paths:
+        # Images Kodi has not cached are remembered as well, so they are not asked for again
+        _textures.set((host.name, path), found.get(path, []))
+
+
+def _texture_url(host, art_type, path):
+    """URL of the smallest cached copy of a plain Kodi path that is wide enough, or None."""
+    if not ART_TEXTURES or host.name in _no_textures:
+        return None
+    textures = _textures.get((host.name, path))
+    if textures is None:
+        prefetch_textures(host, [path])
+        textures = _textures.get((host.name, path))
+    width = needed_width(art_type)
+    fitting = [(size.get("width", 0), texture["cachedurl"]) for texture in textures or [] if texture.get("cachedurl")
+               for size in texture.get("sizes") or [] if size.get("width", 0) >= width]
+    if not fitting:
+        return None
+    _, cached = min(fitting)
+    log.debug("Using cached texture", art_type=art_type, path=path, cached=cached)
+    thumbnail = f"special://thumbnails/{cached}"
+    if _uses_image_endpoint(host):
+        # /vfs/ sends the cached file as it is; through /image/ Kodi would cache it again as a texture of its own
+        return f"{host.url}/vfs/{urllib.parse.quote(thumbnail, safe='')}"
+    return _prepare_download(host, thumbnail)
+
+
+def _texture_hash(host, raw_path):
+    """Hash Kodi's thumbnail cache keeps of an original image, if it was looked up."""
+    for texture in _textures.get((host.name, _unwrap(raw_path))) or []:
+        if texture.get("imagehash"):
+            return texture["imagehash"]
+    return None
+
+
+def _prepare_download(host, path):
+    """Turn a Kodi path into a URL on the Kodi web server, or None if Kodi has no download for it."""
+    response = host.rpc("Files.PrepareDownload", {"path": path})
+    details = response.get("result", {}).get("details", {})
+    token = details.get("token")
+    if token:
+        return f"{host.url}/vfs/{token}/{urllib.parse.quote(os.path.basename(path))}"
+    if details.get("path"):
+        return f"{host.url}/{details['path']}"
+    return None
+
+
+def _parent(path):
+    """Folder containing a Kodi path, or None at the top of a share or drive."""
+    path = path.rstrip("/\\")
+    cut = max(path.rfind("/"), path.rfind("\\"))
+    parent = path[:cut]
+    # Stops below the server of nfs:// and smb:// paths, the root and a drive letter
+    scheme, separator, rest = parent.partition("://")
+    if cut <= 0 or parent.endswith(":") or (separator and "/" not in rest):
+        return None
+    return parent
+
+
+def _ancestor_folders(item):
+    """Folders above the playing file that may hold artwork, nearest first."""
+    current_file = item.get("file", "")
+    if not current_file.startswith(("nfs://", "smb://")) and not _LOCAL_PATH.match(current_file):
+        return []
+    folders = []
+    folder = _parent(current_file)
+    while folder and len(folders) < FALLBACK_LEVELS:
+        # Library roots hold every show or artist; listing them would be slow and finds nothing
+        name = re.split(r"[/\\]", folder)[-1]
+        if not any(x in name.upper() for x in ['MEDIA', 'MUSIC', 'VIDEO', 'TV', 'MOVIES']):
+            folders.append(folder)
+        folder = _parent(folder)
+    return folders
+
+
+def _list_folder(host, folder):
+    """
+    Files directly inside a folder, from one Files.GetDirectory call per folder and LISTING_TTL.
+
+    Returns:
+        dict: Lower-case file name to Kodi path; empty if the folder cannot be listed
+    """
+    key = (host.name, folder)
+    files = _listings.get(key)
+    if files is not None:
+        return files
+    separator = "\\" if "\\" in folder and "/" not in folder else "/"
+    try:
+        response = host.rpc("Files.GetDirectory", {"directory": folder + separator, "media": "files"})
+        entries = ((response or {}).get("result") or {}).get("files") or []
+    except Exception as e:
+        log.debug("Could not list folder", folder=folder, error=e)
+        entries = []
+    files = {}
+    for entry in entries:
+        path = entry.get("file", "")
+        if entry.get("filetype") == "file" and path:
+            files[re.split(r"[/\\]", path)[-1].lower()] = path
+    # Missing folders are remembered too, so they are not asked for again
+    _listings.set(key, files)
+    return files
+
+
+def _fallback_paths(host, item, art_type):
+    """
+    Kodi paths of files named after the art type in the folders above the playing file, nearest first.
+
+    Artist fanart and logos are often only stored in the artist directory, which the
+    album art does not point to. Each folder is listed once and searched locally.
+    """
+    fallback_paths = []
+    for folder in _ancestor_folders(item):
+        files = _list_folder(host, folder)
+        for extension in FALLBACK_EXTENSIONS:
+            path = files.get(f"{art_type}{extension}")
+            if path:
+                log.debug("Found artwork next to the media", art_type=art_type, path=path)
+                fallback_paths.append(path)
+                break
+    return fallback_paths
+
+
+def resolve_art(host, item, art_type, raw_path):
+    """
+    Resolve one piece of artwork to a URL it can be downloaded from.
+
+    Args:
+        host (KodiHost): Kodi the item is playing on
+        item (dict): Media item from Kodi API
+        art_type (str): Art type, e.g. "poster"
+        raw_path (str): Kodi art path from art_sources()
+
+    Returns:
+        str: Kodi web server or external URL, or None if nothing was found
+    """
+    resolve_start = time.perf_counter()
+    raw_path = _unwrap(raw_path)
+
+    # Kodi's resized copy is smaller than the original, also for art it fetched from the web
+    try:
+        texture_url = _texture_url(host, art_type, raw_path)
+    except Exception as e:
+        log.debug("Cached texture lookup failed", art_type=art_type, error=e)
+        texture_url = None
+    if texture_url:
+        image_url = texture_url
+    # Handle external URLs directly (like fanart.tv, theaudiodb.com)
+    elif raw_path.startswith("https://") or raw_path.startswith("http://"):
+        image_url = raw_path
+    else:
+        # Handle local Kodi paths
+        image_url = None
+        try:
+            image_url = _kodi_url(host, raw_path)
+            if not image_url:
+                log.error("No valid download path", art_type=art_type)
+        except Exception as e:
+            log.warning("Failed to prepare download", art_type=art_type, error=e)
+
+        # If primary path failed, try fallback paths for artist artwork
+        if not image_url and art_type in FALLBACK_ART_TYPES:
+            fallback_start = time.perf_counter()
+            log.debug("Primary path failed, trying fallback paths", art_type=art_type)
+            for fallback_path in _fallback_paths(host, item, art_type):
+                try:
+                    log.debug("Trying fallback path", path=fallback_path)
+                    image_url = _kodi_url(host, fallback_path)
+                except Exception as e:
+                    log.debug("Fallback path failed", art_type=art_type, error=e)
+                    continue
+                if image_url:
+                    log.debug("Found fallback path", art_type=art_type, url=image_url)
+                    break
+            tracing.record("art.fallback", fallback_start)
+
+        if not image_url:
+            metrics.ARTWORK_RESOLVE_SECONDS.observe(time.perf_counter() - resolve_start, art_type=art_type, outcome="error")
+            tracing.record(f"art.{art_type}.resolve", resolve_start)
+            log.error("No valid download path found", art_type=art_type)
+            return None
+    metrics.ARTWORK_RESOLVE_SECONDS.observe(time.perf_counter() - resolve_start, art_type=art_type, outcome="ok")
+    tracing.record(f"art.{art_type}.resolve", resolve_start)
+    return image_url
+
+
+def fetch_art(host, raw_path, image_url, **kwargs):
+    """
+    GET an artwork URL from resolve_art().
+
+    A failed cached texture (Kodi cleans up its thumbnail cache) is replaced by the original.
+    A failed /image/ request is repeated through Files.PrepareDownload. If that works, the
+    host keeps using PrepareDownload, e.g. when a proxy in front of Kodi does not pass /image/.
+
+    Args:
+        host (KodiHost): Kodi the art belongs to
+        raw_path (str): Kodi art path the URL was resolved from
+        image_url (str): URL from resolve_art()
+        **kwargs: Passed on to the download, e.g. stream=True
+
+    Returns:
+        requests.Response: The response, successful or not
+    """
+    r = host.download(image_url, **kwargs)
+    if r.ok:
+        if _is_image_endpoint(host, image_url):
+            _resolvers.setdefault(host.name, "image")
+        return r
+    path = _unwrap(raw_path)
+    if _textures.pop((host.name, path)):
+        original_url = path if path.startswith(("http://", "https://")) else _kodi_url(host, path)
+        if original_url and original_url != image_url:
+            r.close()
+            log.debug("Cached texture failed, downloading the original", path=path)
+            return fetch_art(host, raw_path, original_url, **kwargs)
+    if not _is_image_endpoint(host, image_url):
+        return r
+    r.close()
+    prepared_url = _prepare_download(host, path)
+    if not prepared_url:
+        return r
+    retry = host.download(prepared_url, **kwargs)
+    if retry.ok and ART_RESOLVER == "auto" and _resolvers.get(host.name) != "prepare":
+        log.info("Kodi /image/ endpoint failed, using Files.PrepareDownload", host=host.name, status=r.status_code)
+        _resolvers[host.name] = "prepare"
+    return retry
+
+
+def fetch_fallback(host, item, art_type):
+    """
+    Download artwork from the folders above the playing file.
+
+    Used when Kodi resolved a path but refused the download (401), which happens for
+    artist art stored outside the sources Kodi serves.
+
+    Returns:
+        requests.Response: First successful download, or None
+    """
+    if art_type not in FALLBACK_ART_TYPES:
+        return None
+    log.debug("Download failed with 401, trying fallback paths", art_type=art_type)
+    for fallback_path in _fallback_paths(host, item, art_type):
+        try:
+            log.debug("Trying fallback path", path=fallback_path)
+            fallback_image_url = _kodi_url(host, fallback_path)
+            if not fallback_image_url:
+                continue
+            # Try to download the fallback image
+            log.debug("Trying to download fallback", url=fallback_image_url)
+            r = fetch_art(host, fallback_path, fallback_image_url)
+            r.raise_for_status()
+            return r
+        except Exception as fallback_e:
+            log.debug("Fallback path failed", art_type=art_type, error=fallback_e)
+    return None
+
+
+def file_name(host_name, raw_path):
+    """Local file name of a Kodi art path; the same path always maps to the same file."""
+    digest = hashlib.sha1(f"{host_name}\0{raw_path}".encode()).hexdigest()[:24]
+    return f"art_{digest}.jpg"
+
+
+def _write(path, data=None, link_to=None):
+    """Write a file aside and rename it into place, so /media never serves a half-written file."""
+    # store.reclaim() removes what a crash leaves of these after the restart
+    partial_path = f"{path}.{threading.get_ident()}.part"
+    try:
+        if link_to is None:
+            with open(partial_path, "wb") as f:
+                f.write(data)
+        else:
+            os.link(link_to, partial_path)
+        os.replace(partial_path, path)
+    except OSError:
+        try:
+            os.remove(partial_path)
+        except OSError:
+            pass
+        raise
+
+
+def _save(host, raw_path, art_type, filename, response):
+    """
+    Store a downloaded image, index it with its validators and make its placeholder.
+
+    The content is kept once per hash as a blob; the art path's own file is a hard link to it,
+    so the same image under several art paths (album.thumb and thumbnail, artist and
+    albumartist fanart, shared compilation art) takes its space once.
+    """
+    data = response.content
+    digest = hashlib.sha256(data).hexdigest()
+    local_path = store.art_path(filename)
+    blob_path = store.art_path(store.blob_name(digest))
+    if os.path.exists(blob_path):
+        metrics.cache_hit("art_blobs")
+    else:
+        metrics.cache_miss("art_blobs")
+        _write(blob_path, data)
+    try:
+        _write(local_path, link_to=blob_path)
+    except OSError as e:
+        # Filesystems without hard links get a copy
+        log.debug("Could not link artwork, copying it", path=local_path, error=e)
+        _write(local_path, data)
+    placeholder = placeholders.remember(host.name, raw_path, art_type, data)
+    store.record_art(host.name, raw_path, filename, len(data), digest,
+                     etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"),
+                     texture=_texture_hash(host, raw_path), placeholder=placeholder)
+    return local_path
+
+
+def download_art(host, item, art_type, raw_path, textures=None):
+    """
+    Resolve one piece of artwork to a download URL and store it under ART_DIR.
+
+    Args:
+        host (KodiHost): Kodi the item is playing on
+        item (dict): Media item from Kodi API
+        art_type (str): Art type, e.g. "poster"
+        raw_path (str): Kodi art path from art_sources()
+        textures (Future): Running prefetch_textures() of the item, waited for before resolving
+
+    Returns:
+        str: Downloaded file name under ART_DIR, or None if it failed
+    """
+    log.debug("Processing art type", art_type=art_type, raw_path=raw_path)
+    if textures is not None:
+        try:
+            textures.result(timeout=ART_WAIT_TIMEOUT)
+        except Exception as e:
+            log.debug("Cached texture lookup failed", error=e)
+    image_url = resolve_art(host, item, art_type, raw_path)
+    if not image_url:
+        return None
+
+    filename = file_name(host.name, raw_path)
+
+    download_start = time.perf_counter()
+    try:
+        log.debug("Downloading artwork", url=image_url)
+        r = fetch_art(host, raw_path, image_url)
+        r.raise_for_status()
+        local_path = _save(host, raw_path, art_type, filename, r)
+        metrics.ARTWORK_DOWNLOAD_SECONDS.observe(time.perf_counter() - download_start, art_type=art_type, outcome="ok")
+        metrics.ARTWORK_DOWNLOAD_BYTES.observe(len(r.content), art_type=art_type)
+        tracing.record(f"art.{art_type}.download", download_start)
+        log.info("Downloaded artwork", art_type=art_type, path=local_path)
+        return filename
+    except Exception as e:
+        metrics.ARTWORK_DOWNLOAD_SECONDS.observe(time.perf_counter() - download_start, art_type=art_type, outcome="error")
+        tracing.record(f"art.{art_type}.download", download_start)
+        log.error("Failed to download artwork", art_type=art_type, error=e)
+        if "401" not in str(e):
+            return None
+
+    # If download failed with 401, try fallback paths for artist artwork
+    r = fetch_fallback(host, item, art_type)
+    if r is None:
+        return None
+    local_path = _save(host, raw_path, art_type, filename, r)
+    log.info("Downloaded artwork from fallback path", art_type=art_type, path=local_path)
+    return filename
+
+
+def _take_revalidation_slot():
+    """Take a token from the revalidation bucket, refilled at REVALIDATE_PER_MINUTE."""
+    with _pending_lock:
+        tokens, last = _revalidate_tokens
+        now = time.monotonic()
+        tokens = min(float(REVALIDATE_PER_MINUTE), tokens + (now - last) * REVALIDATE_PER_MINUTE / 60)
+        taken = tokens >= 1
+        _revalidate_tokens[:] = [tokens - 1 if taken else tokens, now]
+    return taken
+
+
+def revalidate_art(host, item, art_type, raw_path, entry):
+    """
+    Check a stored artwork file against Kodi and replace it if it changed.
+
+    Kodi's texture hash settles it without a download when it is known. Otherwise the image is
+    requested with the stored ETag and Last-Modified, so an unchanged file costs a 304; without
+    either, the download is compared with the stored content hash.
+
+    Args:
+        host (KodiHost): Kodi the item is playing on
+        item (dict): Media item from Kodi API
+        art_type (str): Art type, e.g. "poster"
+        raw_path (str): Kodi art path from art_sources()
+        entry (dict): Index row from store.art_entry()
+
+    Returns:
+        str: "unchanged", "changed" or "error"
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        if entry["texture"]:
+            prefetch_textures(host, [raw_path])
+            if _texture_hash(host, raw_path) == entry["texture"]:
+                store.mark_validated(host.name, raw_path)
+                outcome = "unchanged"
+                return outcome
+        image_url = resolve_art(host, item, art_type, raw_path)
+        if not image_url:
+            return outcome
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        r = fetch_art(host, raw_path, image_url, headers=headers)
+        if r.status_code == 304:
+            store.mark_validated(host.name, raw_path)
+            outcome = "unchanged"
+            return outcome
+        r.raise_for_status()
+        if hashlib.sha256(r.content).hexdigest() == entry["hash"]:
+            # Same image; keep the validators it came with for the next check
+            store.record_art(host.name, raw_path, entry["file"], entry["size"], entry["hash"],
+                             etag=r.headers.get("ETag"), last_modified=r.headers.get("Last-Modified"),
+                             texture=_texture_hash(host, raw_path), placeholder=entry["placeholder"])
+            outcome = "unchanged"
+            return outcome
+        placeholders.forget(host.name, raw_path)
+        _save(host, raw_path, art_type, entry["file"], r)
+        log.info("Stored artwork changed in Kodi, replaced it", art_type=art_type, path=raw_path)
+        outcome = "changed"
+        return outcome
+    except Exception as e:
+        log.warning("Artwork revalidation failed", art_type=art_type, error=e)
+        return outcome
+    finally:
+        metrics.ARTWORK_REVALIDATIONS.inc(outcome=outcome)
+        tracing.record(f"art.{art_type}.revalidate", start)
+
+
+def _revalidation_due(entry):
+    """Whether stored artwork should be checked now; takes a rate limit slot if so."""
+    if not REVALIDATE_AFTER or time.time() - entry["validated"] < REVALIDATE_AFTER:
+        return False
+    with _pending_lock:
+        if entry["file"] in _revalidating:
+            return False
+    if not _take_revalidation_slot():
+        # Checked again the next time the art is shown
+        metrics.ARTWORK_REVALIDATIONS.inc(outcome="deferred")
+        return False
+    with _pending_lock:
+        _revalidating.add(entry["file"])
+    return True
+
+
+def _revalidate_item(host, item, due):
+    """Revalidate the due art of one item one after another, with one texture lookup for all."""
+    try:
+        if ART_TEXTURES:
+            prefetch_textures(host, [raw_path for raw_path, _ in due.values()])
+        for art_type, (raw_path, entry) in due.items():
+            revalidate_art(host, item, art_type, raw_path, entry)
+    finally:
+        with _pending_lock:
+            _revalidating.difference_update(entry["file"] for _, entry in due.values())
+
+
+def _forget(filename, future):
+    with _pending_lock:
+        if _pending.get(filename) is future:
+            del _pending[filename]
+
+
+def _run_download(future, func, *args):
+    """Run a download queued for a Future that was registered in _pending before it was queued."""
+    try:
+        future.set_result(func(*args))
+    except Exception as e:
+        future.set_exception(e)
+
+
+def start_downloads(host, item, art_types=None):
+    """
+    Start downloading the artwork of an item that is not stored locally yet.
+
+    Art downloaded before is answered from the store without waiting for Kodi (it is revalidated
+    in the background once it is REVALIDATE_AFTER old), and art another request is already
+    downloading is shared with it.
+
+    Args:
+        host (KodiHost): Kodi the item is playing on
+        item (dict): Media item from Kodi API
+        art_types (tuple): Only these art types, e.g. the poster of a tile; all by default
+
+    Returns:
+        dict: Art type to Future of the file name under ART_DIR (None if it failed); stored
+        art is finished already and names its blob, see planned_file()
+    """
+    futures = {}
+    missing = {}
+    due = {}
+    for art_type, raw_path in art_sources(item).items():
+        if art_types is not None and art_type not in art_types:
+            continue
+        filename = file_name(host.name, raw_path)
+        with _pending_lock:
+            future = _pending.get(filename)
+        entry = store.art_entry(host.name, raw_path) if future is None else None
+        if entry is not None and entry["file"] == filename:
+            if _revalidation_due(entry):
+                due[art_type] = (raw_path, entry)
+            # Pages link the shared blob, so browsers also fetch identical images once
+            blob = store.blob_name(entry["hash"])
+            future = Future()
+            future.set_result(blob if os.path.exists(store.art_path(blob)) else filename)
+        if future is None:
+            with _pending_lock:
+                # Registered under the same lock as the check, so a concurrent request shares this download
+                future = _pending.get(filename)
+                if future is None:
+                    future = _pending[filename] = Future()
+                    missing[art_type] = (raw_path, future)
+        futures[art_type] = future
+    # Keep the request's trace so art spans still land in it
+    context = contextvars.copy_context()
+    if due:
+        _pool.submit(context.copy().run, _revalidate_item, host, item, due)
+    if not missing:
+        return futures
+
+    # One texture lookup for the whole item; it is queued first, so no download waits on a queued task
+    textures = _pool.submit(context.copy().run, prefetch_textures, host,
+                            [raw_path for raw_path, _ in missing.values()]) if ART_TEXTURES else None
+    for art_type, (raw_path, future) in missing.items():
+        future.add_done_callback(lambda done, name=file_name(host.name, raw_path): _forget(name, done))
+        _pool.submit(context.copy().run, _run_download, future, download_art, host, item, art_type, raw_path, textures)
+    return futures
+
+
+def planned_file(host_name, raw_path, future):
+    """File name a page links for a download from start_downloads() before it has finished."""
+    if future.done() and not future.exception() and future.result():
+        return future.result()
+    return file_name(host_name, raw_path)
+
+
+def wait_for(filename, timeout=ART_WAIT_TIMEOUT):
+    """
+    Wait for a running download of a /media file.
+
+    Returns:
+        bool: Whether the file exists now
+    """
+    with _pending_lock:
+        future = _pending.get(filename)
+    if future is not None:
+        try:
+            future.result(timeout=timeout)
+        except Exception:
+            pass
+    return os.path.exists(store.art_path(filename))
+
+
+def prepare_and_download_art(host, item):
+    """
+    Resolve and download the artwork of the playing item to local files.
+
+    Args:
+        host (KodiHost): Kodi the item is playing on
+        item (dict): Media item from Kodi API
+
+    Returns:
+        dict: Art type to downloaded file name under ART_DIR
+    """
+    downloaded = {}
+    for art_type, future in start_downloads(host, item).items():
+        try:
+            filename = future.result()
+        except Exception as e:
+            log.error("Artwork download crashed", art_type=art_type, error=e)
+            continue
+        if filename:
+            downloaded[art_type] = filename
+    return downloaded
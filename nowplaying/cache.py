@@ -0,0 +1,93 @@
+"""
+In-memory caches for Kodi Now Playing application.
+A small thread-safe LRU cache with optional time-to-live that reports hits and misses to /metrics.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded least-recently-used cache whose entries optionally expire.
+
+    Args:
+        name (str): Cache name used as the metrics label
+        maxsize (int): Maximum number of entries kept
+        ttl (float): Seconds an entry stays valid, None for no expiry
+    """
+
+    def __init__(self, name, maxsize=128, ttl=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires = entry
+                if expires is None or expires > now:
+                    self._data.move_to_end(key)
+                    metrics.cache_hit(self.name)
+                    return value
+                del self._data[key]
+        metrics.cache_miss(self.name)
+        return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class SizedCache(TTLCache):
+    """
+    TTLCache that is also bounded by the total size of its values, for caching image bytes.
+
+    Args:
+        name (str): Cache name used as the metrics label
+        maxbytes (int): Total size of the values kept
+        maxsize (int): Maximum number of entries kept
+        ttl (float): Seconds an entry stays valid, None for no expiry
+        sizeof (callable): Size of a value in bytes
+    """
+
+    def __init__(self, name, maxbytes, maxsize=1024, ttl=None, sizeof=len):
+        super().__init__(name, maxsize=maxsize, ttl=ttl)
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+
+    def set(self, key, value, ttl=None):
+        if self.sizeof(value) > self.maxbytes:
+            return
+        super().set(key, value, ttl=ttl)
+        with self._lock:
+            total = sum(self.sizeof(entry[0]) for entry in self._data.values())
+            while total > self.maxbytes:
+                _, (evicted, _) = self._data.popitem(last=False)
+                total -= self.sizeof(evicted)
@@ -0,0 +1,508 @@
+"""
+Kodi host registry for Kodi Now Playing application.
+Each configured Kodi gets its own HTTP session, circuit breaker, caches and background playback poller.
+
+Hosts come from KODI_HOSTS (a JSON list) or KODI_HOSTS_FILE (path to a JSON file with the same list):
+    [{"name": "livingroom", "url": "http://192.168.1.20:8080", "user": "kodi", "pass": "secret", "label": "Living Room"}]
+Without either, a single host named "default" is built from KODI_HOST, KODI_USER and KODI_PASS.
+"""
+import json
+import os
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import library
+import log
+import metrics
+import store
+import tracing
+from cache import TTLCache
+
+POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "2"))
+# Pollers slow down to POLL_IDLE_INTERVAL when no client has asked about the host for POLL_IDLE_AFTER seconds
+POLL_IDLE_AFTER = float(os.getenv("POLL_IDLE_AFTER", "60"))
+POLL_IDLE_INTERVAL = float(os.getenv("POLL_IDLE_INTERVAL", "10"))
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "3"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "15"))
+DETAILS_TTL = float(os.getenv("DETAILS_TTL", "300"))
+# Elapsed time off from the expected position by more than this many seconds counts as a seek
+SEEK_TOLERANCE = 3
+# A stop has to last this many seconds before it is reported, so the gap between playlist items is not one
+STOP_CONFIRM = float(os.getenv("STOP_CONFIRM", "5"))
+RPC_TIMEOUT = 8
+# Seconds before a JSON-RPC version probe that got no answer is tried again
+VERSION_RETRY = 300
+DOWNLOAD_TIMEOUT = 5
+
+HEADERS = {"Content-Type": "application/json"}
+
+# Item properties the rooms overview shows, taken from the full item when the fingerprint changes
+SUMMARY_PROPERTIES = ["title", "showtitle", "artist", "album", "season", "episode"]
+
+_NAME = re.compile(r"^[a-z0-9][a-z0-9_-]*$")
+# Names taken by routes under /nowplaying/
+_RESERVED_NAMES = {"tile"}
+
+
+def to_secs(t):
+    return t.get("hours", 0) * 3600 + t.get("minutes", 0) * 60 + t.get("seconds", 0)
+
+
+class CircuitBreaker:
+    """
+    Stop calling a Kodi that keeps failing.
+
+    After `threshold` consecutive failures the breaker opens and calls fail fast for
+    `reset_timeout` seconds. Then one trial call is let through (half-open); its
+    outcome closes the breaker again or re-opens it.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+class KodiHost:
+    """
+    One Kodi device: JSON-RPC transport, circuit breaker, caches and playback poller.
+
+    Args:
+        name (str): URL-safe host name used in routes, e.g. "livingroom"
+        url (str): Kodi web server base URL, e.g. "http://192.168.1.20:8080"
+        user (str): Web server user name
+        password (str): Web server password
+        label (str): Display name for the rooms overview
+    """
+
+    def __init__(self, name, url, user=None, password=None, label=None):
+        self.name = name
+        self.url = url.rstrip("/")
+        self.label = label or name
+        self.auth = (user, password) if user else None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.breaker = CircuitBreaker()
+        self.details_cache = TTLCache("details", maxsize=64, ttl=DETAILS_TTL)
+        self._state = {"playing": None, "error": False, "status": "unknown", "transition": None,
+                       "updated": None, "version": 0}
+        self._state_lock = threading.Lock()
+        self._changed = threading.Condition(self._state_lock)
+        self.version = 0
+        # JSON-RPC API version as (major, minor, patch), once probe_version() got an answer
+        self.api_version = None
+        self._version_asked = None
+        self._poller = None
+        self._poller_lock = threading.Lock()
+        # Held by fresh playback() reads, so concurrent page loads share one poll
+        self._poll_lock = threading.Lock()
+        self._last_access = time.monotonic()
+        self._idle = False
+        self._wake = threading.Event()
+
+    # JSON-RPC
+
+    def rpc(self, method, params=None):
+        """
+        Call a Kodi JSON-RPC method.
+
+        Returns:
+            dict: The JSON-RPC response, or None if the call failed or the breaker is open
+        """
+        if not self.breaker.allow():
+            metrics.KODI_RPC_SECONDS.observe(0, host=self.name, method=method, outcome="breaker_open")
+            log.warning("Kodi circuit breaker open, skipping call", host=self.name, method=method)
+            return None
+        payload = {
+            "jsonrpc": "2.0",
+            "method": method,
+            "params": params or {},
+            "id": 1
+        }
+        start = time.perf_counter()
+        try:
+            r = self.session.post(f"{self.url}/jsonrpc", headers=HEADERS, json=payload, auth=self.auth, timeout=RPC_TIMEOUT)
+            r.raise_for_status()
+            response_json = r.json()
+            self.breaker.success()
+            outcome = "rpc_error" if "error" in response_json else "ok"
+            metrics.KODI_RPC_SECONDS.observe(time.perf_counter() - start, host=self.name, method=method, outcome=outcome)
+            tracing.record(f"rpc.{method}", start)
+            log.debug("Kodi response", host=self.name, method=method, response=response_json)
+            return response_json
+        except Exception as e:
+            self.breaker.failure()
+            metrics.KODI_RPC_SECONDS.observe(time.perf_counter() - start, host=self.name, method=method, outcome="error")
+            tracing.record(f"rpc.{method}", start)
+            log.error("Kodi RPC failed", host=self.name, method=method, error=e)
+            return None
+
+    def rpc_cached(self, method, params):
+        """
+        Like rpc(), but successful library lookups are reused for DETAILS_TTL seconds.
+
+        They are also kept in the persistent store, so they outlive a restart.
+        """
+        key = f"{method} {json.dumps(params, sort_keys=True)}"
+        response = self.details_cache.get(key)
+        if response is None:
+            response = store.load_details(self.name, key)
+            if response is not None:
+                self.details_cache.set(key, response)
+        if response is None:
+            response = self.rpc(method, params)
+            if response and response.get("result"):
+                self.details_cache.set(key, response)
+                store.save_details(self.name, key, response, DETAILS_TTL)
+        return response
+
+    def known_version(self):
+        """
+        JSON-RPC API version of this Kodi, probed at most once per VERSION_RETRY seconds while unknown.
+
+        Returns:
+            tuple: (major, minor, patch), or None while Kodi has not told
+        """
+        if self.api_version is None and (self._version_asked is None or
+                                         time.monotonic() - self._version_asked > VERSION_RETRY):
+            self.probe_version()
+        return self.api_version
+
+    def probe_version(self):
+        """Ask Kodi for its JSON-RPC API version (JSONRPC.Version) and remember it."""
+        self._version_asked = time.monotonic()
+        response = self.rpc("JSONRPC.Version")
+        version = ((response or {}).get("result") or {}).get("version")
+        if version:
+            self.api_version = (version.get("major", 0), version.get("minor", 0), version.get("patch", 0))
+        return self.api_version
+
+    def download(self, url, **kwargs):
+        """GET an image, sending credentials only to this Kodi's own web server."""
+        auth = self.auth if url.startswith(self.url) else None
+        return self.session.get(url, auth=auth, timeout=kwargs.pop("timeout", DOWNLOAD_TIMEOUT), **kwargs)
+
+    # Playback polling
+
+    def touch(self):
+        """Mark the host as watched so its poller runs at full rate."""
+        self._last_access = time.monotonic()
+        if self._poller is None:
+            self._start_poller()
+        elif self._idle:
+            self._wake.set()
+
+    def playback(self, inline=True, fresh=False):
+        """
+        Latest playback state from the poller.
+
+        Args:
+            inline (bool): Poll Kodi directly when the poller's state is missing or stale
+            fresh (bool): Poll Kodi unless a poll started after this call, for full page loads that
+                must show the current item rather than the one of the last poll
+
+        Returns:
+            dict: playing (bool, None if unknown), error, status, transition, playerid, elapsed, duration,
+            paused, item and version
+        """
+        self.touch()
+        if fresh:
+            asked = time.monotonic()
+            with self._poll_lock:
+                with self._state_lock:
+                    state = dict(self._state)
+                if state["updated"] is None or state["updated"] < asked:
+                    state = self.poll_once()
+            return state
+        with self._state_lock:
+            state = dict(self._state)
+        stale = state["updated"] is None or time.monotonic() - state["updated"] > POLL_INTERVAL * 3
+        if stale and inline:
+            state = self.poll_once()
+        elif state["updated"] is None:
+            state.update(elapsed=0, duration=0, paused=True, item={})
+        elif state.get("playing") and not state.get("paused"):
+            # Progress keeps moving between polls
+            drift = int(time.monotonic() - state["updated"])
+            state["elapsed"] = min(state["elapsed"] + drift, state["duration"] or state["elapsed"] + drift)
+        return state
+
+    def poll_once(self):
+        state = {"playing": None, "error": False, "playerid": None, "elapsed": 0, "duration": 0,
+                 "paused": True, "item": {}, "updated": time.monotonic()}
+        players = self.rpc("Player.GetActivePlayers")
+        if players is None or "result" not in players:
+            state["error"] = True
+        elif players["result"]:
+            player_id = players["result"][0]["playerid"]
+            state.update(playing=True, playerid=player_id)
+            progress_response = self.rpc("Player.GetProperties", {
+                "playerid": player_id,
+                "properties": ["time", "totaltime", "speed"]
+            })
+            progress = progress_response.get("result") if progress_response else None
+            if progress:
+                state.update(elapsed=to_secs(progress.get("time", {})),
+                             duration=to_secs(progress.get("totaltime", {})),
+                             paused=progress.get("speed", 0) == 0)
+            else:
+                # _settle() keeps the last known progress rather than a jump back to a paused 0
+                state["error"] = True
+                for key in ("elapsed", "duration", "paused"):
+                    del state[key]
+            item_response = self.rpc("Player.GetItem", {
+                "playerid": player_id,
+                "properties": library.FINGERPRINT_PROPERTIES
+            })
+            if item_response and item_response.get("result"):
+                state["item"] = self._summarize(player_id, item_response["result"].get("item", {}))
+            else:
+                # Likewise the last known item, so clients do not see it change twice
+                state["error"] = True
+                del state["item"]
+        else:
+            state["playing"] = False
+        with self._state_lock:
+            state = _settle(self._state, state)
+            transition = _transition(self._state, state)
+            if transition:
+                self.version += 1
+                self._changed.notify_all()
+                state["transition"] = transition
+                if transition in ("item", "playback"):
+                    metrics.PLAYBACK_TRANSITIONS.inc(host=self.name, kind=transition)
+            else:
+                state["transition"] = self._state.get("transition")
+            state["version"] = self.version
+            self._state = state
+        return dict(state)
+
+    def _summarize(self, player_id, seen):
+        """Item of a fingerprint poll with the overview's properties, fetched only when it changed."""
+        with self._state_lock:
+            previous = self._state
+        # Without a title the last fetch failed, so it is tried again
+        if previous.get("playerid") == player_id and "title" in (previous.get("item") or {}) and \
+                library.fingerprint(player_id, previous["item"]) == library.fingerprint(player_id, seen):
+            return previous["item"]
+        try:
+            item, _ = library.fetch_playing(self, player_id, seen)
+        except Exception as e:
+            log.warning("Failed to fetch the playing item", host=self.name, error=e)
+            return seen
+        return {**seen, **{name: item[name] for name in SUMMARY_PROPERTIES if name in item}}
+
+    def wait_for_change(self, version, timeout):
+        """
+        Block until the playback version differs from `version` or `timeout` seconds pass.
+
+        Returns:
+            int: The current playback version
+        """
+        self.touch()
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def _start_poller(self):
+        with self._poller_lock:
+            if self._poller is not None:
+                return
+            self._poller = threading.Thread(target=self._poll_loop, name=f"poller-{self.name}", daemon=True)
+            self._poller.start()
+
+    def _poll_loop(self):
+        while True:
+            try:
+                self.poll_once()
+            except Exception as e:
+                log.error("Poller failed", host=self.name, error=e)
+            self._idle = time.monotonic() - self._last_access > POLL_IDLE_AFTER
+            self._wake.clear()
+            self._wake.wait(POLL_IDLE_INTERVAL if self._idle else POLL_INTERVAL)
+
+
+def _playback_key(state):
+    item = state.get("item") or {}
+    return (state.get("playing"), state.get("error"), state.get("paused"), state.get("playerid"),
+            item.get("type"), item.get("id"), item.get("file"))
+
+
+def _expected_elapsed(old, now):
+    """Where playback should be by now if nothing but normal progress happened since the last poll."""
+    elapsed = old.get("elapsed", 0) + (0 if old.get("paused", True) else now - old["updated"])
+    return min(elapsed, old.get("duration") or elapsed)
+
+
+def _settle(old, new):
+    """
+    Debounce a fresh poll against the state reported so far.
+
+    A failed poll says nothing about playback, so the last known item is kept with status "unknown"
+    instead of reporting a stop; a poll that found a player but failed to get its progress or item
+    keeps the last known ones the same way. A stop while something was playing is held back (status
+    "stopping") until it has lasted STOP_CONFIRM seconds; an item starting meanwhile is an item change,
+    not a stop.
+
+    Returns:
+        dict: State to report, with status "playing", "paused", "stopping", "stopped" or "unknown"
+    """
+    if new["playing"]:
+        if not new["error"]:
+            new["status"] = "paused" if new["paused"] else "playing"
+            return new
+        same = old.get("playing") and old.get("playerid") == new["playerid"]
+        if "paused" not in new:
+            if same:
+                new.update(elapsed=_expected_elapsed(old, new["updated"]), duration=old.get("duration", 0),
+                           paused=old.get("paused", True))
+            else:
+                new.update(elapsed=0, duration=0, paused=True)
+        if "item" not in new:
+            new["item"] = (old.get("item") or {}) if same else {}
+        new["status"] = "unknown"
+        return new
+    if old["updated"] is None:
+        new["status"] = "unknown" if new["error"] else "stopped"
+        return new
+    held = {key: old[key] for key in ("playing", "playerid", "duration", "paused", "item") if key in old}
+    held["elapsed"] = _expected_elapsed(old, new["updated"]) if old["playing"] else 0
+    if old.get("stop_seen"):
+        # A failed poll while a stop is being confirmed keeps its window going rather than restarting it
+        held["stop_seen"] = old["stop_seen"]
+    if new["error"]:
+        return {**new, **held, "status": "unknown"}
+    if not old["playing"]:
+        new["status"] = "stopped"
+        return new
+    stop_seen = old.get("stop_seen") or new["updated"]
+    if new["updated"] - stop_seen < STOP_CONFIRM:
+        return {**new, **held, "status": "stopping", "stop_seen": stop_seen}
+    new["status"] = "stopped"
+    return new
+
+
+def _transition(old, new):
+    """
+    What changed between two settled states, if anything clients should hear about.
+
+    Returns:
+        str: "item" (another item is playing), "playback" (started or stopped), "state" (paused, resumed,
+        seeked or Kodi became unreachable or reachable again), or None for normal progress
+    """
+    if old["updated"] is None:
+        return "playback"
+    if bool(old["playing"]) != bool(new["playing"]):
+        return "playback"
+    if new["playing"] and library.fingerprint(old.get("playerid"), old.get("item") or {}) != \
+            library.fingerprint(new.get("playerid"), new.get("item") or {}):
+        return "item"
+    if _playback_key(old) != _playback_key(new):
+        return "state"
+    if new["playing"] and abs(new["elapsed"] - _expected_elapsed(old, new["updated"])) > SEEK_TOLERANCE:
+        return "state"
+    return None
+
+
+class Registry:
+    """Configured Kodi hosts in configuration order; the first one is the default."""
+
+    def __init__(self, hosts):
+        if not hosts:
+            raise ValueError("At least one Kodi host must be configured")
+        self.hosts = {host.name: host for host in hosts}
+        self.default = hosts[0]
+
+    def get(self, name=None):
+        """Return the named host, the default host for None, or None if unknown."""
+        if name is None:
+            return self.default
+        return self.hosts.get(name)
+
+    def __iter__(self):
+        return iter(self.hosts.values())
+
+    def __len__(self):
+        return len(self.hosts)
+
+
+def load_registry(default_url, default_user=None, default_pass=None):
+    """
+    Build the host registry from KODI_HOSTS / KODI_HOSTS_FILE, or a single default host.
+
+    Args:
+        default_url (str): KODI_HOST fallback used when no host list is configured
+        default_user (str): KODI_USER fallback
+        default_pass (str): KODI_PASS fallback
+
+    Returns:
+        Registry: The configured hosts
+    """
+    raw = os.getenv("KODI_HOSTS", "").strip()
+    path = os.getenv("KODI_HOSTS_FILE", "").strip()
+    if not raw and path:
+        with open(path) as f:
+            raw = f.read()
+    if not raw:
+        return Registry([KodiHost("default", default_url, default_user, default_pass, label="Kodi")])
+
+    hosts = []
+    for entry in json.loads(raw):
+        name = str(entry["name"]).lower()
+        if not _NAME.match(name):
+            raise ValueError(f"Invalid Kodi host name {name!r}: use lowercase letters, digits, '-' and '_'")
+        if name in _RESERVED_NAMES:
+            raise ValueError(f"Kodi host name {name!r} is reserved, pick another one")
+        hosts.append(KodiHost(name, entry["url"], entry.get("user"), entry.get("pass"), entry.get("label")))
+    return Registry(hosts)
+
+
+def _breaker_states(registry):
+    states = {"closed": 0, "half-open": 1, "open": 2}
+    return lambda: {(host.name,): states[host.breaker.state] for host in registry}
+
+
+def register_metrics(registry):
+    """Expose per-host circuit breaker state (0 closed, 1 half-open, 2 open) at /metrics."""
+    metrics.Gauge("kodi_circuit_breaker_state", "Circuit breaker state per Kodi host (0 closed, 1 half-open, 2 open)",
+                  ("host",), _breaker_states(registry))
@@ -1,9 +1,24 @@
-from flask import Flask, render_template_string, request, jsonify, send_file
-import requests
+from flask import Flask, render_template_string, request, jsonify, send_file, g, abort, stream_with_context
+from concurrent.futures import as_completed
+import json
 import os
-import urllib.parse
+import time
 import uuid
-from parser import route_media_display
+import startup
+# Before the app's own modules are imported, so /ready can report their import times
+startup.track_imports()
+import log
+import metrics
+import tracing
+import hosts
+import snapshot
+import tile
+import artwork
+import mediaproxy
+import placeholders
+import store
+from library import fetch_playing, fetch_section
+from parser import art_variants, item_key, render_profile, route_media_display, route_media_content, route_media_section
 
 app = Flask(__name__)
 
@@ -11,10 +26,20 @@ app = Flask(__name__)
 KODI_HOST = os.getenv("KODI_HOST", "http://Kodi_Device_HTTP_IP:Kodi_Port")
 KODI_USER = os.getenv("KODI_USER", "Kodi_user")
 KODI_PASS = os.getenv("KODI_PASS", "Kodi_password")
-AUTH = (KODI_USER, KODI_PASS) if KODI_USER else None
-HEADERS = {"Content-Type": "application/json"}
 
-ART_TYPES = ["poster", "fanart", "clearlogo", "clearart", "discart", "cdart", "banner", "season.poster", "thumbnail"]
+# All Kodi devices served by this instance; without KODI_HOSTS it is just the one above
+registry = hosts.load_registry(KODI_HOST, KODI_USER, KODI_PASS)
+hosts.register_metrics(registry)
+
+# Longest /api/nowplaying?wait= long-poll in seconds
+API_MAX_WAIT = 30
+
+def resolve_host(host_name):
+    """Look up a configured Kodi by route name (None for the default one), or 404."""
+    host = registry.get(host_name)
+    if host is None:
+        abort(404)
+    return host
 
 @app.route("/")
 def index():
@@ -60,6 +85,7 @@ def index():
         <div class="message-box">
             🎬 No Media Currently Playing<br>Awaiting Media Playback
         </div>
+        <script src="/static/nowplaying.js"></script>
         <script>
             let lastPlaybackState = false; // Initialize to false
 
@@ -72,11 +98,14 @@ def index():
                         return res.json();
                     })
                     .then(data => {
-                        const currentState = data.playing;
+                        // Kodi unreachable says nothing about playback - keep waiting
+                        if (data.error) return;
+                        // A stop still being confirmed is not playback to show
+                        const currentState = data.status === 'playing' || data.status === 'paused';
                         if (currentState !== lastPlaybackState) {
                             document.body.classList.add('fade-out');
                             setTimeout(() => {
-                                window.location.href = '/nowplaying';
+                                window.location.href = '/nowplaying' + window.location.search;
                             }, 1500);
                         }
                         lastPlaybackState = currentState;
@@ -87,315 +116,265 @@ def index():
                         setTimeout(checkPlaybackChange, 3000);
                     });
             }
-            setInterval(checkPlaybackChange, 2000); // Poll every 2 seconds
+            NowPlaying.every(2000, checkPlaybackChange); // Poll every 2 seconds while the page is visible
         </script>
     </body>
     </html>
     """
 
-@app.route("/poll_playback")
-def poll_playback():
+@app.route("/poll_playback", defaults={"host_name": None})
+@app.route("/poll_playback/<host_name>")
+def poll_playback(host_name):
+    """
+    Debounced playback state: playing only flips on a confirmed start or stop, and error (with status
+    "unknown") means Kodi could not be asked rather than that playback stopped. transition tells an
+    item change ("item") from a start or stop ("playback") and from pause, resume or seek ("state").
+    key is the playing item's key, as in /api/nowplaying, without building its snapshot.
+    """
+    host = resolve_host(host_name)
     try:
-        players = kodi_rpc("Player.GetActivePlayers")
-        if players and players.get("result"):
-            return jsonify({"playing": True})
-        return jsonify({"playing": False})
+        state = host.playback()
+        return jsonify({"playing": bool(state["playing"]), "error": state["error"], "status": state["status"],
+                        "transition": state["transition"], "version": state["version"],
+                        "key": item_key(state["item"]) if state["playing"] else None})
     except Exception as e:
-        print(f"[ERROR] Poll playback failed: {e}", flush=True)
-        # Return False on error - this will trigger retry logic on frontend
-        return jsonify({"playing": False, "error": True})
-
-def kodi_rpc(method, params=None):
-    payload = {
-        "jsonrpc": "2.0",
-        "method": method,
-        "params": params or {},
-        "id": 1
+        log.error("Poll playback failed", host=host.name, error=e)
+        return jsonify({"playing": False, "error": True, "status": "unknown"})
+
+
+def describe_playback(host):
+    """Short summary of what a host is playing, for the rooms overview."""
+    # Never poll inline here, so one slow Kodi cannot hold up the whole overview
+    state = host.playback(inline=False)
+    item = state.get("item") or {}
+    title = item.get("title") or item.get("label") or ""
+    if item.get("showtitle"):
+        subtitle = f"{item['showtitle']} S{item.get('season', 0):02d}E{item.get('episode', 0):02d}"
+    elif item.get("artist"):
+        subtitle = ", ".join(item["artist"]) + (f" - {item['album']}" if item.get("album") else "")
+    else:
+        subtitle = ""
+    if state["error"]:
+        status = "Unreachable"
+    elif state["playing"] is None:
+        status = "Connecting"
+    elif not state["playing"]:
+        status = "Idle"
+    else:
+        status = "Paused" if state["paused"] else "Playing"
+    return {
+        "name": host.name,
+        "label": host.label,
+        "status": status,
+        "title": title if state["playing"] else "",
+        "subtitle": subtitle if state["playing"] else "",
+        "elapsed": state["elapsed"],
+        "duration": state["duration"],
     }
+
+@app.route("/rooms")
+def rooms():
+    summaries = [describe_playback(host) for host in registry]
+    if request.args.get("json") == "1":
+        return jsonify(summaries)
+    return render_template_string("""
+    <!DOCTYPE html>
+    <html>
+    <head>
+      <title>Kodi Now Playing - Rooms</title>
+      <link rel="icon" type="image/x-icon" href="/static/favicon.ico">
+      <style>
+        body {
+          margin: 0;
+          padding: 30px;
+          background: linear-gradient(to bottom right, #222, #444);
+          font-family: sans-serif;
+          color: white;
+          min-height: 100vh;
+          box-sizing: border-box;
+        }
+        .rooms {
+          display: grid;
+          grid-template-columns: repeat(auto-fill, minmax(280px, 1fr));
+          gap: 20px;
+        }
+        .room {
+          display: block;
+          background: rgba(0,0,0,0.6);
+          padding: 20px;
+          border-radius: 12px;
+          box-shadow: 0 4px 20px rgba(0,0,0,0.8);
+          color: white;
+          text-decoration: none;
+        }
+        .label { font-size: 1.3em; font-weight: bold; }
+        .status { float: right; font-size: 0.8em; padding: 3px 10px; border-radius: 20px; background: #333; }
+        .status.Playing { background: #4caf50; }
+        .status.Paused { background: #f7931e; }
+        .status.Unreachable { background: #c62828; }
+        .title { margin-top: 12px; font-size: 1.1em; }
+        .subtitle { color: #ccc; font-size: 0.9em; min-height: 1.2em; }
+        .progress { background: #2a2a2a; border-radius: 6px; height: 6px; margin-top: 12px; overflow: hidden; }
+        .bar { background: #4caf50; height: 6px; }
+      </style>
+    </head>
+    <body>
+      <div class="rooms">
+        {% for room in rooms %}
+        <a class="room" id="room-{{ room.name }}" href="/nowplaying/{{ room.name }}">
+          <span class="status {{ room.status }}">{{ room.status }}</span>
+          <div class="label">{{ room.label }}</div>
+          <div class="title">{{ room.title }}</div>
+          <div class="subtitle">{{ room.subtitle }}</div>
+          <div class="progress"><div class="bar" style="width: {{ (room.elapsed * 100 // room.duration) if room.duration else 0 }}%"></div></div>
+        </a>
+        {% endfor %}
+      </div>
+      <script src="/static/nowplaying.js"></script>
+      <script>
+        function refreshRooms() {
+          fetch('/rooms?json=1')
+            .then(res => res.json())
+            .then(rooms => {
+              rooms.forEach(room => {
+                const card = document.getElementById('room-' + room.name);
+                if (!card) return;
+                const status = card.querySelector('.status');
+                status.textContent = room.status;
+                status.className = 'status ' + room.status;
+                card.querySelector('.title').textContent = room.title;
+                card.querySelector('.subtitle').textContent = room.subtitle;
+                card.querySelector('.bar').style.width = (room.duration ? Math.floor(room.elapsed * 100 / room.duration) : 0) + '%';
+              });
+            })
+            .catch(error => console.error('Rooms refresh error:', error));
+        }
+        NowPlaying.every(5000, refreshRooms);
+      </script>
+    </body>
+    </html>
+    """, rooms=summaries)
+
+@app.route("/nowplaying/tile", defaults={"host_name": None})
+@app.route("/nowplaying/tile/<host_name>")
+def now_playing_tile(host_name):
+    """
+    Compact page for small dashboard tiles, rendered once per item and revalidated with its ETag.
+    Only the poster is downloaded, in the background, and the page's build lock is not taken.
+    """
+    host = resolve_host(host_name)
+    host_path = f"/{host.name}" if host_name else ""
     try:
-        r = requests.post(f"{KODI_HOST}/jsonrpc", headers=HEADERS, json=payload, auth=AUTH, timeout=8)
-        r.raise_for_status()
-        response_json = r.json()
-        print(f"[DEBUG] Kodi response for {method}:", response_json, flush=True)
-        return response_json
-    except Exception as e:
-        print(f"[ERROR] Kodi RPC failed for method {method}: {e}", flush=True)
-        return None
-
-
-def prepare_and_download_art(item, session_id):
-    downloaded = {}
-
-    art_map = item.get("art", {})
-    if item.get("thumbnail") and not art_map.get("poster"):
-        art_map["poster"] = item["thumbnail"]
-
-    # Handle TV show artwork with tvshow. prefix
-    tvshow_art_map = {}
-    for key, value in art_map.items():
-        if key.startswith("tvshow."):
-            # Map tvshow.poster to poster, tvshow.fanart to fanart, etc.
-            clean_key = key.replace("tvshow.", "")
-            tvshow_art_map[clean_key] = value
-
-    # Handle music artwork with album., artist., and albumartist. prefixes
-    music_art_map = {}
-    for key, value in art_map.items():
-        if key.startswith("album."):
-            # Map album.thumb to thumbnail, album.poster to poster, etc.
-            clean_key = key.replace("album.", "")
-            if clean_key == "thumb":
-                clean_key = "thumbnail"
-            music_art_map[clean_key] = value
-        elif key.startswith("artist."):
-            # Map artist.fanart to fanart, artist.clearlogo to clearlogo, etc.
-            clean_key = key.replace("artist.", "")
-            music_art_map[clean_key] = value
-        elif key.startswith("albumartist."):
-            # Map albumartist.fanart to fanart, albumartist.clearlogo to clearlogo, etc.
-            clean_key = key.replace("albumartist.", "")
-            music_art_map[clean_key] = value
-
-    # Merge all artwork (music takes precedence, then TV show, then regular)
-    art_map = {**art_map, **tvshow_art_map, **music_art_map}
-    
-    # Debug logging for artwork
-    print(f"[DEBUG] Original art_map keys: {list(item.get('art', {}).keys())}", flush=True)
-    print(f"[DEBUG] Final art_map keys: {list(art_map.keys())}", flush=True)
-
-    for art_type in ART_TYPES:
-        raw_path = art_map.get(art_type)
-        print(f"[DEBUG] Processing art_type: {art_type}, raw_path: {raw_path}", flush=True)
-        if not raw_path:
-            continue
-
-        if raw_path.startswith("image://"):
-            raw_path = urllib.parse.unquote(raw_path[len("image://"):])
-        if raw_path.endswith("/"):
-            raw_path = raw_path[:-1]
-
-        # Handle external URLs directly (like fanart.tv, theaudiodb.com)
-        if raw_path.startswith("https://") or raw_path.startswith("http://"):
-            image_url = raw_path
+        # Fresh like a full page, so a tile reloaded for a new item does not show the previous one
+        state = host.playback(fresh=True)
+        if state["playing"]:
+            item, _ = fetch_playing(host, state["playerid"], state["item"])
+            html, tag = tile.render(host, item, host_path)
         else:
-            # Handle local Kodi paths
-            image_url = None
-            try:
-                response = kodi_rpc("Files.PrepareDownload", {"path": raw_path})
-                details = response.get("result", {}).get("details", {})
-                token = details.get("token")
-                path = details.get("path")
-
-                if token:
-                    basename = os.path.basename(raw_path)
-                    image_url = f"{KODI_HOST}/vfs/{token}/{urllib.parse.quote(basename)}"
-                elif path:
-                    image_url = f"{KODI_HOST}/{path}"
-                else:
-                    print(f"[ERROR] No valid download path for {art_type}", flush=True)
-            except Exception as e:
-                print(f"[WARNING] Failed to prepare download for {art_type}: {e}", flush=True)
-            
-            # If primary path failed, try fallback paths for artist artwork
-            if not image_url and art_type in ["fanart", "clearlogo", "clearart", "banner"]:
-                print(f"[DEBUG] Primary path failed, trying fallback paths for {art_type}", flush=True)
-                # Try to construct fallback paths based on album/artist folder structure
-                current_file = item.get("file", "")
-                if current_file.startswith("nfs://"):
-                    try:
-                        # Traverse upwards to find directories that contain fanart files
-                        # This is the most reliable way since fanart is typically only in artist directories
-                        current_path = current_file
-                        fallback_paths = []
-                        
-                        print(f"[DEBUG] Traversing upwards from: {current_path}")
-                        
-                        # Traverse upwards to find directories with fanart files
-                        for level in range(8):  # Limit to 8 levels up to avoid infinite loops
-                            parent_path = os.path.dirname(current_path)
-                            if parent_path == current_path:  # Reached root
-                                break
-                            
-                            dir_name = os.path.basename(parent_path)
-                            
-                            # Skip system directories
-                            if any(x in dir_name.upper() for x in ['MEDIA', 'MUSIC', 'VIDEO', 'TV', 'MOVIES']):
-                                current_path = parent_path
-                                continue
-                            
-                            # Try to find fanart files in this directory
-                            # This works for both artist directories (which have fanart) and album directories (which might have other artwork)
-                            fanart_png = f"{parent_path}/fanart.png"
-                            fanart_jpg = f"{parent_path}/fanart.jpg"
-                            clearlogo_png = f"{parent_path}/clearlogo.png"
-                            clearlogo_jpg = f"{parent_path}/clearlogo.jpg"
-                            clearart_png = f"{parent_path}/clearart.png"
-                            clearart_jpg = f"{parent_path}/clearart.jpg"
-                            banner_png = f"{parent_path}/banner.png"
-                            banner_jpg = f"{parent_path}/banner.jpg"
-                            
-                            # Add paths for the specific art type we're looking for
-                            if art_type == "fanart":
-                                fallback_paths.append(f"image://{urllib.parse.quote(fanart_png, safe='')}/")
-                                fallback_paths.append(f"image://{urllib.parse.quote(fanart_jpg, safe='')}/")
-                            elif art_type == "clearlogo":
-                                fallback_paths.append(f"image://{urllib.parse.quote(clearlogo_png, safe='')}/")
-                                fallback_paths.append(f"image://{urllib.parse.quote(clearlogo_jpg, safe='')}/")
-                            elif art_type == "clearart":
-                                fallback_paths.append(f"image://{urllib.parse.quote(clearart_png, safe='')}/")
-                                fallback_paths.append(f"image://{urllib.parse.quote(clearart_jpg, safe='')}/")
-                            elif art_type == "banner":
-                                fallback_paths.append(f"image://{urllib.parse.quote(banner_png, safe='')}/")
-                                fallback_paths.append(f"image://{urllib.parse.quote(banner_jpg, safe='')}/")
-                            
-                            print(f"[DEBUG] Level {level}: Checking {parent_path} for {art_type}")
-                            
-                            current_path = parent_path
-                        
-                        # Try each fallback path
-                        for fallback_path in fallback_paths:
-                            try:
-                                print(f"[DEBUG] Trying fallback path: {fallback_path}")
-                                response = kodi_rpc("Files.PrepareDownload", {"path": fallback_path})
-                                details = response.get("result", {}).get("details", {})
-                                token = details.get("token")
-                                path = details.get("path")
-                                
-                                if token:
-                                    basename = os.path.basename(fallback_path)
-                                    image_url = f"{KODI_HOST}/vfs/{token}/{urllib.parse.quote(basename)}"
-                                    print(f"[DEBUG] Found fallback path for {art_type}: {image_url}")
-                                    break
-                                elif path:
-                                    image_url = f"{KODI_HOST}/{path}"
-                                    print(f"[DEBUG] Found fallback path for {art_type}: {image_url}")
-                                    break
-                            except Exception as e:
-                                print(f"[DEBUG] Fallback path failed for {art_type}: {e}")
-                                continue
-                    except Exception as e:
-                        print(f"[DEBUG] Failed to construct fallback paths for {art_type}: {e}")
-            
-            if not image_url:
-                print(f"[ERROR] No valid download path found for {art_type}", flush=True)
-                continue
-
-        filename = f"{session_id}_{art_type}.jpg"
-        local_path = f"/tmp/{filename}"
+            html, tag = tile.render_idle(host_path)
+    except Exception as e:
+        log.error("Tile render failed", host=host.name, error=e)
+        html, tag = tile.render_idle(host_path)
+    if request.if_none_match.contains_weak(tag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(html, mimetype="text/html")
+    response.set_etag(tag, weak=True)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route("/api/nowplaying", defaults={"host_name": None})
+@app.route("/api/nowplaying/<host_name>")
+def api_now_playing(host_name):
+    """
+    Versioned JSON snapshot of what a host is playing.
 
+    The version only changes when the item, play/pause state or position (seek) changes,
+    so clients can revalidate with If-None-Match, or long-poll with ?wait=<seconds>
+    (plus ?since=<version> or If-None-Match) until something happens. ?details=0 leaves
+    out the library details.
+    """
+    host = resolve_host(host_name)
+    state = host.playback()
+    wait = min(request.args.get("wait", 0, type=float), API_MAX_WAIT)
+    known = request.args.get("since", type=int)
+    if known is None and request.if_none_match.contains_weak(snapshot.etag(state["version"])):
+        known = state["version"]
+    if wait > 0 and known == state["version"]:
+        host.wait_for_change(known, wait)
+        state = host.playback()
+
+    tag = snapshot.etag(state["version"])
+    if request.if_none_match.contains_weak(tag):
+        response = app.response_class(status=304)
+    else:
         try:
-            # Use authentication only for Kodi internal URLs
-            if image_url.startswith(KODI_HOST):
-                print(f"[DEBUG] Downloading with auth: {image_url}", flush=True)
-                r = requests.get(image_url, auth=AUTH, timeout=5)
-            else:
-                print(f"[DEBUG] Downloading without auth: {image_url}", flush=True)
-                r = requests.get(image_url, timeout=5)
-            r.raise_for_status()
-            with open(local_path, "wb") as f:
-                f.write(r.content)
-            downloaded[art_type] = filename
-            print(f"[INFO] Downloaded {art_type} to {local_path}", flush=True)
+            data = snapshot.build(host, state)
+            if request.args.get("details") == "0" and data["item"]:
+                data["item"] = {k: v for k, v in data["item"].items() if k != "details"}
+            response = jsonify(data)
         except Exception as e:
-            print(f"[ERROR] Failed to download {art_type}: {e}", flush=True)
-            
-            # If download failed with 401, try fallback paths for artist artwork
-            if "401" in str(e) and art_type in ["fanart", "clearlogo", "clearart", "banner"]:
-                print(f"[DEBUG] Download failed with 401, trying fallback paths for {art_type}", flush=True)
-                # Try to construct fallback paths based on album/artist folder structure
-                current_file = item.get("file", "")
-                if current_file.startswith("nfs://"):
-                    try:
-                        # Traverse upwards to find directories that contain fanart files
-                        # This is the most reliable way since fanart is typically only in artist directories
-                        current_path = current_file
-                        fallback_paths = []
-                        
-                        print(f"[DEBUG] Traversing upwards from: {current_path}")
-                        
-                        # Traverse upwards to find directories with fanart files
-                        for level in range(8):  # Limit to 8 levels up to avoid infinite loops
-                            parent_path = os.path.dirname(current_path)
-                            if parent_path == current_path:  # Reached root
-                                break
-                            
-                            dir_name = os.path.basename(parent_path)
-                            
-                            # Skip system directories
-                            if any(x in dir_name.upper() for x in ['MEDIA', 'MUSIC', 'VIDEO', 'TV', 'MOVIES']):
-                                current_path = parent_path
-                                continue
-                            
-                            # Try to find fanart files in this directory
-                            # This works for both artist directories (which have fanart) and album directories (which might have other artwork)
-                            fanart_png = f"{parent_path}/fanart.png"
-                            fanart_jpg = f"{parent_path}/fanart.jpg"
-                            clearlogo_png = f"{parent_path}/clearlogo.png"
-                            clearlogo_jpg = f"{parent_path}/clearlogo.jpg"
-                            clearart_png = f"{parent_path}/clearart.png"
-                            clearart_jpg = f"{parent_path}/clearart.jpg"
-                            banner_png = f"{parent_path}/banner.png"
-                            banner_jpg = f"{parent_path}/banner.jpg"
-                            
-                            # Add paths for the specific art type we're looking for
-                            if art_type == "fanart":
-                                fallback_paths.append(f"image://{urllib.parse.quote(fanart_png, safe='')}/")
-                                fallback_paths.append(f"image://{urllib.parse.quote(fanart_jpg, safe='')}/")
-                            elif art_type == "clearlogo":
-                                fallback_paths.append(f"image://{urllib.parse.quote(clearlogo_png, safe='')}/")
-                                fallback_paths.append(f"image://{urllib.parse.quote(clearlogo_jpg, safe='')}/")
-                            elif art_type == "clearart":
-                                fallback_paths.append(f"image://{urllib.parse.quote(clearart_png, safe='')}/")
-                                fallback_paths.append(f"image://{urllib.parse.quote(clearart_jpg, safe='')}/")
-                            elif art_type == "banner":
-                                fallback_paths.append(f"image://{urllib.parse.quote(banner_png, safe='')}/")
-                                fallback_paths.append(f"image://{urllib.parse.quote(banner_jpg, safe='')}/")
-                            
-                            print(f"[DEBUG] Level {level}: Checking {parent_path} for {art_type}")
-                            
-                            current_path = parent_path
-                        
-                        # Try each fallback path
-                        for fallback_path in fallback_paths:
-                            try:
-                                print(f"[DEBUG] Trying fallback path: {fallback_path}")
-                                response = kodi_rpc("Files.PrepareDownload", {"path": fallback_path})
-                                details = response.get("result", {}).get("details", {})
-                                token = details.get("token")
-                                path = details.get("path")
-                                
-                                if token:
-                                    basename = os.path.basename(fallback_path)
-                                    fallback_image_url = f"{KODI_HOST}/vfs/{token}/{urllib.parse.quote(basename)}"
-                                elif path:
-                                    fallback_image_url = f"{KODI_HOST}/{path}"
-                                else:
-                                    continue
-                                
-                                # Try to download the fallback image
-                                print(f"[DEBUG] Trying to download fallback: {fallback_image_url}")
-                                r = requests.get(fallback_image_url, auth=AUTH, timeout=5)
-                                r.raise_for_status()
-                                with open(local_path, "wb") as f:
-                                    f.write(r.content)
-                                downloaded[art_type] = filename
-                                print(f"[INFO] Downloaded {art_type} from fallback path to {local_path}")
-                                break  # Success, stop trying other fallback paths
-                            except Exception as fallback_e:
-                                print(f"[DEBUG] Fallback path failed for {art_type}: {fallback_e}")
-                                continue
-                    except Exception as fallback_construct_e:
-                        print(f"[DEBUG] Failed to construct fallback paths for {art_type}: {fallback_construct_e}")
-
-    return downloaded
+            log.error("Snapshot failed", host=host.name, error=e)
+            return jsonify({"host": host.name, "error": True}), 502
+    response.set_etag(tag, weak=True)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
 @app.route("/media/<filename>")
 def serve_image(filename):
-    path = f"/tmp/{filename}"
-    if os.path.exists(path):
+    path = store.art_path(filename)
+    # Pages are streamed before their artwork is downloaded, so wait for a running download
+    if artwork.wait_for(filename):
+        metrics.cache_hit("media")
+        width = request.args.get("w", type=int)
+        data = mediaproxy.scaled_file(path, width) if width else None
+        if data is not None:
+            return app.response_class(data, mimetype="image/jpeg")
         return send_file(path, mimetype="image/jpeg")
+    metrics.cache_miss("media")
     return "Image not found", 404
 
+@app.route("/media/p/<ref>.jpg")
+def proxy_image(ref):
+    image = mediaproxy.open_image(registry, ref, request.args.get("w", type=int))
+    if image is None:
+        return "Image not found", 404
+    content_type, body = image
+    response = app.response_class(body, mimetype=content_type)
+    # The reference names a fixed art path, so browsers can keep the image
+    response.headers["Cache-Control"] = "private, max-age=86400"
+    return response
+
+@app.route("/ready")
+def ready():
+    status = startup.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+@app.route("/metrics")
+def serve_metrics():
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+@app.route("/debug/traces")
+def debug_traces():
+    return jsonify({"enabled": tracing.TRACING, "slowest": tracing.slowest()})
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    metrics.client_seen(request.remote_addr)
+    tracing.begin(request.url_rule.rule if request.url_rule else "unmatched")
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get("request_start")
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, route=route, method=request.method, status=response.status_code)
+    server_timing = tracing.finish()
+    if server_timing:
+        response.headers["Server-Timing"] = server_timing
+    return response
+
 # New route to serve static files like the IMDb icon
 @app.route("/static/<filename>")
 def serve_static(filename):
@@ -406,46 +385,47 @@ def serve_static(filename):
 def favicon():
     try:
         favicon_path = os.path.join(os.path.dirname(__file__), "favicon.ico")
-        print(f"[DEBUG] Favicon path: {favicon_path}", flush=True)
-        print(f"[DEBUG] Favicon exists: {os.path.exists(favicon_path)}", flush=True)
+        log.debug("Favicon path", path=favicon_path)
+        log.debug("Favicon exists", exists=os.path.exists(favicon_path))
         if os.path.exists(favicon_path):
             return send_file(favicon_path, mimetype="image/x-icon")
         else:
-            print(f"[ERROR] Favicon file not found at: {favicon_path}", flush=True)
+            log.error("Favicon file not found", path=favicon_path)
             return "Favicon not found", 404
     except Exception as e:
-        print(f"[ERROR] Favicon route error: {e}", flush=True)
+        log.error("Favicon route error", error=e)
         return "Favicon error", 500
 
 
-@app.route("/nowplaying")
-def now_playing():
+@app.route("/nowplaying", defaults={"host_name": None})
+@app.route("/nowplaying/<host_name>")
+def now_playing(host_name):
+    host = resolve_host(host_name)
+    host_path = f"/{host.name}" if host_name else ""
+    profile = render_profile(request.args.get("profile"))
     if request.args.get("json") == "1":
-        active_response = kodi_rpc("Player.GetActivePlayers")
-        active = active_response.get("result") if active_response else None
-        if not active:
+        # Served from the host's poller, so resyncing clients do not each hit Kodi
+        state = host.playback()
+        if not state["playing"]:
             return jsonify({"elapsed": 0, "duration": 0, "paused": True})
-        player_id = active[0]["playerid"]
-        progress_response = kodi_rpc("Player.GetProperties", {
-            "playerid": player_id,
-            "properties": ["time", "totaltime", "speed"]
-        })
-        progress = progress_response.get("result") if progress_response else {}
-        t = progress.get("time", {})
-        d = progress.get("totaltime", {})
-        speed = progress.get("speed", 0)
-        def to_secs(t): return t.get("hours", 0) * 3600 + t.get("minutes", 0) * 60 + t.get("seconds", 0)
         return jsonify({
-            "elapsed": to_secs(t),
-            "duration": to_secs(d),
-            "paused": speed == 0
+            "elapsed": state["elapsed"],
+            "duration": state["duration"],
+            "paused": state["paused"]
         })
-
-    # Get active players - this is critical, so if it fails, show error
+    if request.args.get("fragment") == "1":
+        return now_playing_fragment(host)
+    if request.args.get("section"):
+        return now_playing_section(host, request.args["section"], request.args.get("key"))
+    if request.args.get("slides") == "1":
+        return now_playing_slides(host, request.args.get("key"))
+
+    # Player, progress and the playing item's fingerprint come from a fresh poll, so a direct load
+    # or a reload after a layout change shows the current item - this is critical, so if it fails,
+    # show error. A stop that is still being confirmed shows the idle page
     try:
-        active_response = kodi_rpc("Player.GetActivePlayers")
-        active = active_response.get("result") if active_response else None
-        if not active:
+        state = host.playback(fresh=True)
+        if not state["playing"] or state["status"] == "stopping":
             return render_template_string("""
             <html>
             <head>
@@ -470,14 +450,16 @@ def now_playing():
                   font-style: italic;
                 }
               </style>
+              <script src="/static/nowplaying.js"></script>
               <script>
                 let lastPlaybackState = false; // Initialize to false
 
                 function checkPlaybackChange() {
-                  fetch('/poll_playback')
+                  fetch('/poll_playback{{ host_path }}')
                     .then(res => res.json())
                     .then(data => {
-                      const currentState = data.playing;
+                      if (data.error) return;
+                      const currentState = data.status === 'playing' || data.status === 'paused';
                       if (currentState !== lastPlaybackState) {
                         document.body.classList.add('fade-out');
                         setTimeout(() => {
@@ -487,7 +469,7 @@ def now_playing():
                       lastPlaybackState = currentState;
                     });
                 }
-                setInterval(checkPlaybackChange, 5000); // Poll every 5 seconds
+                NowPlaying.every(5000, checkPlaybackChange); // Poll every 5 seconds while the page is visible
               </script>
             </head>
             <body>
@@ -496,172 +478,37 @@ def now_playing():
               </div>
             </body>
             </html>
-            """)
+            """, host_path=host_path)
 
-        player_id = active[0]["playerid"]
+        player_id = state["playerid"]
         
-        # Get current item - this is critical, so if it fails, show error
+        # Get current item - fetched in full only when its fingerprint changed, and critical
         try:
-            item_response = kodi_rpc("Player.GetItem", {
-                "playerid": player_id,
-                "properties": [
-                    "title", "album", "artist", "season", "episode", "showtitle",
-                        "tvshowid", "duration", "file", "director", "art", "plot", 
-                        "cast", "resume", "genre", "rating", "streamdetails", "year"
-                ]
-            })
-            result = item_response.get("result", {})
-            item = result.get("item", {})
+            item, details = fetch_playing(host, player_id, state["item"])
         except Exception as e:
-            print(f"[ERROR] Failed to get current item: {e}", flush=True)
+            log.error("Failed to get current item", error=e)
             raise e  # This is critical, so re-raise
-        
-        # Get item type to know which API call to make
-        playback_type = item.get("type", "unknown")
-        
-        # Initialize details with basic fallback structure
-        details = {
-            "album": {"title": item.get("album", ""), "year": item.get("year", "")},
-            "artist": {"label": ", ".join(item.get("artist", [])) if item.get("artist") else "Unknown Artist"}
-        }
-        
-        # Get enhanced details for episodes, movies, and songs
-        print(f"[DEBUG] Playback type detected: {playback_type}", flush=True)
-        print(f"[DEBUG] Available IDs - songid: {item.get('songid')}, albumid: {item.get('albumid')}, artistid: {item.get('artistid')}", flush=True)
-        if playback_type == "episode":
-            try:
-                print(f"[DEBUG] Getting enhanced details for episode", flush=True)
-                episode_response = kodi_rpc("VideoLibrary.GetEpisodeDetails", {
-                    "episodeid": item.get("id"),
-                "properties": ["streamdetails", "genre", "director", "cast", "uniqueid", "rating"]
-            })
-                if episode_response and episode_response.get("result"):
-                    episode_details = episode_response["result"].get("episodedetails", {})
-                    # Merge enhanced details with basic item data
-                    details.update(episode_details)
-                    # Ensure basic item data is preserved
-                    details.update({
-                        "title": item.get("title", ""),
-                        "plot": item.get("plot", ""),
-                        "season": item.get("season", 0),
-                        "episode": item.get("episode", 0),
-                        "showtitle": item.get("showtitle", ""),
-                        "director": item.get("director", []),
-                        "cast": item.get("cast", []),
-                        "year": item.get("year", "")
-                    })
-                    print(f"[DEBUG] Enhanced episode details loaded", flush=True)
-            except Exception as e:
-                print(f"[WARNING] Failed to get enhanced episode details: {e}", flush=True)
-                print(f"[DEBUG] Using basic item data for {playback_type}", flush=True)
-        elif playback_type == "movie":
-            try:
-                print(f"[DEBUG] Getting enhanced details for movie", flush=True)
-                movie_response = kodi_rpc("VideoLibrary.GetMovieDetails", {
-                    "movieid": item.get("id"),
-                "properties": ["streamdetails", "genre", "director", "cast", "uniqueid", "rating"]
-            })
-                if movie_response and movie_response.get("result"):
-                    movie_details = movie_response["result"].get("moviedetails", {})
-                    # Merge enhanced details with basic item data
-                    details.update(movie_details)
-                    # Ensure basic item data is preserved
-                    details.update({
-                        "title": item.get("title", ""),
-                        "plot": item.get("plot", ""),
-                        "director": item.get("director", []),
-                        "cast": item.get("cast", []),
-                        "year": item.get("year", "")
-                    })
-                    print(f"[DEBUG] Enhanced movie details loaded", flush=True)
-            except Exception as e:
-                print(f"[WARNING] Failed to get enhanced movie details: {e}", flush=True)
-                print(f"[DEBUG] Using basic item data for {playback_type}", flush=True)
-        elif playback_type == "song":
-            try:
-                print(f"[DEBUG] Getting enhanced details for song", flush=True)
-                print(f"[DEBUG] Basic item ID: {item.get('id')}", flush=True)
-                # Get song details using the basic item ID
-                song_response = kodi_rpc("AudioLibrary.GetSongDetails", {
-                    "songid": item.get("id"),
-                    "properties": ["title", "album", "artist", "duration", "rating", "year", "genre", "fanart", "thumbnail", "albumid", "artistid", "bitrate", "channels", "samplerate", "bpm", "comment", "lyrics", "mood", "playcount", "track", "disc"]
-                })
-                if song_response and song_response.get("result"):
-                    song_details = song_response["result"].get("songdetails", {})
-                    details.update(song_details)
-                    print(f"[DEBUG] Enhanced song details loaded", flush=True)
-                
-                # Get album details if we have albumid
-                albumid = song_details.get("albumid")
-                if albumid:
-                    try:
-                        album_response = kodi_rpc("AudioLibrary.GetAlbumDetails", {
-                            "albumid": albumid,
-                            "properties": ["title", "artist", "year", "rating", "fanart", "thumbnail", "description", "genre", "mood", "style", "theme", "albumduration", "playcount", "albumlabel", "compilation", "totaldiscs"]
-                        })
-                        if album_response and album_response.get("result"):
-                            album_details = album_response["result"].get("albumdetails", {})
-                            details["album"] = album_details
-                            print(f"[DEBUG] Enhanced album details loaded", flush=True)
-                    except Exception as e:
-                        print(f"[WARNING] Failed to get album details: {e}", flush=True)
-                
-                # Get artist details if we have artistid
-                artistid = song_details.get("artistid")
-                if artistid:
-                    # Handle artistid as array (take first one) or single value
-                    print(f"[DEBUG] Original artistid: {artistid}, type: {type(artistid)}", flush=True)
-                    if isinstance(artistid, list) and len(artistid) > 0:
-                        artistid = artistid[0]
-                        print(f"[DEBUG] Converted artistid to: {artistid}, type: {type(artistid)}", flush=True)
-                    try:
-                        artist_response = kodi_rpc("AudioLibrary.GetArtistDetails", {
-                            "artistid": artistid,
-                            "properties": ["fanart", "thumbnail", "description", "born", "formed", "died", "disbanded", "genre", "mood", "style", "yearsactive"]
-                        })
-                        if artist_response and artist_response.get("result"):
-                            artist_details = artist_response["result"].get("artistdetails", {})
-                            details["artist"] = artist_details
-                            print(f"[DEBUG] Enhanced artist details loaded", flush=True)
-                    except Exception as e:
-                        print(f"[WARNING] Failed to get artist details: {e}", flush=True)
-                
-                # Ensure basic item data is preserved (but don't overwrite detailed album/artist objects)
-                details.update({
-                    "title": item.get("title", ""),
-                    "year": item.get("year", "")
-                })
-                
-            except Exception as e:
-                print(f"[WARNING] Failed to get enhanced song details: {e}", flush=True)
-                print(f"[DEBUG] Using basic item data for {playback_type}", flush=True)
-        else:
-            print(f"[DEBUG] Using basic item data for {playback_type}", flush=True)
-
 
-        # Playback progress
-        progress_response = kodi_rpc("Player.GetProperties", {
-            "playerid": player_id,
-            "properties": ["time", "totaltime", "speed"]
-        })
-        progress = progress_response.get("result") if progress_response else {}
-        t = progress.get("time", {})
-        d = progress.get("totaltime", {})
-        speed = progress.get("speed", 0)
-        def to_secs(t): return t.get("hours", 0) * 3600 + t.get("minutes", 0) * 60 + t.get("seconds", 0)
-        elapsed = to_secs(t)
-        duration = to_secs(d)
-        percent = int((elapsed / duration) * 100) if duration else 0
-        paused = speed == 0
+        elapsed = state["elapsed"]
+        duration = state["duration"]
+        paused = state["paused"]
 
         session_id = uuid.uuid4().hex
         
-        # Try to download artwork, but don't fail if this breaks
+        # Start the artwork downloads, but don't wait for them: the page links the files they
+        # will be stored as and /media holds those requests until the download is done
         try:
-            downloaded_art = prepare_and_download_art(item, session_id)
+            with tracing.span("artwork"):
+                if mediaproxy.ENABLED:
+                    art_downloads, planned_art = {}, mediaproxy.art_refs(host, item)
+                else:
+                    art_downloads = artwork.start_downloads(host, item)
+                    sources = artwork.art_sources(item)
+                    planned_art = {art_type: artwork.planned_file(host.name, sources[art_type], future)
+                                   for art_type, future in art_downloads.items()}
         except Exception as e:
-            print(f"[WARNING] Artwork download failed, continuing without artwork: {e}", flush=True)
-            downloaded_art = {}  # Empty artwork - page will still work
+            log.warning("Artwork download failed, continuing without artwork", error=e)
+            art_downloads, planned_art = {}, {}  # Empty artwork - page will still work
 
         # Prepare progress data
         progress_data = {
@@ -671,10 +518,20 @@ def now_playing():
         }
 
         # Use the modular system to generate HTML
-        html = route_media_display(item, session_id, downloaded_art, progress_data, details)
-        return render_template_string(html)
+        with tracing.span("render"):
+            html = route_media_display(item, session_id, planned_art, progress_data, details, host_path, profile)
+            html = render_template_string(html)
+            shown_placeholders = placeholders.for_page(host, artwork.art_sources(item), art_variants(planned_art, profile))
+            html = with_placeholders(html, shown_placeholders)
+        if not art_downloads:
+            # Nothing to wait for: no artwork, or proxied artwork the browser fetches through /media/p/
+            snapshot.remember(host, player_id, item, details, planned_art)
+            return html
+        page = stream_page(html, host, player_id, item, details, progress_data, art_downloads, shown_placeholders,
+                           profile)
+        return app.response_class(stream_with_context(page), mimetype="text/html")
     except Exception as e:
-        print(f"[ERROR] Critical failure in now_playing route: {e}", flush=True)
+        log.error("Critical failure in now_playing route", host=host.name, error=e)
         return render_template_string("""
         <html>
         <head>
@@ -708,6 +565,127 @@ def now_playing():
         </html>
         """)
 
+def placeholder_script(found):
+    """Script handing artwork placeholders (URL to preview) to the page runtime."""
+    if not found:
+        return ""
+    return f"<script>NowPlaying.placeholders({json.dumps(found)});</script>\n"
+
+def with_placeholders(html, found):
+    """Add the placeholders script at the end of a rendered page's body."""
+    head, body_end, tail = html.rpartition("</body>")
+    if not body_end:
+        return html + placeholder_script(found)
+    return head + placeholder_script(found) + body_end + tail
+
+def stream_page(html, host, player_id, item, details, progress_data, art_downloads, shown_placeholders, profile="full"):
+    """
+    Send the rendered page at once, then a small script per art type as its download finishes,
+    with the placeholder of fanart and posters so they show a preview while the browser loads them.
+
+    If any artwork failed, the content is re-rendered at the end so the page falls back the
+    way a page rendered without that artwork would (e.g. banner or title instead of a clearlogo).
+    """
+    head, body_end, tail = html.rpartition("</body>")
+    if not body_end:
+        head, tail = html, ""
+    yield head
+    downloaded_art = {}
+    sources = artwork.art_sources(item)
+    failed = False
+    try:
+        futures = {future: art_type for art_type, future in art_downloads.items()}
+        for future in as_completed(futures, timeout=artwork.ART_WAIT_TIMEOUT):
+            art_type = futures[future]
+            try:
+                filename = future.result()
+            except Exception as e:
+                log.error("Artwork download crashed", art_type=art_type, error=e)
+                filename = None
+            if filename:
+                downloaded_art[art_type] = filename
+                linked = art_variants({art_type: filename}, profile)
+                if f"/media/{linked[art_type]}" not in shown_placeholders:
+                    yield placeholder_script(placeholders.for_page(host, {art_type: sources.get(art_type)}, linked))
+            else:
+                failed = True
+            planned = art_variants({art_type: artwork.planned_file(host.name, sources[art_type], future)}, profile)
+            url = f"/media/{planned[art_type]}"
+            yield f"<script>NowPlaying.art({json.dumps(art_type)}, {json.dumps(bool(filename))}, {json.dumps(url)});</script>\n"
+    except Exception as e:
+        log.warning("Artwork did not finish in time", host=host.name, error=e)
+        failed = True
+    snapshot.remember(host, player_id, item, details, downloaded_art)
+    if failed:
+        try:
+            page = route_media_content(item, downloaded_art, progress_data, details, profile)
+            fill = json.dumps({"content": page["content"], "background": page["background"]}).replace("<", "\\u003c")
+            yield f"<script>NowPlaying.fill({fill});</script>\n"
+        except Exception as e:
+            log.error("Re-render without missing artwork failed", host=host.name, error=e)
+    yield body_end + tail
+
+def now_playing_fragment(host):
+    """Swappable page content for the playing item, so open pages can change item without reloading."""
+    state = host.playback()
+    if not state["playing"]:
+        return jsonify({"playing": False, "version": state["version"]})
+    try:
+        current = snapshot.content(host, state)
+        progress_data = {"elapsed": state["elapsed"], "duration": state["duration"], "paused": state["paused"]}
+        with tracing.span("render"):
+            page = route_media_content(current["item"], current["downloaded_art"], progress_data, current["details"],
+                                       render_profile(request.args.get("profile")))
+    except Exception as e:
+        log.error("Fragment render failed", host=host.name, error=e)
+        return jsonify({"playing": True, "error": True}), 502
+    return jsonify({"playing": True, "version": state["version"], **page, "progress": progress_data})
+
+def playing_content(host, key=None):
+    """
+    Snapshot content of the playing item for deferred page requests.
+
+    With a key, answers 409 once another item plays, and 404 when nothing plays.
+    """
+    state = host.playback()
+    current = snapshot.content(host, state) if state["playing"] else None
+    if key and (current is None or item_key(current["item"]) != key):
+        # The poller may not have seen the item the page shows yet
+        state = host.poll_once()
+        current = snapshot.content(host, state) if state["playing"] else None
+        if current is None or item_key(current["item"]) != key:
+            abort(app.response_class("", status=409))
+    if current is None:
+        abort(app.response_class("", status=404))
+    return current
+
+def now_playing_section(host, name, key=None):
+    """
+    One deferred page section as an HTML fragment.
+
+    With ?key= the response is only for that item (409 once another one plays) and
+    may be cached by the browser.
+    """
+    current = playing_content(host, key)
+    try:
+        data = fetch_section(host, current["item"], current["details"], name)
+    except ValueError:
+        abort(404)
+    with tracing.span("render"):
+        html = route_media_section(current["item"], name, data)
+    response = app.response_class(html, mimetype="text/html")
+    response.headers["Cache-Control"] = f"private, max-age={int(hosts.DETAILS_TTL)}" if key else "no-cache"
+    return response
+
+def now_playing_slides(host, key=None):
+    """Background slideshow images of the playing item; cached by the browser like sections."""
+    current = playing_content(host, key)
+    with tracing.span("slides"):
+        slides = mediaproxy.slide_urls(host, current["item"])
+    response = jsonify({"key": item_key(current["item"]), "slides": slides})
+    response.headers["Cache-Control"] = f"private, max-age={int(hosts.DETAILS_TTL)}" if key else "no-cache"
+    return response
+
 def generate_fallback_html(item, progress_data):
     """Generate basic HTML when the modular system fails"""
     title = item.get("title", "Unknown Title")
@@ -787,6 +765,8 @@ def generate_fallback_html(item, progress_data):
     </html>
     """
 
+startup.start_warm_up(app, registry)
+
 if __name__ == "__main__":
 
-    app.run(host="0.0.0.0", port=5001)
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5001")))
@@ -0,0 +1,339 @@
+"""
+Kodi library lookups for Kodi Now Playing application.
+Fetches the playing item and enriches it with movie, episode or song/album/artist details.
+
+Fetching is two-tier: polls ask Player.GetItem for a fingerprint only (player, item id, type and
+file), and the full item and its details are fetched when the fingerprint changes. A planner
+splits the properties so each is requested once, from the details call where it can answer.
+"""
+import os
+import time
+
+import log
+import tracing
+from cache import TTLCache
+
+# Properties requested for the playing item. Plot and cast are left to fetch_section()
+ITEM_PROPERTIES = [
+    "title", "album", "artist", "season", "episode", "showtitle",
+    "tvshowid", "duration", "file", "director", "art",
+    "resume", "genre", "rating", "streamdetails", "year"
+]
+
+# Properties a poll asks for; Kodi adds the item's id, type and label by itself
+FINGERPRINT_PROPERTIES = ["file"]
+
+# Item properties each library type's pages use, out of ITEM_PROPERTIES
+TYPE_PROPERTIES = {
+    "movie": ["title", "file", "director", "art", "resume", "genre", "rating", "streamdetails", "year"],
+    "episode": ["title", "season", "episode", "showtitle", "tvshowid", "file", "director", "art",
+                "resume", "genre", "rating", "streamdetails", "year"],
+    "song": ["title", "album", "artist", "duration", "file", "art", "genre", "rating", "year"],
+}
+
+# Details call per library type: method, id parameter, result key and the properties it is asked for
+DETAILS = {
+    "movie": ("VideoLibrary.GetMovieDetails", "movieid", "moviedetails",
+              ["streamdetails", "genre", "director", "uniqueid", "rating"]),
+    "episode": ("VideoLibrary.GetEpisodeDetails", "episodeid", "episodedetails",
+                ["streamdetails", "genre", "director", "uniqueid", "rating"]),
+    "song": ("AudioLibrary.GetSongDetails", "songid", "songdetails",
+             ["title", "album", "artist", "duration", "rating", "year", "genre", "fanart", "thumbnail", "albumid",
+              "artistid", "bitrate", "channels", "samplerate", "bpm", "mood", "playcount", "track", "disc"]),
+}
+
+# Properties Kodi's details methods accept (Video.Fields.Movie, Video.Fields.Episode, Audio.Fields.Song)
+DETAIL_FIELDS = {
+    "movie": {"title", "genre", "year", "rating", "director", "streamdetails", "file", "art", "resume",
+              "uniqueid", "plot", "cast", "runtime"},
+    "episode": {"title", "season", "episode", "showtitle", "tvshowid", "rating", "director", "streamdetails",
+                "file", "art", "resume", "uniqueid", "plot", "cast", "runtime", "firstaired"},
+    "song": {"title", "artist", "album", "genre", "year", "rating", "duration", "track", "disc", "file", "art",
+             "fanart", "thumbnail", "albumid", "artistid", "bitrate", "channels", "samplerate", "bpm", "mood",
+             "playcount", "lyrics", "comment"},
+}
+
+# Seconds a fetched item is reused; resume point, playcount and the like are fetched again after it,
+# at the same pace as the library details it merges (DETAILS_TTL)
+PLAYING_TTL = float(os.getenv("DETAILS_TTL", "300"))
+
+# Full item and details per fingerprint
+_playing = TTLCache("playing", maxsize=16, ttl=PLAYING_TTL)
+
+
+def plan_properties(media_type):
+    """
+    Split the properties of a library item between Player.GetItem and its details call.
+
+    Everything the details call accepts is asked from it (its answers are cached across plays);
+    GetItem only gets the rest. Properties in the fingerprint are never asked again.
+
+    Returns:
+        tuple: (GetItem properties, details properties); details is empty for non-library types
+    """
+    if media_type not in DETAILS:
+        return list(ITEM_PROPERTIES), []
+    supported = DETAIL_FIELDS[media_type]
+    wanted = TYPE_PROPERTIES[media_type]
+    item_properties = [name for name in wanted if name not in supported and name not in FINGERPRINT_PROPERTIES]
+    detail_properties = list(dict.fromkeys(
+        name for name in wanted + DETAILS[media_type][3] if name in supported and name not in FINGERPRINT_PROPERTIES))
+    return item_properties, detail_properties
+
+
+def fingerprint(player_id, item):
+    """What identifies the playing item: player, item id, type and file."""
+    return (player_id, item.get("id"), item.get("type"), item.get("file"))
+
+# Sections loaded after first paint, per media type
+SECTIONS = {
+    "movie": ("plot", "cast"),
+    "episode": ("plot", "cast"),
+    "song": ("about",),
+}
+
+
+def fetch_item(host, player_id, properties=None):
+    """
+    Get the item playing on a Kodi player.
+
+    Args:
+        host (KodiHost): Kodi to ask
+        player_id (int): Active player ID
+        properties (list): Properties to ask for, ITEM_PROPERTIES by default
+
+    Returns:
+        dict: Media item from Kodi API, empty if Kodi returned none
+    """
+    item_response = host.rpc("Player.GetItem", {
+        "playerid": player_id,
+        "properties": ITEM_PROPERTIES if properties is None else properties,
+    })
+    result = item_response.get("result", {})
+    return result.get("item", {})
+
+
+def fetch_playing(host, player_id, seen):
+    """
+    Full item and details of what a player is playing, fetched once per fingerprint.
+
+    Args:
+        host (KodiHost): Kodi to ask
+        player_id (int): Active player ID
+        seen (dict): Item from a fingerprint poll (id, type, label and file)
+
+    Returns:
+        tuple: (item, details) like fetch_item() and fetch_details()
+    """
+    key = (host.name, *fingerprint(player_id, seen))
+    cached = _playing.get(key)
+    if cached is not None:
+        return cached
+    media_type = seen.get("type")
+    if media_type not in DETAILS or not seen.get("id"):
+        # Files, streams and add-ons have no details call, so GetItem gets everything
+        item = fetch_item(host, player_id)
+        details = fetch_details(host, item)
+        if item and fingerprint(player_id, item) == fingerprint(player_id, seen):
+            _playing.set(key, (item, details))
+        return item, details
+    item_properties, _ = plan_properties(media_type)
+    item = dict(seen)
+    if item_properties:
+        item.update(fetch_item(host, player_id, item_properties))
+    details = fetch_details(host, item)
+    # Kodi answers details with the item's ID; without it the item lacks what the planner moved to the
+    # details call, so the next fetch tries again
+    answered = DETAILS[media_type][1] in details
+    if answered and fingerprint(player_id, item) == fingerprint(player_id, seen):
+        # Otherwise the item changed between the poll and this fetch
+        _playing.set(key, (item, details))
+    return item, details
+
+
+def _backfill(item, media_details, media_type):
+    """Copy the item properties the planner moved to the details call back onto the item."""
+    item_properties, _ = plan_properties(media_type)
+    for name in TYPE_PROPERTIES.get(media_type, ()):
+        if name not in item_properties and name in media_details and name not in item:
+            item[name] = media_details[name]
+
+
+def fetch_details(host, item):
+    """
+    Look up the library details of the playing item.
+
+    Args:
+        host (KodiHost): Kodi the item is playing on
+        item (dict): Media item from Kodi API
+
+    Returns:
+        dict: Item details merged with movie/episode/song details; songs also get album and artist details
+    """
+    # Get item type to know which API call to make
+    playback_type = item.get("type", "unknown")
+
+    enrich_start = time.perf_counter()
+
+    # Initialize details with basic fallback structure
+    details = {
+        "album": {"title": item.get("album", ""), "year": item.get("year", "")},
+        "artist": {"label": ", ".join(item.get("artist", [])) if item.get("artist") else "Unknown Artist"}
+    }
+    
+    # Get enhanced details for episodes, movies, and songs
+    log.debug("Playback type detected", playback_type=playback_type)
+    log.debug("Available IDs", songid=item.get("songid"), albumid=item.get("albumid"), artistid=item.get("artistid"))
+    if playback_type == "episode":
+        try:
+            log.debug("Getting enhanced details", playback_type=playback_type)
+            episode_response = host.rpc_cached("VideoLibrary.GetEpisodeDetails", {
+                "episodeid": item.get("id"),
+                "properties": plan_properties("episode")[1]
+            })
+            if episode_response and episode_response.get("result"):
+                episode_details = episode_response["result"].get("episodedetails", {})
+                _backfill(item, episode_details, playback_type)
+                # Merge enhanced details with basic item data
+                details.update(episode_details)
+                # Ensure basic item data is preserved
+                details.update({
+                    "title": item.get("title", ""),
+                    "season": item.get("season", 0),
+                    "episode": item.get("episode", 0),
+                    "showtitle": item.get("showtitle", ""),
+                    "director": item.get("director", []),
+                    "year": item.get("year", "")
+                })
+                log.debug("Enhanced details loaded", playback_type=playback_type)
+        except Exception as e:
+            log.warning("Failed to get enhanced episode details", error=e)
+            log.debug("Using basic item data", playback_type=playback_type)
+    elif playback_type == "movie":
+        try:
+            log.debug("Getting enhanced details", playback_type=playback_type)
+            movie_response = host.rpc_cached("VideoLibrary.GetMovieDetails", {
+                "movieid": item.get("id"),
+                "properties": plan_properties("movie")[1]
+            })
+            if movie_response and movie_response.get("result"):
+                movie_details = movie_response["result"].get("moviedetails", {})
+                _backfill(item, movie_details, playback_type)
+                # Merge enhanced details with basic item data
+                details.update(movie_details)
+                # Ensure basic item data is preserved
+                details.update({
+                    "title": item.get("title", ""),
+                    "director": item.get("director", []),
+                    "year": item.get("year", "")
+                })
+                log.debug("Enhanced details loaded", playback_type=playback_type)
+        except Exception as e:
+            log.warning("Failed to get enhanced movie details", error=e)
+            log.debug("Using basic item data", playback_type=playback_type)
+    elif playback_type == "song":
+        try:
+            log.debug("Getting enhanced details", playback_type=playback_type)
+            log.debug("Basic item ID", id=item.get("id"))
+            # Get song details using the basic item ID
+            song_response = host.rpc_cached("AudioLibrary.GetSongDetails", {
+                "songid": item.get("id"),
+                "properties": plan_properties("song")[1]
+            })
+            if song_response and song_response.get("result"):
+                song_details = song_response["result"].get("songdetails", {})
+                _backfill(item, song_details, playback_type)
+                details.update(song_details)
+                log.debug("Enhanced details loaded", playback_type=playback_type)
+            
+            # Get album details if we have albumid
+            albumid = song_details.get("albumid")
+            if albumid:
+                try:
+                    album_response = host.rpc_cached("AudioLibrary.GetAlbumDetails", {
+                        "albumid": albumid,
+                        "properties": ["title", "artist", "year", "rating", "fanart", "thumbnail", "genre", "mood", "style", "theme", "albumduration", "playcount", "albumlabel", "compilation", "totaldiscs"]
+                    })
+                    if album_response and album_response.get("result"):
+                        album_details = album_response["result"].get("albumdetails", {})
+                        details["album"] = album_details
+                        log.debug("Enhanced album details loaded", albumid=albumid)
+                except Exception as e:
+                    log.warning("Failed to get album details", error=e)
+            
+            # Get artist details if we have artistid
+            artistid = song_details.get("artistid")
+            if artistid:
+                # Handle artistid as array (take first one) or single value
+                log.debug("Original artistid", artistid=artistid)
+                if isinstance(artistid, list) and len(artistid) > 0:
+                    artistid = artistid[0]
+                    log.debug("Converted artistid", artistid=artistid)
+                try:
+                    artist_response = host.rpc_cached("AudioLibrary.GetArtistDetails", {
+                        "artistid": artistid,
+                        "properties": ["fanart", "thumbnail", "born", "formed", "died", "disbanded", "genre", "mood", "style", "yearsactive"]
+                    })
+                    if artist_response and artist_response.get("result"):
+                        artist_details = artist_response["result"].get("artistdetails", {})
+                        details["artist"] = artist_details
+                        log.debug("Enhanced artist details loaded", artistid=artistid)
+                except Exception as e:
+                    log.warning("Failed to get artist details", error=e)
+            
+            # Ensure basic item data is preserved (but don't overwrite detailed album/artist objects)
+            details.update({
+                "title": item.get("title", ""),
+                "year": item.get("year", "")
+            })
+            
+        except Exception as e:
+            log.warning("Failed to get enhanced song details", error=e)
+            log.debug("Using basic item data", playback_type=playback_type)
+    else:
+        log.debug("Using basic item data", playback_type=playback_type)
+    tracing.record("enrich", enrich_start)
+    return details
+
+
+def fetch_section(host, item, details, name):
+    """
+    Look up the data of a section that is loaded after first paint.
+
+    Args:
+        host (KodiHost): Kodi the item is playing on
+        item (dict): Media item from Kodi API
+        details (dict): Details from fetch_details()
+        name (str): Section name from SECTIONS
+
+    Returns:
+        dict: plot (str), cast (list), or album and artist descriptions for "about"
+    """
+    playback_type = item.get("type", "unknown")
+    if name not in SECTIONS.get(playback_type, ()):
+        raise ValueError(f"Unknown section {name!r} for {playback_type}")
+
+    if playback_type in ("movie", "episode"):
+        method, id_key, result_key = {
+            "movie": ("VideoLibrary.GetMovieDetails", "movieid", "moviedetails"),
+            "episode": ("VideoLibrary.GetEpisodeDetails", "episodeid", "episodedetails"),
+        }[playback_type]
+        response = host.rpc_cached(method, {id_key: item.get("id"), "properties": [name]})
+        result = response.get("result", {}).get(result_key, {}) if response else {}
+        return {name: result.get(name, "" if name == "plot" else [])}
+
+    album, artist = {}, {}
+    albumid = details.get("albumid")
+    if albumid:
+        response = host.rpc_cached("AudioLibrary.GetAlbumDetails", {"albumid": albumid, "properties": ["description"]})
+        album = response.get("result", {}).get("albumdetails", {}) if response else {}
+    artistid = details.get("artistid")
+    if isinstance(artistid, list):
+        artistid = artistid[0] if artistid else None
+    if artistid:
+        response = host.rpc_cached("AudioLibrary.GetArtistDetails", {
+            "artistid": artistid,
+            "properties": ["description", "born", "genre", "style"]
+        })
+        artist = response.get("result", {}).get("artistdetails", {}) if response else {}
+    return {"album": album, "artist": artist}
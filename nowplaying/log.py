@@ -0,0 +1,144 @@
+"""
+Logging for Kodi Now Playing application.
+Leveled, rate-limited logging with payload truncation and optional JSON output.
+
+Configured through environment variables:
+    LOG_LEVEL        DEBUG, INFO, WARNING (default), ERROR or OFF
+    LOG_FORMAT       text (default) or json
+    LOG_RATE_LIMIT   Minimum seconds between two records with the same message (default 10, 0 disables)
+    LOG_MAX_PAYLOAD  Maximum characters kept per field value (default 300)
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", "10"))
+LOG_MAX_PAYLOAD = int(os.getenv("LOG_MAX_PAYLOAD", "300"))
+
+_LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "OFF": logging.CRITICAL + 10,
+}
+
+_logger = logging.getLogger("nowplaying")
+
+
+def truncate(value, limit=None):
+    """
+    Render a field value as a string no longer than the payload limit.
+
+    Args:
+        value: Any value; non-strings are rendered with repr()
+        limit (int): Maximum length, defaults to LOG_MAX_PAYLOAD
+
+    Returns:
+        str: The (possibly shortened) text
+    """
+    limit = LOG_MAX_PAYLOAD if limit is None else limit
+    text = value if isinstance(value, str) else repr(value)
+    if limit > 0 and len(text) > limit:
+        return f"{text[:limit]}...(+{len(text) - limit} chars)"
+    return text
+
+
+class _RateLimitFilter(logging.Filter):
+    """
+    Drop records repeating the same message within the configured interval.
+
+    Records are keyed on level and message text, so callers pass a constant
+    message and put variable data in fields. The number of dropped records is
+    attached to the next record that gets through.
+    """
+
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.interval <= 0:
+            return True
+        key = (record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            last, suppressed = self._seen.get(key, (None, 0))
+            if last is not None and now - last < self.interval:
+                self._seen[key] = (last, suppressed + 1)
+                return False
+            self._seen[key] = (now, 0)
+        if suppressed:
+            record.fields = {**getattr(record, "fields", {}), "suppressed": suppressed}
+        return True
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = getattr(record, "fields", {})
+        parts = [f"[{record.levelname}] {record.getMessage()}"]
+        parts.extend(f"{key}={truncate(value)}" for key, value in fields.items())
+        return " ".join(parts)
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "msg": record.getMessage(),
+        }
+        for key, value in getattr(record, "fields", {}).items():
+            if isinstance(value, (int, float, bool)) or value is None:
+                entry[key] = value
+            else:
+                entry[key] = truncate(value)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _configure():
+    level = _LEVELS.get(LOG_LEVEL, logging.WARNING)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(_JsonFormatter() if LOG_FORMAT == "json" else _TextFormatter())
+    handler.addFilter(_RateLimitFilter(LOG_RATE_LIMIT))
+    _logger.handlers = [handler]
+    _logger.setLevel(level)
+    _logger.propagate = False
+    # Per-request access lines from the development server follow the same threshold
+    logging.getLogger("werkzeug").setLevel(max(level, logging.INFO))
+
+
+def enabled(level):
+    """Return True when records at the given level ("debug", "info", ...) are emitted."""
+    return _logger.isEnabledFor(_LEVELS.get(level.upper(), logging.DEBUG))
+
+
+def _log(level, msg, fields):
+    if _logger.isEnabledFor(level):
+        _logger.log(level, msg, extra={"fields": fields})
+
+
+def debug(msg, **fields):
+    _log(logging.DEBUG, msg, fields)
+
+
+def info(msg, **fields):
+    _log(logging.INFO, msg, fields)
+
+
+def warning(msg, **fields):
+    _log(logging.WARNING, msg, fields)
+
+
+def error(msg, **fields):
+    _log(logging.ERROR, msg, fields)
+
+
+_configure()
@@ -0,0 +1,254 @@
+"""
+Artwork proxy for Kodi Now Playing application.
+With ART_MODE=proxy, /media URLs carry a signed reference to the Kodi art path instead of a file
+under /tmp. The image is resolved and streamed from Kodi when the browser asks for it, and the most
+recent images are kept in memory. Background slides always take this route, so they are only
+fetched when shown.
+"""
+import base64
+import hashlib
+import hmac
+import io
+import json
+import os
+import secrets
+import time
+
+import log
+import metrics
+import placeholders
+import tracing
+from artwork import FALLBACK_ART_TYPES, art_sources, extra_fanart, fetch_art, fetch_fallback, resolve_art
+from cache import SizedCache, TTLCache
+
+try:
+    from PIL import Image
+except ImportError:  # Optional dependency, images are then sent at their original size
+    Image = None
+
+ENABLED = os.getenv("ART_MODE", "download").lower() == "proxy"
+# References signed with a per-start key stop working after a restart, which reloads the pages anyway
+SECRET = os.getenv("MEDIA_SECRET", "").encode() or secrets.token_bytes(32)
+CHUNK_SIZE = 64 * 1024
+CACHE_BYTES = int(float(os.getenv("PROXY_CACHE_MB", "64")) * 1024 * 1024)
+# Images larger than this are streamed every time instead of pushing the rest out of the cache
+CACHE_ITEM_BYTES = CACHE_BYTES // 4
+# Vfs URLs Kodi hands out stay valid for a while, so resolving is not repeated per request
+URL_TTL = 300
+# Widths images are scaled down to for ?w=, so a few sizes per image are cached rather than one per screen
+WIDTHS = (320, 640, 960, 1280, 1920, 2560, 3840)
+
+_images = SizedCache("media_proxy", maxbytes=CACHE_BYTES, sizeof=lambda value: len(value[1]))
+_urls = TTLCache("media_proxy_urls", maxsize=256, ttl=URL_TTL)
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload):
+    return _b64encode(hmac.new(SECRET, payload.encode(), hashlib.sha256).digest()[:16])
+
+
+def make_ref(host, item, art_type, raw_path):
+    """Signed, URL-safe reference to one piece of an item's artwork."""
+    # The playing file is only needed to look for artist art in the folders above it
+    fields = [host.name, art_type, raw_path]
+    if art_type in FALLBACK_ART_TYPES:
+        fields.append(item.get("file", ""))
+    payload = _b64encode(json.dumps(fields, separators=(",", ":")).encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def read_ref(ref):
+    """
+    Check and decode a reference from make_ref().
+
+    Returns:
+        tuple: (host name, art type, raw art path, playing file), or None if the reference is invalid
+    """
+    payload, _, signature = ref.partition(".")
+    if not signature or not hmac.compare_digest(signature, _sign(payload)):
+        return None
+    try:
+        fields = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    host_name, art_type, raw_path = fields[:3]
+    return host_name, art_type, raw_path, fields[3] if len(fields) > 3 else ""
+
+
+def art_refs(host, item):
+    """
+    Proxy counterpart of prepare_and_download_art(): nothing is resolved or downloaded here.
+
+    Returns:
+        dict: Art type to file name under /media
+    """
+    return {art_type: f"p/{make_ref(host, item, art_type, raw_path)}.jpg"
+            for art_type, raw_path in art_sources(item).items()}
+
+
+def slide_urls(host, item):
+    """
+    Background slideshow images of an item, as /media/p/ URLs.
+
+    Returns:
+        list: URLs of the extra fanart, without the main fanart
+    """
+    return [f"/media/p/{make_ref(host, item, 'extrafanart', raw_path)}.jpg" for raw_path in extra_fanart(host, item)]
+
+
+def fit_width(width):
+    """Smallest of WIDTHS that covers the requested width."""
+    return next((size for size in WIDTHS if size >= width), WIDTHS[-1])
+
+
+def _scale(data, width):
+    """JPEG of an image scaled down to width, or None if it is not wider or cannot be read."""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.width <= width:
+                return None
+            image.draft("RGB", (width, image.height * width // image.width))
+            image = image.convert("RGB")
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=85)
+        return buffer.getvalue()
+    except Exception as e:
+        log.debug("Could not scale artwork", error=e)
+        return None
+
+
+def _stream(response, key, content_type, art_type, start):
+    """Pass an upstream image through in chunks, caching it if it is small enough."""
+    chunks, size, complete = [], 0, False
+    try:
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            size += len(chunk)
+            if size <= CACHE_ITEM_BYTES:
+                chunks.append(chunk)
+            yield chunk
+        complete = True
+    finally:
+        response.close()
+        outcome = "ok" if complete else "error"
+        metrics.ARTWORK_DOWNLOAD_SECONDS.observe(time.perf_counter() - start, art_type=art_type, outcome=outcome)
+        if complete:
+            metrics.ARTWORK_DOWNLOAD_BYTES.observe(size, art_type=art_type)
+            if size <= CACHE_ITEM_BYTES:
+                data = b"".join(chunks)
+                _images.set(key, (content_type, data))
+                placeholders.remember(*key, art_type, data)
+
+
+def open_image(registry, ref, width=None):
+    """
+    Find the image behind a /media/p/ reference.
+
+    Args:
+        registry (Registry): Configured Kodi hosts
+        ref (str): Reference from make_ref()
+        width (int): Scale the image down to about this width (needs Pillow)
+
+    Returns:
+        tuple: (content type, iterable of bytes), or None if the image cannot be served
+    """
+    fields = read_ref(ref)
+    if fields is None:
+        log.warning("Rejected artwork reference with a bad signature")
+        return None
+    if width and Image is not None:
+        return _open_scaled(registry, fields, fit_width(width))
+    return _open(registry, fields)
+
+
+def scaled_file(path, width):
+    """
+    Downloaded artwork file scaled down for ?w=, cached like proxied images.
+
+    Returns:
+        bytes: JPEG data (the file as is when it is not wider), or None when Pillow is missing or the
+        file cannot be read
+    """
+    if Image is None:
+        return None
+    width = fit_width(width)
+    try:
+        # Revalidation replaces files in place, so the modification time is part of the key
+        key = ("file", path, os.stat(path).st_mtime_ns, width)
+        cached = _images.get(key)
+        if cached is not None:
+            return cached[1]
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    data = _scale(data, width) or data
+    _images.set(key, ("image/jpeg", data))
+    return data
+
+
+def _open_scaled(registry, fields, width):
+    host_name, _, raw_path, _ = fields
+    key = (host_name, raw_path, width)
+    cached = _images.get(key)
+    if cached is not None:
+        content_type, data = cached
+        return content_type, [data]
+    image = _open(registry, fields)
+    if image is None:
+        return None
+    content_type, body = image
+    data = b"".join(body)
+    scaled = _scale(data, width)
+    if scaled is not None:
+        content_type, data = "image/jpeg", scaled
+    _images.set(key, (content_type, data))
+    return content_type, [data]
+
+
+def _open(registry, fields):
+    host_name, art_type, raw_path, item_file = fields
+    key = (host_name, raw_path)
+    cached = _images.get(key)
+    if cached is not None:
+        content_type, data = cached
+        return content_type, [data]
+
+    host = registry.get(host_name)
+    if host is None:
+        return None
+    item = {"file": item_file}
+    image_url = _urls.get(key)
+    if image_url is None:
+        image_url = resolve_art(host, item, art_type, raw_path)
+        if not image_url:
+            return None
+        _urls.set(key, image_url)
+
+    start = time.perf_counter()
+    try:
+        log.debug("Proxying artwork", url=image_url)
+        response = fetch_art(host, raw_path, image_url, stream=True)
+        if response.status_code == 401:
+            response.close()
+            # Same fallback as downloading to /tmp, without the stream
+            response = fetch_fallback(host, item, art_type)
+            if response is None:
+                raise RuntimeError("401 and no fallback artwork")
+        response.raise_for_status()
+    except Exception as e:
+        metrics.ARTWORK_DOWNLOAD_SECONDS.observe(time.perf_counter() - start, art_type=art_type, outcome="error")
+        tracing.record(f"art.{art_type}.download", start)
+        log.error("Failed to proxy artwork", art_type=art_type, error=e)
+        _urls.pop(key)
+        return None
+    tracing.record(f"art.{art_type}.download", start)
+    content_type = response.headers.get("Content-Type", "image/jpeg")
+    return content_type, _stream(response, key, content_type, art_type, start)
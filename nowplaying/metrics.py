@@ -0,0 +1,205 @@
+"""
+Metrics for Kodi Now Playing application.
+Thread-safe counters, histograms and gauges rendered in the Prometheus text format at /metrics.
+"""
+import bisect
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (1024, 10240, 102400, 512000, 1048576, 5242880, 20971520)
+
+# Clients that polled within this many seconds count as connected
+CLIENT_WINDOW = 30
+
+_registry = []
+
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Monotonically increasing counter, one series per label combination."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def collect(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Bucketed observations with sum and count, one series per label combination."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts plus one overflow slot, then sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def time(self, **labels):
+        """Context manager observing the elapsed wall time of its block."""
+        return _Timer(self, labels)
+
+    def collect(self):
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', bound))} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self.labels
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and "outcome" in self.histogram.labelnames:
+            self.labels.setdefault("outcome", "error")
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Gauge:
+    """Value computed at scrape time by a callback returning {label tuple: value}."""
+
+    def __init__(self, name, documentation, labelnames, callback):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        _registry.append(self)
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for key, value in sorted(self.callback().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+KODI_RPC_SECONDS = Histogram(
+    "kodi_rpc_duration_seconds", "Kodi JSON-RPC call latency", ("host", "method", "outcome"))
+ARTWORK_RESOLVE_SECONDS = Histogram(
+    "artwork_resolve_duration_seconds", "Time to turn a Kodi art path into a download URL", ("art_type", "outcome"))
+ARTWORK_DOWNLOAD_SECONDS = Histogram(
+    "artwork_download_duration_seconds", "Artwork download latency", ("art_type", "outcome"))
+ARTWORK_DOWNLOAD_BYTES = Histogram(
+    "artwork_download_bytes", "Size of downloaded artwork", ("art_type",), buckets=BYTES_BUCKETS)
+ARTWORK_REVALIDATIONS = Counter(
+    "artwork_revalidations_total", "Checks of stored artwork against Kodi by result", ("outcome",))
+RENDER_SECONDS = Histogram(
+    "render_duration_seconds", "HTML generation time", ("media_type",))
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency by route", ("route", "method", "status"))
+PLAYBACK_TRANSITIONS = Counter(
+    "playback_transitions_total", "Confirmed playback changes by kind", ("host", "kind"))
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Cache lookups by result", ("cache", "result"))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def cache_hit(cache):
+    CACHE_REQUESTS.inc(cache=cache, result="hit")
+
+
+def cache_miss(cache):
+    CACHE_REQUESTS.inc(cache=cache, result="miss")
+
+
+def client_seen(address):
+    """Record that a client made a request; used for the connected clients gauge."""
+    now = time.monotonic()
+    with _clients_lock:
+        _clients[address] = now
+
+
+def _connected_clients():
+    cutoff = time.monotonic() - CLIENT_WINDOW
+    with _clients_lock:
+        for address in [a for a, seen in _clients.items() if seen < cutoff]:
+            del _clients[address]
+        return {(): len(_clients)}
+
+
+def _cache_hit_ratios():
+    with CACHE_REQUESTS._lock:
+        values = dict(CACHE_REQUESTS._values)
+    ratios = {}
+    for cache in {cache for cache, _ in values}:
+        hits = values.get((cache, "hit"), 0)
+        total = hits + values.get((cache, "miss"), 0)
+        ratios[(cache,)] = round(hits / total, 4) if total else 0
+    return ratios
+
+
+Gauge("cache_hit_ratio", "Share of cache lookups that were hits", ("cache",), _cache_hit_ratios)
+Gauge("connected_clients", f"Distinct client addresses seen in the last {CLIENT_WINDOW}s", (), _connected_clients)
+
+
+def render():
+    """
+    Render every registered metric.
+
+    Returns:
+        str: Prometheus text exposition format
+    """
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
@@ -2,20 +2,22 @@
 Movie-specific HTML generation for Kodi Now Playing application.
 Handles movie display with discart spinning animation and movie-specific layout.
 """
+from parser import profile_style, runtime_config
 
-def generate_html(item, session_id, downloaded_art, progress_data, details):
+
+def generate_content(item, downloaded_art, progress_data, details):
     """
-    Generate HTML for movie display.
+    Generate the item-specific part of the movie page.
+    The client runtime swaps this into an open page when the next movie starts.
     
     Args:
         item (dict): Media item from Kodi API
-        session_id (str): Session ID for file naming
         downloaded_art (dict): Downloaded artwork files
         progress_data (dict): Playback progress information
         details (dict): Detailed media information
         
     Returns:
-        str: HTML content for movie display
+        dict: content (inner HTML of the .content element), background (fanart URL) and images (artwork URLs to preload)
     """
     # Extract URLs for artwork
     poster_url = f"/media/{downloaded_art.get('poster')}" if downloaded_art.get("poster") else ""
@@ -27,7 +29,6 @@ def generate_html(item, session_id, downloaded_art, progress_data, details):
     
     # Extract movie information
     title = item.get("title", "Untitled")
-    plot = item.get("plot", item.get("description", ""))
     
     # Extract IMDb ID and construct URL - ensure details is a dict
     if not isinstance(details, dict):
@@ -41,7 +42,6 @@ def generate_html(item, session_id, downloaded_art, progress_data, details):
     
     # Initialize defaults
     director_names = "N/A"
-    cast_names = "N/A"
     hdr_type = "SDR"
     audio_languages = "N/A"
     subtitle_languages = "N/A"
@@ -77,11 +77,6 @@ def generate_html(item, session_id, downloaded_art, progress_data, details):
         if isinstance(director_list, list):
             director_names = ", ".join(director_list) or "N/A"
     
-    # Cast - limit to top 10 actors
-    cast_list = details.get("cast", [])
-    if isinstance(cast_list, list) and cast_list:
-        cast_names = ", ".join([c.get("name") for c in cast_list[:10] if isinstance(c, dict) and c.get("name")]) or "N/A"
-    
     # Genre and formatting
     genre_list = details.get("genre", [])
     if not isinstance(genre_list, list):
@@ -106,9 +101,98 @@ def generate_html(item, session_id, downloaded_art, progress_data, details):
     # Playback progress
     elapsed = progress_data.get("elapsed", 0)
     duration = progress_data.get("duration", 0)
-    percent = int((elapsed / duration) * 100) if duration else 0
-    paused = progress_data.get("paused", False)
     
+    content = f"""
+        <div class="poster-container">
+          {"<div class='discart-wrapper'><img class='discart' src='" + discart_url + "' /></div>" if discart_url else ""}
+          {f"<img class='poster' src='{poster_url}' />" if poster_url else ""}
+          <!-- Clearart removed as requested -->
+        </div>
+        <div>
+          {f"<img class='logo' src='{clearlogo_url}' />" if clearlogo_url else (f"<img class='banner' src='{banner_url}' />" if banner_url else f"<h2 style='margin-bottom: 4px;'>🎬 {title}</h2>")}
+          {f"<p><strong>Director:</strong> {director_names}</p>" if director_names and director_names != "N/A" else ""}
+          <div data-section="cast"></div>
+          <div data-section="plot"></div>
+          <div class="badges">
+            {rating_html}
+            <a href="{imdb_url}" target="_blank" class="badge-imdb">
+              <span>IMDb</span>
+            </a>
+            <span class="badge">{resolution}</span>
+            <span class="badge">{video_codec}</span>
+            <span class="badge">{audio_codec} {channels}ch</span>
+            <span class="badge">HDR: {hdr_type}</span>
+            <span class="badge">Audio: {audio_languages}</span>
+            <span class="badge">Subs: {subtitle_languages}</span>
+            {"".join(f"<span class='badge'>{g}</span>" for g in genre_badges)}
+          </div>
+          <div class="progress">
+            <div class="bar"></div>
+          </div>
+          <p class="small">
+            <span id="elapsed">{elapsed//60}:{elapsed%60:02}</span> / {duration//60}:{duration%60:02}
+          </p>
+        </div>
+    """
+    return {
+        "content": content,
+        "background": fanart_url,
+        "images": [url for url in (poster_url, discart_url, clearlogo_url, banner_url, fanart_url) if url],
+    }
+
+
+def generate_section(name, data):
+    """
+    Generate a movie page section that is loaded after first paint.
+    
+    Args:
+        name (str): "plot" or "cast"
+        data (dict): Section data from library.fetch_section
+        
+    Returns:
+        str: HTML for the section placeholder
+    """
+    if name == "plot":
+        plot = data.get("plot", "")
+        return f"<h3 style='margin-top:20px;'>📖 Plot</h3><p style='max-width:600px;'>{plot}</p>" if plot and plot.strip() else ""
+    if name == "cast":
+        # Cast - limit to top 10 actors
+        cast_list = data.get("cast", [])
+        cast_names = "N/A"
+        if isinstance(cast_list, list) and cast_list:
+            cast_names = ", ".join([c.get("name") for c in cast_list[:10] if isinstance(c, dict) and c.get("name")]) or "N/A"
+        return f"<p><strong>Cast:</strong> {cast_names}</p>" if cast_names and cast_names != "N/A" else ""
+    raise ValueError(f"Unknown section: {name}")
+
+
+def generate_html(item, session_id, downloaded_art, progress_data, details, host_path="", profile="full"):
+    """
+    Generate HTML for movie display.
+    
+    Args:
+        item (dict): Media item from Kodi API
+        session_id (str): Session ID for file naming
+        downloaded_art (dict): Downloaded artwork files
+        progress_data (dict): Playback progress information
+        details (dict): Detailed media information
+        host_path (str): Route suffix of the Kodi host, e.g. "/livingroom" ("" for the default host)
+        profile (str): Render profile, "low" swaps the animations for static styles
+        
+    Returns:
+        str: HTML content for movie display
+    """
+    page = generate_content(item, downloaded_art, progress_data, details)
+    fanart_url = page["background"]
+    content = page["content"]
+
+    # Playback progress
+    elapsed = progress_data.get("elapsed", 0)
+    duration = progress_data.get("duration", 0)
+    percent = int((elapsed / duration) * 100) if duration else 0
+
+    # Client runtime settings for this Kodi host
+    runtime = runtime_config(item, progress_data, host_path, profile)
+
     # Generate HTML
     html = f"""
     <html>
@@ -375,61 +459,9 @@ def generate_html(item, session_id, downloaded_art, progress_data, details):
         .content.no-marquee {{
           margin-top: 20px;
         }}
-      </style>
+      </style>{profile_style(profile)}
+      <script src="/static/nowplaying.js"></script>
       <script>
-        let elapsed = {elapsed};
-        let duration = {duration};
-        let paused = {str(paused).lower()};
-        let lastPlaybackState = null;
-
-        function updateTime() {{
-          if (!paused && elapsed < duration) {{
-            elapsed++;
-            let percent = Math.floor((elapsed / duration) * 100);
-            document.querySelector('.bar').style.width = percent + '%';
-            let min = Math.floor(elapsed / 60);
-            let sec = elapsed % 60;
-            document.getElementById('elapsed').textContent = min + ':' + (sec < 10 ? '0' : '') + sec;
-          }}
-        }}
-
-        function resyncTime() {{
-          fetch('/nowplaying?json=1')
-            .then(res => res.json())
-            .then(data => {{
-              elapsed = data.elapsed;
-              duration = data.duration;
-              paused = data.paused;
-            }});
-        }}
-
-        function checkPlaybackChange() {{
-          fetch('/poll_playback')
-            .then(res => {{
-              if (!res.ok) {{
-                throw new Error(`HTTP ${{res.status}}`);
-              }}
-              return res.json();
-            }})
-            .then(data => {{
-              const currentState = data.playing;
-              if (lastPlaybackState === null) {{
-                lastPlaybackState = currentState;
-              }} else if (currentState !== lastPlaybackState) {{
-                document.body.classList.add('fade-out');
-                setTimeout(() => {{
-                  window.location.href = '/'; // Redirect to root when playback stops
-                }}, 1500);
-              }}
-              lastPlaybackState = currentState;
-            }})
-            .catch(error => {{
-              console.error('Polling error:', error);
-              // Retry after shorter interval on error
-              setTimeout(checkPlaybackChange, 2000);
-            }});
-        }}
-
         function toggleMarquee() {{
           const marquee = document.querySelector('.marquee');
           const toggle = document.querySelector('.marquee-toggle');
@@ -447,9 +479,7 @@ def generate_html(item, session_id, downloaded_art, progress_data, details):
           }}
         }}
 
-        setInterval(updateTime, 1000);
-        setInterval(resyncTime, 5000);
-        setInterval(checkPlaybackChange, 2000);
+        NowPlaying.start({runtime});
       </script>
     </head>
     <body>
@@ -460,36 +490,7 @@ def generate_html(item, session_id, downloaded_art, progress_data, details):
         </div>
       </div>
       <div class="content">
-        <div class="poster-container">
-          {"<div class='discart-wrapper'><img class='discart' src='" + discart_url + "' /></div>" if discart_url else ""}
-          {f"<img class='poster' src='{poster_url}' />" if poster_url else ""}
-          <!-- Clearart removed as requested -->
-        </div>
-        <div>
-          {f"<img class='logo' src='{clearlogo_url}' />" if clearlogo_url else (f"<img class='banner' src='{banner_url}' />" if banner_url else f"<h2 style='margin-bottom: 4px;'>🎬 {title}</h2>")}
-          {f"<p><strong>Director:</strong> {director_names}</p>" if director_names and director_names != "N/A" else ""}
-          {f"<p><strong>Cast:</strong> {cast_names}</p>" if cast_names and cast_names != "N/A" else ""}
-          {f"<h3 style='margin-top:20px;'>📖 Plot</h3><p style='max-width:600px;'>{plot}</p>" if plot and plot.strip() else ""}
-          <div class="badges">
-            {rating_html}
-            <a href="{imdb_url}" target="_blank" class="badge-imdb">
-              <span>IMDb</span>
-            </a>
-            <span class="badge">{resolution}</span>
-            <span class="badge">{video_codec}</span>
-            <span class="badge">{audio_codec} {channels}ch</span>
-            <span class="badge">HDR: {hdr_type}</span>
-            <span class="badge">Audio: {audio_languages}</span>
-            <span class="badge">Subs: {subtitle_languages}</span>
-            {"".join(f"<span class='badge'>{g}</span>" for g in genre_badges)}
-          </div>
-          <div class="progress">
-            <div class="bar"></div>
-          </div>
-          <p class="small">
-            <span id="elapsed">{elapsed//60}:{elapsed%60:02}</span> / {duration//60}:{duration%60:02}
-          </p>
-        </div>
+        {content}
       </div>
     </body>
     </html>
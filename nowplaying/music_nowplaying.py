@@ -2,20 +2,23 @@
 Music-specific HTML generation for Kodi Now Playing application.
 Handles music display with album poster, discart/cdart spinning animation, and music-specific layout.
 """
+import log
+from parser import profile_style, runtime_config
 
-def generate_html(item, session_id, downloaded_art, progress_data, details):
+
+def generate_content(item, downloaded_art, progress_data, details):
     """
-    Generate HTML for music display.
+    Generate the item-specific part of the music page.
+    The client runtime swaps this into an open page when the next song starts.
     
     Args:
         item (dict): Media item from Kodi API
-        session_id (str): Session ID for file naming
         downloaded_art (dict): Downloaded artwork files
         progress_data (dict): Playback progress information
         details (dict): Detailed media information
         
     Returns:
-        str: HTML content for music display
+        dict: content (inner HTML of the .content element), background (fanart URL) and images (artwork URLs to preload)
     """
     # Extract additional details from the enhanced API calls (define early to avoid variable scope issues)
     # Use safe fallbacks to prevent crashes
@@ -23,7 +26,7 @@ def generate_html(item, session_id, downloaded_art, progress_data, details):
         album_details = details.get("album", {})
         artist_details = details.get("artist", {})
     else:
-        print(f"[WARNING] Details is not a dict: {type(details)}, value: {details}", flush=True)
+        log.warning("Details is not a dict", type=type(details), value=details)
         album_details = {}
         artist_details = {}
         # If details is not a dict, create a safe fallback
@@ -34,7 +37,7 @@ def generate_html(item, session_id, downloaded_art, progress_data, details):
     try:
         # Ensure downloaded_art is a dict
         if not isinstance(downloaded_art, dict):
-            print(f"[WARNING] Downloaded_art is not a dict: {type(downloaded_art)}", flush=True)
+            log.warning("Downloaded_art is not a dict", type=type(downloaded_art))
             downloaded_art = {}
         
         # For music, use thumbnail for album artwork, fallback to poster
@@ -45,21 +48,21 @@ def generate_html(item, session_id, downloaded_art, progress_data, details):
             # Try multiple sources for fanart
             if isinstance(album_details, dict) and album_details.get("fanart"):
                 fanart_url = album_details.get("fanart")
-                print(f"[DEBUG] Using album fanart: {fanart_url}", flush=True)
+                log.debug("Using album fanart", url=fanart_url)
             elif isinstance(artist_details, dict) and artist_details.get("fanart"):
                 fanart_url = artist_details.get("fanart")
-                print(f"[DEBUG] Using artist fanart: {fanart_url}", flush=True)
+                log.debug("Using artist fanart", url=fanart_url)
             elif item.get("art", {}).get("fanart"):
                 fanart_url = item.get("art", {}).get("fanart")
-                print(f"[DEBUG] Using item fanart: {fanart_url}", flush=True)
+                log.debug("Using item fanart", url=fanart_url)
             elif item.get("art", {}).get("albumartist.fanart"):
                 fanart_url = item.get("art", {}).get("albumartist.fanart")
-                print(f"[DEBUG] Using albumartist.fanart: {fanart_url}", flush=True)
+                log.debug("Using albumartist.fanart", url=fanart_url)
             elif item.get("art", {}).get("artist.fanart"):
                 fanart_url = item.get("art", {}).get("artist.fanart")
-                print(f"[DEBUG] Using artist.fanart: {fanart_url}", flush=True)
+                log.debug("Using artist.fanart", url=fanart_url)
     except Exception as e:
-        print(f"[WARNING] Artwork URL generation failed: {e}", flush=True)
+        log.warning("Artwork URL generation failed", error=e)
         album_poster_url = ""
         fanart_url = ""
     # Look for both discart and cdart for music
@@ -90,8 +93,6 @@ def generate_html(item, session_id, downloaded_art, progress_data, details):
     # Get additional song info - ensure details is a dict
     if not isinstance(details, dict):
         details = {}
-    song_comment = details.get("comment", "")
-    song_lyrics = details.get("lyrics", "")
     song_disc = details.get("disc", 0)
     song_votes = details.get("votes", 0)
     song_user_rating = details.get("userrating", 0)
@@ -131,10 +132,10 @@ def generate_html(item, session_id, downloaded_art, progress_data, details):
         artist_details = {"name": artist_names}
     
     # Debug logging
-    print(f"[DEBUG] Album details: {album_details}", flush=True)
-    print(f"[DEBUG] Artist details: {artist_details}", flush=True)
-    print(f"[DEBUG] Fanart URL: {fanart_url}", flush=True)
-    print(f"[DEBUG] Album year: {album_year}, Album rating: {album_rating}", flush=True)
+    log.debug("Album details", album=album_details)
+    log.debug("Artist details", artist=artist_details)
+    log.debug("Fanart URL", url=fanart_url)
+    log.debug("Album year and rating", year=album_year, rating=album_rating)
     
     # Get rating from details or fallback - ensure details is a dict
     if not isinstance(details, dict):
@@ -187,9 +188,115 @@ def generate_html(item, session_id, downloaded_art, progress_data, details):
     # Playback progress
     elapsed = progress_data.get("elapsed", 0)
     duration = progress_data.get("duration", 0)
-    percent = int((elapsed / duration) * 100) if duration else 0
-    paused = progress_data.get("paused", False)
     
+    content = f"""
+        <div class="three-column-layout">
+          <!-- Left Column: Album Cover and Discart -->
+          <div class="column-left">
+            <div class="poster-container">
+              {"<div class='discart-wrapper'><img class='discart' src='" + discart_display_url + "' /></div>" if discart_display_url else ""}
+              {f"<img class='poster' src='{album_poster_url}' />" if album_poster_url else ""}
+              {f"<img class='clearart' src='{clearart_url}' />" if clearart_url else ""}
+            </div>
+          </div>
+          
+          <!-- Middle Column: Clearlogo, Song Info, Rating, Badges, Progress -->
+          <div class="column-middle">
+            {f"<img class='logo' src='{clearlogo_url}' />" if clearlogo_url else (f"<img class='banner' src='{banner_url}' />" if banner_url else f"<h2 style='margin-bottom: 4px;'>🎵 {artist_names}</h2>")}
+            
+            <div class="music-info">
+              <div class="music-badges">
+                {f"<span class='music-badge'>{disc_badge}</span>" if disc_badge else ""}
+                {f"<span class='music-badge'>{track_badge}</span>" if track_badge else ""}
+                {f"<span class='music-badge'>{title_badge}</span>" if title_badge else ""}
+              </div>
+              <div class="album-title">by {artist_names}</div>
+              {f"<div class='album-title'>from {album}" + (f" ({album_year})" if album_year else "") + "</div>" if album else ""}
+              {f"<div class='album-title'>Album Rating: ⭐ {album_rating:.1f}</div>" if album_rating > 0 else ""}
+            </div>
+            
+            <div class="badges">
+              {rating_html}
+              <span class="badge">Audio</span>
+              {f"<span class='badge'>Disc: {song_disc}</span>" if song_disc > 0 else ""}
+              {f"<span class='badge'>{song_channels}ch</span>" if song_channels > 0 else ""}
+              {f"<span class='badge'>Bitrate: {song_bitrate} kbps</span>" if song_bitrate > 0 else ""}
+              {f"<span class='badge'>Sample Rate: {song_samplerate} Hz</span>" if song_samplerate > 0 else ""}
+              {"".join(f"<span class='badge'>{g}</span>" for g in genre_badges)}
+            </div>
+            <div class="progress">
+              <div class="bar"></div>
+            </div>
+            <p class="small">
+              <span id="elapsed">{elapsed//60}:{elapsed%60:02}</span> / {duration//60}:{duration%60:02}
+            </p>
+          </div>
+          
+          <!-- Right Column: Artist Bio and Album Description -->
+          <div class="column-right" data-section="about"></div>
+        </div>
+    """
+    return {
+        "content": content,
+        "background": fanart_url,
+        "images": [url for url in (album_poster_url, discart_display_url, clearart_url, clearlogo_url, banner_url, fanart_url) if url],
+    }
+
+
+def generate_section(name, data):
+    """
+    Generate a music page section that is loaded after first paint.
+    
+    Args:
+        name (str): "about" (album description and artist biography)
+        data (dict): Section data from library.fetch_section
+        
+    Returns:
+        str: HTML for the section placeholder
+    """
+    if name != "about":
+        raise ValueError(f"Unknown section: {name}")
+    album_details = data.get("album") or {}
+    artist_details = data.get("artist") or {}
+    artist_born = artist_details.get("born", "")
+    artist_genre = artist_details.get("genre", [])
+    artist_style = artist_details.get("style", [])
+    html = ""
+    if album_details.get("description"):
+        html += f"<div class='album-description'><div class='music-badges'><span class='music-badge'>Album Description</span></div><p>{album_details.get('description', '')}</p></div>"
+    if artist_details.get("description"):
+        html += f"<div class='album-description'><div class='music-badges'><span class='music-badge'>Artist Biography</span></div>" + (f"<p><strong>Born:</strong> {artist_born}</p>" if artist_born else "") + (f"<p><strong>Genre:</strong> {', '.join(artist_genre)}</p>" if artist_genre else "") + (f"<p><strong>Style:</strong> {', '.join(artist_style)}</p>" if artist_style else "") + f"<p>{artist_details.get('description', '')}</p></div>"
+    return html
+
+
+def generate_html(item, session_id, downloaded_art, progress_data, details, host_path="", profile="full"):
+    """
+    Generate HTML for music display.
+    
+    Args:
+        item (dict): Media item from Kodi API
+        session_id (str): Session ID for file naming
+        downloaded_art (dict): Downloaded artwork files
+        progress_data (dict): Playback progress information
+        details (dict): Detailed media information
+        host_path (str): Route suffix of the Kodi host, e.g. "/livingroom" ("" for the default host)
+        profile (str): Render profile, "low" swaps the animations for static styles
+        
+    Returns:
+        str: HTML content for music display
+    """
+    page = generate_content(item, downloaded_art, progress_data, details)
+    fanart_url = page["background"]
+    content = page["content"]
+
+    # Playback progress
+    elapsed = progress_data.get("elapsed", 0)
+    duration = progress_data.get("duration", 0)
+    percent = int((elapsed / duration) * 100) if duration else 0
+
+    # Client runtime settings for this Kodi host
+    runtime = runtime_config(item, progress_data, host_path, profile)
+
     # Generate HTML
     html = f"""
     <html>
@@ -540,61 +647,9 @@ def generate_html(item, session_id, downloaded_art, progress_data, details):
         .content.no-marquee {{
           margin-top: 20px;
         }}
-      </style>
+      </style>{profile_style(profile)}
+      <script src="/static/nowplaying.js"></script>
       <script>
-        let elapsed = {elapsed};
-        let duration = {duration};
-        let paused = {str(paused).lower()};
-        let lastPlaybackState = null;
-
-        function updateTime() {{
-          if (!paused && elapsed < duration) {{
-            elapsed++;
-            let percent = Math.floor((elapsed / duration) * 100);
-            document.querySelector('.bar').style.width = percent + '%';
-            let min = Math.floor(elapsed / 60);
-            let sec = elapsed % 60;
-            document.getElementById('elapsed').textContent = min + ':' + (sec < 10 ? '0' : '') + sec;
-          }}
-        }}
-
-        function resyncTime() {{
-          fetch('/nowplaying?json=1')
-            .then(res => res.json())
-            .then(data => {{
-              elapsed = data.elapsed;
-              duration = data.duration;
-              paused = data.paused;
-            }});
-        }}
-
-        function checkPlaybackChange() {{
-          fetch('/poll_playback')
-            .then(res => {{
-              if (!res.ok) {{
-                throw new Error(`HTTP ${{res.status}}`);
-              }}
-              return res.json();
-            }})
-            .then(data => {{
-              const currentState = data.playing;
-              if (lastPlaybackState === null) {{
-                lastPlaybackState = currentState;
-              }} else if (currentState !== lastPlaybackState) {{
-                document.body.classList.add('fade-out');
-                setTimeout(() => {{
-                  window.location.href = '/'; // Redirect to root when playback stops
-                }}, 1500);
-              }}
-              lastPlaybackState = currentState;
-            }})
-            .catch(error => {{
-              console.error('Polling error:', error);
-              // Retry after shorter interval on error
-              setTimeout(checkPlaybackChange, 2000);
-            }});
-        }}
-
         function toggleMarquee() {{
           const marquee = document.querySelector('.marquee');
           const toggle = document.querySelector('.marquee-toggle');
@@ -612,9 +667,7 @@ def generate_html(item, session_id, downloaded_art, progress_data, details):
           }}
         }}
 
-        setInterval(updateTime, 1000);
-        setInterval(resyncTime, 5000);
-        setInterval(checkPlaybackChange, 2000);
+        NowPlaying.start({runtime});
       </script>
     </head>
     <body>
@@ -625,54 +678,7 @@ def generate_html(item, session_id, downloaded_art, progress_data, details):
         </div>
       </div>
       <div class="content">
-        <div class="three-column-layout">
-          <!-- Left Column: Album Cover and Discart -->
-          <div class="column-left">
-            <div class="poster-container">
-              {"<div class='discart-wrapper'><img class='discart' src='" + discart_display_url + "' /></div>" if discart_display_url else ""}
-              {f"<img class='poster' src='{album_poster_url}' />" if album_poster_url else ""}
-              {f"<img class='clearart' src='{clearart_url}' />" if clearart_url else ""}
-            </div>
-          </div>
-          
-          <!-- Middle Column: Clearlogo, Song Info, Rating, Badges, Progress -->
-          <div class="column-middle">
-            {f"<img class='logo' src='{clearlogo_url}' />" if clearlogo_url else (f"<img class='banner' src='{banner_url}' />" if banner_url else f"<h2 style='margin-bottom: 4px;'>🎵 {artist_names}</h2>")}
-            
-            <div class="music-info">
-              <div class="music-badges">
-                {f"<span class='music-badge'>{disc_badge}</span>" if disc_badge else ""}
-                {f"<span class='music-badge'>{track_badge}</span>" if track_badge else ""}
-                {f"<span class='music-badge'>{title_badge}</span>" if title_badge else ""}
-              </div>
-              <div class="album-title">by {artist_names}</div>
-              {f"<div class='album-title'>from {album}" + (f" ({album_year})" if album_year else "") + "</div>" if album else ""}
-              {f"<div class='album-title'>Album Rating: ⭐ {album_rating:.1f}</div>" if album_rating > 0 else ""}
-            </div>
-            
-            <div class="badges">
-              {rating_html}
-              <span class="badge">Audio</span>
-              {f"<span class='badge'>Disc: {song_disc}</span>" if song_disc > 0 else ""}
-              {f"<span class='badge'>{song_channels}ch</span>" if song_channels > 0 else ""}
-              {f"<span class='badge'>Bitrate: {song_bitrate} kbps</span>" if song_bitrate > 0 else ""}
-              {f"<span class='badge'>Sample Rate: {song_samplerate} Hz</span>" if song_samplerate > 0 else ""}
-              {"".join(f"<span class='badge'>{g}</span>" for g in genre_badges)}
-            </div>
-            <div class="progress">
-              <div class="bar"></div>
-            </div>
-            <p class="small">
-              <span id="elapsed">{elapsed//60}:{elapsed%60:02}</span> / {duration//60}:{duration%60:02}
-            </p>
-          </div>
-          
-          <!-- Right Column: Artist Bio and Album Description -->
-          <div class="column-right">
-            {f"<div class='album-description'><div class='music-badges'><span class='music-badge'>Album Description</span></div><p>{album_details.get('description', '')}</p></div>" if isinstance(album_details, dict) and album_details.get('description') else f"<!-- No album description: album_details={album_details}, type={type(album_details)} -->"}
-            {f"<div class='album-description'><div class='music-badges'><span class='music-badge'>Artist Biography</span></div>" + (f"<p><strong>Born:</strong> {artist_born}</p>" if artist_born else "") + (f"<p><strong>Genre:</strong> {', '.join(artist_genre)}</p>" if artist_genre else "") + (f"<p><strong>Style:</strong> {', '.join(artist_style)}</p>" if artist_style else "") + f"<p>{artist_details.get('description', '')}</p></div>" if isinstance(artist_details, dict) and artist_details.get('description') else f"<!-- No artist description: artist_details={artist_details}, type={type(artist_details)} -->"}
-          </div>
-        </div>
+        {content}
       </div>
     </body>
     </html>
@@ -0,0 +1,478 @@
+// Client runtime shared by the movie, episode and music pages.
+//
+// Ticks the progress bar locally, resyncs it with the server every 5 seconds and
+// long-polls /api/nowplaying for playback changes. When the next item of the same
+// type starts, its content is fetched as a small fragment, the new artwork is
+// preloaded and the page crossfades in place. Only a stop or a switch to another
+// layout (e.g. music to movie) still navigates away.
+//
+// Heavy sections (plot, cast, album and artist descriptions) are placeholders with a
+// data-section attribute and are filled in after first paint. Artwork downloads run
+// while the page is already showing; missing art is hidden once the server reports it.
+//
+// Items with extra fanart get a background slideshow. Only the next slide is preloaded,
+// slides are requested at the viewport width and at most two are held at a time.
+//
+// While the page cannot be seen (background tab, screen off, or an iframe scrolled out of
+// view on a dashboard) timers, polling, the slideshow and CSS animations are suspended, so
+// a hidden page sends no requests. Progress is resynced once when it is visible again.
+// every() gives the idle and rooms pages the same behaviour for their polling.
+//
+// The low render profile (config.lowPower) ticks the progress every tickSeconds instead of
+// every second, resyncs less often and leaves out the blurred background preview.
+(function () {
+  const LONG_POLL_SECONDS = 25;
+  const FADE_MS = 600;
+
+  let config = null;
+  let elapsed = 0;
+  let duration = 0;
+  let paused = true;
+  let etag = null;
+  let leaving = false;
+  // Background slideshow: URLs of the current item, the shown slide and the preloaded next one.
+  // run changes whenever the slideshow restarts, so callbacks of an earlier one stop.
+  const slideshow = { run: 0, urls: [], index: 0, timer: null, waiting: false, next: null, layer: null };
+  // Playback watch: run changes when the page is hidden or shown, so a stale loop stops
+  const watch = { run: 0, controller: null };
+  const visibility = { hidden: document.hidden, offscreen: false, visible: !document.hidden, listeners: [] };
+
+  function isVisible() {
+    return visibility.visible;
+  }
+
+  function updateVisibility() {
+    const visible = !visibility.hidden && !visibility.offscreen;
+    if (visible === visibility.visible) return;
+    visibility.visible = visible;
+    document.documentElement.classList.toggle('np-suspended', !visible);
+    visibility.listeners.forEach(callback => callback(visible));
+  }
+
+  function watchVisibility() {
+    const style = document.createElement('style');
+    style.textContent = 'html.np-suspended *, html.np-suspended *::before, html.np-suspended *::after ' +
+      '{ animation-play-state: paused !important; }';
+    document.head.appendChild(style);
+    document.documentElement.classList.toggle('np-suspended', !visibility.visible);
+    document.addEventListener('visibilitychange', () => {
+      visibility.hidden = document.hidden;
+      updateVisibility();
+    });
+    if (window.IntersectionObserver) {
+      // Inside an iframe this follows the frame's visibility in the top-level viewport
+      new IntersectionObserver(entries => {
+        visibility.offscreen = !entries[entries.length - 1].isIntersecting;
+        updateVisibility();
+      }).observe(document.documentElement);
+    }
+  }
+
+  // Called with true or false whenever the page becomes visible or hidden
+  function onVisibility(callback) {
+    visibility.listeners.push(callback);
+  }
+
+  // setInterval that only runs while the page is visible, and runs once right away when it is shown again
+  function every(ms, callback) {
+    let timer = null;
+    const schedule = visible => {
+      clearInterval(timer);
+      timer = visible ? setInterval(callback, ms) : null;
+    };
+    onVisibility(visible => {
+      if (visible) callback();
+      schedule(visible);
+    });
+    schedule(isVisible());
+  }
+
+  function formatTime(seconds) {
+    const min = Math.floor(seconds / 60);
+    const sec = seconds % 60;
+    return min + ':' + (sec < 10 ? '0' : '') + sec;
+  }
+
+  function renderProgress() {
+    const bar = document.querySelector('.bar');
+    if (bar && duration) {
+      bar.style.width = Math.floor((elapsed / duration) * 100) + '%';
+    }
+    const label = document.getElementById('elapsed');
+    if (label) {
+      label.textContent = formatTime(elapsed);
+    }
+  }
+
+  function setProgress(progress) {
+    elapsed = progress.elapsed;
+    duration = progress.duration;
+    paused = progress.paused;
+    renderProgress();
+  }
+
+  function updateTime() {
+    if (!paused && elapsed < duration) {
+      elapsed = Math.min(elapsed + (config.tickSeconds || 1), duration);
+      renderProgress();
+    }
+  }
+
+  function resyncTime() {
+    fetch(config.resyncUrl)
+      .then(res => res.json())
+      .then(data => {
+        elapsed = data.elapsed;
+        duration = data.duration;
+        paused = data.paused;
+      })
+      .catch(error => console.error('Resync error:', error));
+  }
+
+  function leave() {
+    if (leaving) return;
+    leaving = true;
+    document.body.classList.add('fade-out');
+    setTimeout(() => {
+      window.location.href = config.homeUrl;
+    }, 1500);
+  }
+
+  function wait(ms) {
+    return new Promise(resolve => setTimeout(resolve, ms));
+  }
+
+  function preload(urls) {
+    return Promise.all(urls.map(url => new Promise(resolve => {
+      const img = new Image();
+      img.onload = img.onerror = resolve;
+      img.src = url;
+    })));
+  }
+
+  function loadSections() {
+    const key = config.key;
+    document.querySelectorAll('[data-section]').forEach(placeholder => {
+      fetch(config.sectionUrl + placeholder.dataset.section + '&key=' + encodeURIComponent(key))
+        .then(res => (res.ok ? res.text() : ''))
+        .then(html => {
+          // Skip sections that arrive after the next item was swapped in
+          if (config.key === key) {
+            placeholder.innerHTML = html;
+          }
+        })
+        .catch(error => console.error('Section error:', error));
+    });
+  }
+
+  function afterFirstPaint(callback) {
+    const run = () => requestAnimationFrame(() => setTimeout(callback, 0));
+    if (document.readyState === 'loading') {
+      document.addEventListener('DOMContentLoaded', run);
+    } else {
+      run();
+    }
+  }
+
+  function backgroundUrl() {
+    const match = /url\(["']?([^"')]+)["']?\)/.exec(getComputedStyle(document.body).backgroundImage || '');
+    return match ? match[1] : null;
+  }
+
+  function viewportWidth() {
+    return Math.round(window.innerWidth * (window.devicePixelRatio || 1));
+  }
+
+  function scheduleSlide() {
+    if (!isVisible()) {
+      // Picked up again by the visibility listener in start()
+      slideshow.waiting = true;
+      return;
+    }
+    slideshow.timer = setTimeout(nextSlide, config.slideSeconds * 1000);
+  }
+
+  function stopSlideshow() {
+    clearTimeout(slideshow.timer);
+    slideshow.timer = null;
+    slideshow.waiting = false;
+    slideshow.run++;
+    slideshow.urls = [];
+    slideshow.next = null;
+    if (slideshow.layer) {
+      slideshow.layer.style.opacity = 0;
+    }
+  }
+
+  function preloadSlide() {
+    const url = slideshow.urls[(slideshow.index + 1) % slideshow.urls.length];
+    const img = new Image();
+    img.src = url;
+    // Decoding ahead keeps the crossfade smooth; the previous preload is dropped here
+    const decoded = img.decode ? img.decode() : new Promise((resolve, reject) => {
+      img.onload = resolve;
+      img.onerror = reject;
+    });
+    slideshow.next = { url: url, ready: decoded.then(() => true, () => false) };
+  }
+
+  function slideLayer() {
+    if (!slideshow.layer) {
+      slideshow.layer = document.createElement('div');
+      slideshow.layer.style.cssText = 'position: fixed; inset: 0; z-index: -1; opacity: 0;' +
+        'background: center / cover no-repeat; transition: opacity ' + FADE_MS * 2 + 'ms ease';
+      document.body.appendChild(slideshow.layer);
+    }
+    return slideshow.layer;
+  }
+
+  function nextSlide() {
+    const run = slideshow.run;
+    const next = slideshow.next;
+    next.ready
+      .then(ok => {
+        if (slideshow.run !== run || leaving) return;
+        if (!ok) {
+          // Unreadable slide - leave it out
+          slideshow.urls = slideshow.urls.filter(url => url !== next.url);
+          return;
+        }
+        const layer = slideLayer();
+        layer.style.backgroundImage = "url('" + next.url + "')";
+        layer.style.opacity = 1;
+        return wait(FADE_MS * 2).then(() => {
+          if (slideshow.run !== run) return;
+          // Hand the slide over to the page background and hide the layer again
+          document.body.style.backgroundImage = "url('" + next.url + "')";
+          layer.style.transition = 'none';
+          layer.style.opacity = 0;
+          void layer.offsetWidth;
+          layer.style.transition = 'opacity ' + FADE_MS * 2 + 'ms ease';
+          slideshow.index = slideshow.urls.indexOf(next.url);
+        });
+      })
+      .then(() => {
+        if (slideshow.run !== run || slideshow.urls.length < 2) return;
+        preloadSlide();
+        scheduleSlide();
+      });
+  }
+
+  function loadSlides() {
+    stopSlideshow();
+    if (!config.slidesUrl || !config.slideSeconds) return;
+    const run = slideshow.run;
+    fetch(config.slidesUrl + encodeURIComponent(config.key))
+      .then(res => (res.ok ? res.json() : { slides: [] }))
+      .then(data => {
+        if (slideshow.run !== run || !data.slides.length) return;
+        const width = viewportWidth();
+        const current = backgroundUrl();
+        slideshow.index = 0;
+        slideshow.urls = (current ? [current] : []).concat(data.slides.map(url => url + '?w=' + width));
+        if (slideshow.urls.length < 2) return;
+        preloadSlide();
+        scheduleSlide();
+      })
+      .catch(error => console.error('Slideshow error:', error));
+  }
+
+  function swap(fragment) {
+    const content = document.querySelector('.content');
+    return preload(fragment.images)
+      .then(() => {
+        content.style.transition = 'opacity ' + FADE_MS + 'ms ease';
+        content.style.opacity = 0;
+        return wait(FADE_MS);
+      })
+      .then(() => {
+        content.innerHTML = fragment.content;
+        document.body.style.backgroundImage = fragment.background ? "url('" + fragment.background + "')" : 'none';
+        config.key = fragment.key;
+        setProgress(fragment.progress);
+        content.style.opacity = 1;
+        loadSections();
+        loadSlides();
+      });
+  }
+
+  function changeItem() {
+    return fetch(config.fragmentUrl)
+      .then(res => {
+        if (!res.ok) {
+          throw new Error(`HTTP ${res.status}`);
+        }
+        return res.json();
+      })
+      .then(fragment => {
+        if (!fragment.playing || fragment.type !== config.type) {
+          leave();
+        } else if (fragment.key !== config.key) {
+          return swap(fragment);
+        }
+      })
+      .catch(error => {
+        console.error('Item change error:', error);
+        leave();
+      });
+  }
+
+  function applySnapshot(snapshot) {
+    if (snapshot.error) {
+      // Kodi unreachable - keep showing the last item and retry
+      return;
+    }
+    if (!snapshot.playing) {
+      leave();
+      return;
+    }
+    setProgress(snapshot.progress);
+    if (snapshot.item.key === config.key) {
+      return;
+    }
+    if (snapshot.item.type !== config.type) {
+      leave();
+      return;
+    }
+    return changeItem();
+  }
+
+  function watchPlayback() {
+    if (leaving || !isVisible()) return;
+    const run = watch.run;
+    const headers = etag ? { 'If-None-Match': etag } : {};
+    const url = config.apiUrl + '?details=0&wait=' + (etag ? LONG_POLL_SECONDS : 0);
+    watch.controller = window.AbortController ? new window.AbortController() : null;
+    const signal = watch.controller ? watch.controller.signal : undefined;
+    fetch(url, { headers: headers, cache: 'no-store', signal: signal })
+      .then(res => {
+        if (res.status === 304) {
+          return null;
+        }
+        if (!res.ok) {
+          throw new Error(`HTTP ${res.status}`);
+        }
+        etag = res.headers.get('ETag');
+        return res.json();
+      })
+      .then(snapshot => snapshot && watch.run === run && applySnapshot(snapshot))
+      .then(() => setTimeout(() => watch.run === run && watchPlayback(), 250))
+      .catch(error => {
+        // Hiding the page aborts the long-poll; the loop restarts when it is shown
+        if (watch.run !== run) return;
+        console.error('Polling error:', error);
+        // Retry after a short pause on error
+        setTimeout(() => watch.run === run && watchPlayback(), 2000);
+      });
+  }
+
+  function visibilityChanged(visible) {
+    watch.run++;
+    if (watch.controller) {
+      watch.controller.abort();
+      watch.controller = null;
+    }
+    if (!visible) {
+      if (slideshow.timer) {
+        clearTimeout(slideshow.timer);
+        slideshow.timer = null;
+        slideshow.waiting = true;
+      }
+      return;
+    }
+    if (slideshow.waiting) {
+      slideshow.waiting = false;
+      scheduleSlide();
+    }
+    watchPlayback();
+  }
+
+  // The page is streamed before its artwork is downloaded; the server follows it with
+  // one art() call per art type and a fill() when content has to fall back.
+  function art(type, ok, url) {
+    if (ok) return;
+    document.querySelectorAll('img').forEach(img => {
+      if (img.getAttribute('src') === url) img.style.display = 'none';
+    });
+    if (type === 'fanart') {
+      document.body.style.backgroundImage = 'none';
+    }
+  }
+
+  // Placeholders are tiny previews of fanart and posters (URL to {src, ratio}). They fill
+  // the slots until the real image has loaded, so the page is not blank meanwhile.
+  function showPlaceholder(img, placeholder) {
+    if (img.complete && img.naturalWidth) return;
+    // Posters only have a height in CSS; the ratio gives them their width before loading
+    img.style.aspectRatio = placeholder.ratio;
+    img.style.background = "url('" + placeholder.src + "') center / 100% 100% no-repeat";
+    img.addEventListener('load', () => {
+      img.style.background = '';
+    }, { once: true });
+  }
+
+  function showBackgroundPlaceholder(url, placeholder) {
+    // A blurred full-screen layer is too heavy for low-power screens
+    if (config && config.lowPower) return;
+    const full = new Image();
+    full.src = url;
+    if (full.complete) return;
+    const layer = document.createElement('div');
+    layer.style.cssText = 'position: fixed; inset: 0; z-index: -1; filter: blur(12px); transform: scale(1.1);' +
+      "background: url('" + placeholder.src + "') center / cover no-repeat; transition: opacity " + FADE_MS + 'ms ease';
+    document.body.appendChild(layer);
+    full.onload = full.onerror = () => {
+      layer.style.opacity = 0;
+      setTimeout(() => layer.remove(), FADE_MS);
+    };
+  }
+
+  function placeholders(found) {
+    const background = getComputedStyle(document.body).backgroundImage || '';
+    Object.keys(found).forEach(url => {
+      document.querySelectorAll('img').forEach(img => {
+        if (img.getAttribute('src') === url) {
+          showPlaceholder(img, found[url]);
+        }
+      });
+      if (background.indexOf(url) !== -1) {
+        showBackgroundPlaceholder(url, found[url]);
+      }
+    });
+  }
+
+  function fill(fragment) {
+    document.querySelector('.content').innerHTML = fragment.content;
+    document.body.style.backgroundImage = fragment.background ? "url('" + fragment.background + "')" : 'none';
+    loadSections();
+    loadSlides();
+  }
+
+  function hideBrokenImages() {
+    // Proxied artwork is only resolved when requested, so a missing image shows up as a failed load
+    document.addEventListener('error', event => {
+      if (event.target.tagName === 'IMG') {
+        event.target.style.display = 'none';
+      }
+    }, true);
+  }
+
+  function start(options) {
+    config = options;
+    hideBrokenImages();
+    elapsed = options.elapsed;
+    duration = options.duration;
+    paused = options.paused;
+    onVisibility(visibilityChanged);
+    // every() also resyncs the progress once the page is visible again
+    every((options.tickSeconds || 1) * 1000, updateTime);
+    every((options.resyncSeconds || 5) * 1000, resyncTime);
+    afterFirstPaint(loadSections);
+    afterFirstPaint(loadSlides);
+    watchPlayback();
+  }
+
+  watchVisibility();
+
+  window.NowPlaying = { start: start, art: art, fill: fill, placeholders: placeholders, every: every };
+})();
@@ -2,6 +2,31 @@
 Media type parser for Kodi Now Playing application.
 Determines whether the current media is a movie or TV episode and routes to appropriate handler.
 """
+import json
+import os
+
+import metrics
+
+# Seconds each background slide is shown when an item has extra fanart, 0 to turn the slideshow off
+SLIDESHOW_SECONDS = int(os.getenv("SLIDESHOW_SECONDS", "30"))
+
+# Render profiles: "full", or "low" for kiosks on slow hardware (e.g. Raspberry Pi). ?profile= overrides
+PROFILES = ("full", "low")
+RENDER_PROFILE = os.getenv("RENDER_PROFILE", "full").lower()
+# Widths opaque artwork is scaled down to with the low profile; transparent art (discart, clearlogo, ...) stays
+LOW_POWER_WIDTHS = {"fanart": 1280, "poster": 480, "thumbnail": 480}
+
+# Static replacements for the effects that repaint every frame: the spinning discart with its drop shadow,
+# the glowing marquee, the blurred content backdrop and the fixed background
+LOW_POWER_CSS = """
+      <style>
+        body { background-attachment: scroll !important; }
+        .discart { animation: none !important; filter: none !important; }
+        .marquee::before, .marquee-toggle::before { animation: none !important; }
+        .marquee-text { animation: none !important; text-shadow: 0 0 10px #ff6b35, 2px 2px 4px rgba(0,0,0,0.8) !important; }
+        .content { backdrop-filter: none !important; }
+      </style>
+"""
 
 def infer_playback_type(item):
     """
@@ -23,6 +48,86 @@ def infer_playback_type(item):
         return "movie"
     return "unknown"
 
+def item_key(item):
+    """
+    Identity of a playing item, used to tell a new item from progress on the same one.
+
+    Args:
+        item (dict): Media item from Kodi API
+
+    Returns:
+        str: Key made of type, library ID and file
+    """
+    return f"{item.get('type', 'unknown')}:{item.get('id', '')}:{item.get('file', '')}"
+
+def render_profile(requested=None):
+    """
+    Render profile of a request.
+
+    Args:
+        requested (str): ?profile= value, RENDER_PROFILE when missing
+
+    Returns:
+        str: One of PROFILES
+    """
+    profile = (requested or RENDER_PROFILE).lower()
+    return profile if profile in PROFILES else "full"
+
+def art_variants(downloaded_art, profile):
+    """
+    Artwork files as pages of a profile link them: the low profile asks /media for smaller copies.
+
+    Args:
+        downloaded_art (dict): Art type to file name under /media
+        profile (str): Render profile
+
+    Returns:
+        dict: Art type to file name, with a ?w= width where the profile scales the image
+    """
+    if profile != "low":
+        return downloaded_art
+    return {art_type: f"{filename}?w={LOW_POWER_WIDTHS[art_type]}" if art_type in LOW_POWER_WIDTHS else filename
+            for art_type, filename in downloaded_art.items()}
+
+def profile_style(profile):
+    """Extra <style> block a profile adds after the renderer's own styles."""
+    return LOW_POWER_CSS if profile == "low" else ""
+
+def runtime_config(item, progress_data, host_path="", profile="full"):
+    """
+    Settings for the shared client runtime (nowplaying.js), as a JavaScript object literal.
+
+    Args:
+        item (dict): Media item from Kodi API
+        progress_data (dict): Playback progress information
+        host_path (str): Route suffix of the Kodi host, e.g. "/livingroom" ("" for the default host)
+        profile (str): Render profile; "low" ticks less often and leaves out the slideshow
+
+    Returns:
+        str: JSON safe to embed in a <script> block
+    """
+    low = profile == "low"
+    # Fragments carry the profile, so swapped-in items link the same art variants
+    suffix = "&profile=low" if low else ""
+    config = {
+        "type": infer_playback_type(item),
+        "key": item_key(item),
+        "elapsed": progress_data.get("elapsed", 0),
+        "duration": progress_data.get("duration", 0),
+        "paused": progress_data.get("paused", False),
+        "apiUrl": f"/api/nowplaying{host_path}",
+        "fragmentUrl": f"/nowplaying{host_path}?fragment=1{suffix}",
+        "sectionUrl": f"/nowplaying{host_path}?section=",
+        "slidesUrl": f"/nowplaying{host_path}?slides=1&key=",
+        "slideSeconds": 0 if low else SLIDESHOW_SECONDS,
+        "resyncUrl": f"/nowplaying{host_path}?json=1",
+        "homeUrl": (f"/nowplaying{host_path}" if host_path else "/") + ("?profile=low" if low else ""),
+        "tickSeconds": 5 if low else 1,
+        "resyncSeconds": 30 if low else 5,
+        "lowPower": low,
+    }
+    return json.dumps(config).replace("<", "\\u003c")
+
 def get_media_handler(playback_type):
     """
     Get the appropriate handler module for the media type.
@@ -45,7 +150,7 @@ def get_media_handler(playback_type):
     else:
         raise ValueError(f"Unknown playback type: {playback_type}")
 
-def route_media_display(item, session_id, downloaded_art, progress_data, details):
+def route_media_display(item, session_id, downloaded_art, progress_data, details, host_path="", profile="full"):
     """
     Route media display to the appropriate handler based on media type.
     
@@ -55,6 +160,8 @@ def route_media_display(item, session_id, downloaded_art, progress_data, details
         downloaded_art (dict): Downloaded artwork files
         progress_data (dict): Playback progress information
         details (dict): Detailed media information
+        host_path (str): Route suffix of the Kodi host, e.g. "/livingroom" ("" for the default host)
+        profile (str): Render profile from render_profile()
         
     Returns:
         str: HTML content for the media display
@@ -62,4 +169,45 @@ def route_media_display(item, session_id, downloaded_art, progress_data, details
     playback_type = infer_playback_type(item)
     handler = get_media_handler(playback_type)
     
-    return handler.generate_html(item, session_id, downloaded_art, progress_data, details)
+    with metrics.RENDER_SECONDS.time(media_type=playback_type):
+        return handler.generate_html(item, session_id, art_variants(downloaded_art, profile), progress_data, details,
+                                     host_path, profile)
+
+def route_media_content(item, downloaded_art, progress_data, details, profile="full"):
+    """
+    Render only the swappable content of the media page, for in-place updates.
+    
+    Args:
+        item (dict): Media item from Kodi API
+        downloaded_art (dict): Downloaded artwork files
+        progress_data (dict): Playback progress information
+        details (dict): Detailed media information
+        profile (str): Render profile from render_profile()
+        
+    Returns:
+        dict: type, key, content, background and images
+    """
+    playback_type = infer_playback_type(item)
+    handler = get_media_handler(playback_type)
+    
+    with metrics.RENDER_SECONDS.time(media_type=playback_type):
+        page = handler.generate_content(item, art_variants(downloaded_art, profile), progress_data, details)
+    return {"type": playback_type, "key": item_key(item), **page}
+
+def route_media_section(item, name, data):
+    """
+    Render a section that the page loads after first paint (plot, cast, album/artist description).
+    
+    Args:
+        item (dict): Media item from Kodi API
+        name (str): Section name
+        data (dict): Section data from library.fetch_section
+        
+    Returns:
+        str: HTML fragment for the section
+    """
+    playback_type = infer_playback_type(item)
+    handler = get_media_handler(playback_type)
+    
+    with metrics.RENDER_SECONDS.time(media_type=f"{playback_type}.{name}"):
+        return handler.generate_section(name, data)
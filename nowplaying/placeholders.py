@@ -0,0 +1,122 @@
+"""
+Artwork placeholders for Kodi Now Playing application.
+Tiny blurred previews of fanart and posters, inlined into the page so those slots are not empty
+while the full images load. Made with Pillow when it is installed; without it pages have none.
+Each preview is kept with its art in the persistent store, so stored art keeps it across restarts.
+"""
+import base64
+import io
+
+import log
+import store
+from cache import TTLCache
+
+try:
+    from PIL import Image
+except ImportError:  # Optional dependency
+    Image = None
+
+ENABLED = Image is not None
+# Transparent art (logos, clearart, discart) would only show a smudge behind itself
+TYPES = ("fanart", "poster", "season.poster", "thumbnail")
+# Longest side of the preview in pixels; browsers blur it when scaling it up
+PREVIEW_SIZE = 16
+
+# Placeholder per (host, art path); {} for art known to have none
+_previews = TTLCache("placeholders", maxsize=512)
+
+
+def make(data):
+    """
+    Make a placeholder from image bytes.
+
+    Args:
+        data (bytes): Encoded image
+
+    Returns:
+        dict: src (data URI of the preview) and ratio (width / height of the full image), or None
+    """
+    if not ENABLED:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+            # Lets the JPEG decoder scale down while decoding instead of decoding every pixel
+            image.draft("RGB", (PREVIEW_SIZE * 4, PREVIEW_SIZE * 4))
+            preview = image.convert("RGB")
+        preview.thumbnail((PREVIEW_SIZE, PREVIEW_SIZE), Image.BOX)
+        buffer = io.BytesIO()
+        preview.save(buffer, "JPEG", quality=60)
+    except Exception as e:
+        log.debug("Could not make artwork placeholder", error=e)
+        return None
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return {"src": f"data:image/jpeg;base64,{encoded}", "ratio": round(width / height, 4) if height else 1}
+
+
+def remember(host_name, raw_path, art_type, data):
+    """
+    Make the placeholder of a downloaded image and keep it for later pages.
+
+    Returns:
+        dict: The placeholder, or None if the art type has none or it could not be made
+    """
+    if not ENABLED or art_type not in TYPES:
+        return None
+    placeholder = make(data)
+    if placeholder:
+        _previews.set((host_name, raw_path), placeholder)
+    return placeholder
+
+
+def forget(host_name, raw_path):
+    """Drop the placeholder of an image that changed, so the next download makes a new one."""
+    _previews.pop((host_name, raw_path))
+
+
+def _load(host_name, raw_path):
+    """Placeholder of stored art, made from its file if it was indexed before placeholders were stored."""
+    stored = store.load_placeholder(host_name, raw_path)
+    if stored is None:
+        return None
+    placeholder, filename = stored
+    if placeholder is None:
+        try:
+            with open(store.art_path(filename), "rb") as f:
+                placeholder = make(f.read())
+        except OSError:
+            return None
+    return placeholder
+
+
+def get(host_name, raw_path):
+    """Placeholder of a Kodi art path, or None if it has not been downloaded yet."""
+    if not ENABLED:
+        return None
+    placeholder = _previews.get((host_name, raw_path))
+    if placeholder is None:
+        # Not seen since the start or evicted here; art stored before keeps its placeholder in the store
+        placeholder = _load(host_name, raw_path) or {}
+        _previews.set((host_name, raw_path), placeholder)
+    return placeholder or None
+
+
+def for_page(host, sources, art_files):
+    """
+    Placeholders of the artwork a page links.
+
+    Args:
+        host (KodiHost): Kodi the item is playing on
+        sources (dict): Art type to raw Kodi art path, from artwork.art_sources()
+        art_files (dict): Art type to file name under /media
+
+    Returns:
+        dict: /media URL to placeholder, for the art already seen before
+    """
+    found = {}
+    for art_type, raw_path in sources.items():
+        if art_type in TYPES and art_type in art_files:
+            placeholder = get(host.name, raw_path)
+            if placeholder:
+                found[f"/media/{art_files[art_type]}"] = placeholder
+    return found
@@ -0,0 +1,130 @@
+"""
+Now playing snapshots for Kodi Now Playing application.
+Builds the normalized JSON state served at /api/nowplaying: item, details, artwork URLs and progress.
+"""
+import threading
+import time
+
+import log
+import mediaproxy
+from artwork import prepare_and_download_art
+from cache import TTLCache
+from library import fetch_playing
+from parser import infer_playback_type, item_key
+
+# Restarting the app starts versions over, so ETags carry the start time as well
+BOOT_ID = format(int(time.time()), "x")
+
+# Item, details and artwork per (host, item) - progress and state changes do not rebuild them
+_content = TTLCache("snapshot", maxsize=32)
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+
+def etag(version):
+    """Weak entity tag value for a playback version."""
+    return f"{BOOT_ID}-{version}"
+
+
+def _item_key(host, state):
+    item = state.get("item") or {}
+    return (host.name, state.get("playerid"), item.get("type"), item.get("id"), item.get("file"))
+
+
+def _build_lock(host):
+    with _build_locks_guard:
+        return _build_locks.setdefault(host.name, threading.Lock())
+
+
+def _build_content(host, state):
+    item, details = fetch_playing(host, state["playerid"], state.get("item") or {})
+    try:
+        if mediaproxy.ENABLED:
+            downloaded_art = mediaproxy.art_refs(host, item)
+        else:
+            downloaded_art = prepare_and_download_art(host, item)
+    except Exception as e:
+        log.warning("Artwork download failed, continuing without artwork", host=host.name, error=e)
+        downloaded_art = {}
+    return {"item": item, "details": details, "downloaded_art": downloaded_art,
+            "summary": _summarize(item, details, downloaded_art)}
+
+
+def _summarize(item, details, downloaded_art):
+    return {
+        "type": infer_playback_type(item),
+        "key": item_key(item),
+        "id": item.get("id"),
+        "title": item.get("title") or item.get("label", ""),
+        "showtitle": item.get("showtitle") or None,
+        "season": item.get("season") if item.get("showtitle") else None,
+        "episode": item.get("episode") if item.get("showtitle") else None,
+        "album": item.get("album") or None,
+        "artist": item.get("artist") or [],
+        "year": item.get("year") or None,
+        "file": item.get("file"),
+        "details": details,
+        "art": {art_type: f"/media/{filename}" for art_type, filename in downloaded_art.items()},
+    }
+
+
+def remember(host, player_id, item, details, downloaded_art):
+    """Keep what a full page render fetched, so the page's first snapshot does not fetch it again."""
+    state = {"playerid": player_id, "item": item}
+    _content.set(_item_key(host, state), {"item": item, "details": details, "downloaded_art": downloaded_art,
+                                          "summary": _summarize(item, details, downloaded_art)})
+
+
+def content(host, state):
+    """
+    Item, details and downloaded artwork of what a host is playing, fetched once per item.
+
+    Args:
+        host (KodiHost): Kodi the state belongs to
+        state (dict): Playback state from host.playback() with playing set
+
+    Returns:
+        dict: item (raw Kodi item), details, downloaded_art and summary (normalized item for the API)
+    """
+    key = _item_key(host, state)
+    with _build_lock(host):
+        cached = _content.get(key)
+        if cached is None:
+            cached = _build_content(host, state)
+            _content.set(key, cached)
+    return cached
+
+
+def build(host, state):
+    """
+    Build the snapshot of a host's playback state.
+
+    Args:
+        host (KodiHost): Kodi the state belongs to
+        state (dict): Playback state from host.playback()
+
+    Returns:
+        dict: Versioned snapshot; item fields are None when nothing is playing
+    """
+    snapshot = {
+        "host": host.name,
+        "version": state["version"],
+        "playing": bool(state["playing"]),
+        "error": state["error"],
+        "status": state["status"],
+        "transition": state["transition"],
+        "item": None,
+        "progress": {
+            "elapsed": state["elapsed"],
+            "duration": state["duration"],
+            "percent": int(state["elapsed"] * 100 / state["duration"]) if state["duration"] else 0,
+            "paused": state["paused"],
+            # Clients advance elapsed from this wall-clock time while not paused
+            "as_of": round(time.time(), 3),
+        },
+    }
+    if not state["playing"]:
+        return snapshot
+
+    snapshot["item"] = content(host, state)["summary"]
+    return snapshot
@@ -0,0 +1,170 @@
+"""
+Startup for Kodi Now Playing application.
+Times the imports of the app's own modules and runs a warm-up phase, so the first page after a
+restart does not pay for imports, Kodi connection setup and first-time rendering. /ready reports
+the result.
+"""
+import importlib.abc
+import importlib.machinery
+import os
+import sys
+import threading
+import time
+
+import log
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Seconds warm-up waits for the Kodi hosts; one that is unreachable does not hold up readiness longer
+HOST_TIMEOUT = 10
+
+_imports = {}
+_import_stack = threading.local()
+_status = {"ready": False, "started": None, "finished": None, "steps": {}, "errors": {}}
+_status_lock = threading.Lock()
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """Loader wrapper recording how long a module takes to execute, with and without its own app imports."""
+
+    def __init__(self, loader, name):
+        self.loader = loader
+        self.name = name
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        stack = _import_stack.__dict__.setdefault("children", [])
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += total
+            # Third-party modules a module imports first count towards its own time
+            _imports[self.name] = {"total_ms": round(total * 1000, 2), "self_ms": round((total - children) * 1000, 2)}
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """Finds the app's own top-level modules and wraps their loaders in _TimedLoader."""
+
+    def find_spec(self, name, path, target=None):
+        if "." in name:
+            return None
+        spec = importlib.machinery.PathFinder.find_spec(name, path)
+        if spec is None or not spec.origin or os.path.dirname(os.path.abspath(spec.origin)) != APP_DIR:
+            return None
+        spec.loader = _TimedLoader(spec.loader, name)
+        return spec
+
+
+def track_imports():
+    """Start timing imports of the app's modules; call before importing them."""
+    if not any(isinstance(finder, _ImportTimer) for finder in sys.meta_path):
+        sys.meta_path.insert(0, _ImportTimer())
+
+
+def import_report():
+    """
+    Import times of the app's own modules, slowest first.
+
+    Returns:
+        list: module, total_ms (including the app modules it imports) and self_ms
+    """
+    return sorted(({"module": name, **times} for name, times in _imports.items()),
+                  key=lambda entry: entry["total_ms"], reverse=True)
+
+
+def _step(name, func):
+    start = time.perf_counter()
+    try:
+        func()
+    except Exception as e:
+        log.warning("Warm-up step failed", step=name, error=e)
+        with _status_lock:
+            _status["errors"][name] = str(e)
+    with _status_lock:
+        _status["steps"][name] = round((time.perf_counter() - start) * 1000, 2)
+
+
+def _render_samples(app):
+    # Page HTML differs per item, so there are no templates to keep compiled; rendering one
+    # page per type instead builds the Jinja environment and runs the renderers' code once
+    from flask import render_template_string
+    from parser import get_media_handler
+
+    samples = {
+        "movie": {"type": "movie", "id": 0, "title": "Warm-up", "file": ""},
+        "episode": {"type": "episode", "id": 0, "title": "Warm-up", "showtitle": "Warm-up", "season": 1, "episode": 1, "file": ""},
+        "song": {"type": "song", "id": 0, "title": "Warm-up", "album": "Warm-up", "artist": ["Warm-up"], "file": ""},
+    }
+    progress = {"elapsed": 0, "duration": 0, "paused": True}
+    with app.test_request_context("/nowplaying"):
+        for media_type, item in samples.items():
+            html = get_media_handler(media_type).generate_html(item, "warmup", {}, progress, {}, "")
+            render_template_string(html)
+
+
+def _warm_host(host):
+    # Also opens the host's keep-alive connection for the first page
+    host.probe_version()
+    state = host.poll_once()
+    if state["playing"]:
+        import snapshot
+        snapshot.content(host, state)
+
+
+def _warm_hosts(registry):
+    # Hosts are warmed side by side, and ones still connecting after HOST_TIMEOUT finish after ready
+    threads = {host.name: threading.Thread(target=_step, args=(f"kodi.{host.name}", lambda host=host: _warm_host(host)),
+                                           name=f"warm-up-{host.name}", daemon=True) for host in registry}
+    for thread in threads.values():
+        thread.start()
+    deadline = time.monotonic() + HOST_TIMEOUT
+    for name, thread in threads.items():
+        thread.join(max(0, deadline - time.monotonic()))
+        if thread.is_alive():
+            log.warning("Warm-up step timed out", step=f"kodi.{name}", seconds=HOST_TIMEOUT)
+            with _status_lock:
+                _status["errors"][f"kodi.{name}"] = f"Not done after {HOST_TIMEOUT} s"
+
+
+def warm_up(app, registry):
+    """
+    Prepare the app before it reports ready.
+
+    Cleans up artwork left from before the restart, imports the renderers, renders a sample page per
+    media type, connects to every Kodi and fetches what it is playing. Failures are reported but do
+    not keep the app from being ready.
+    """
+    import store
+    from parser import get_media_handler
+
+    with _status_lock:
+        _status["started"] = time.time()
+    start = time.perf_counter()
+    _step("store", lambda: store.reclaim(store.STARTED))
+    _step("renderers", lambda: [get_media_handler(media_type) for media_type in ("movie", "episode", "song")])
+    _step("templates", lambda: _render_samples(app))
+    _warm_hosts(registry)
+    with _status_lock:
+        _status["ready"] = True
+        _status["finished"] = time.time()
+        _status["total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    log.info("Warm-up finished", ms=_status["total_ms"], errors=len(_status["errors"]))
+
+
+def start_warm_up(app, registry):
+    """Run warm_up() in the background; /ready answers 503 until it is done."""
+    threading.Thread(target=warm_up, args=(app, registry), name="warm-up", daemon=True).start()
+
+
+def status():
+    """Readiness, warm-up step timings in ms, errors and the import report."""
+    with _status_lock:
+        report = {key: (dict(value) if isinstance(value, dict) else value) for key, value in _status.items()}
+    report["imports"] = import_report()
+    return report
@@ -0,0 +1,387 @@
+"""
+Persistent store for Kodi Now Playing application.
+A SQLite index of downloaded artwork (Kodi art path to local file, size, hash, last use, the
+validators to check it against Kodi and its placeholder) and of cached library detail responses, so a restarted
+container can reuse what it already fetched.
+Artwork content is kept once per content hash (blob_<hash>.jpg); the file of each art path is a
+hard link to its blob, and a blob is removed when no indexed art path refers to it any more.
+
+Configured through environment variables:
+    ART_DIR       Folder for artwork files and the index (default /tmp, bind-mounted by the compose file)
+    STORE_PATH    SQLite file (default ART_DIR/nowplaying.db, or none with ART_MODE=proxy; empty to keep
+                  nothing across restarts)
+    ART_CACHE_MB  Artwork kept on disk before the least recently used files are removed (default 1024)
+"""
+import atexit
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import log
+import metrics
+
+ART_DIR = os.getenv("ART_DIR", "/tmp").rstrip("/") or "/"
+# Proxy mode writes nothing to disk, so it keeps no store unless STORE_PATH names one
+_PROXY_MODE = os.getenv("ART_MODE", "download").lower() == "proxy"
+STORE_PATH = os.getenv("STORE_PATH", "" if _PROXY_MODE else os.path.join(ART_DIR, "nowplaying.db"))
+ART_CACHE_BYTES = int(float(os.getenv("ART_CACHE_MB", "1024")) * 1024 * 1024)
+# Writes are queued and committed together at most this often
+FLUSH_INTERVAL = 1.0
+SCHEMA_VERSION = 3
+# Files older than the process are left over from before the restart
+STARTED = time.time()
+# Artwork files this app writes: art_<path hash>.jpg, blob_<content hash>.jpg, the per-session
+# names older versions used, and the <name>.<thread>.part files a crash can leave mid-write
+_ART_FILE = re.compile(r"^(?:art_[0-9a-f]+|blob_[0-9a-f]+|[0-9a-f]{32}_[\w.]+)\.jpg(?:\.\d+\.part)?$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS art (
+    host TEXT NOT NULL,
+    path TEXT NOT NULL,
+    file TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    texture TEXT,
+    validated REAL NOT NULL DEFAULT 0,
+    placeholder TEXT,
+    PRIMARY KEY (host, path)
+);
+CREATE INDEX IF NOT EXISTS art_last_used ON art (last_used);
+CREATE INDEX IF NOT EXISTS art_hash ON art (hash);
+CREATE TABLE IF NOT EXISTS details (
+    host TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (host, key)
+);
+"""
+
+# Statements bringing an older schema version to the next one
+_MIGRATIONS = {
+    1: """
+ALTER TABLE art ADD COLUMN etag TEXT;
+ALTER TABLE art ADD COLUMN last_modified TEXT;
+ALTER TABLE art ADD COLUMN texture TEXT;
+ALTER TABLE art ADD COLUMN validated REAL NOT NULL DEFAULT 0;
+""",
+    2: """
+ALTER TABLE art ADD COLUMN placeholder TEXT;
+""",
+}
+_ART_COLUMNS = ("file", "size", "hash", "last_used", "etag", "last_modified", "texture", "validated", "placeholder")
+
+_local = threading.local()
+_enabled = bool(STORE_PATH)
+_init_lock = threading.Lock()
+_initialized = False
+# Queued writes; art rows are also answered from here until they are committed
+_pending_art = {}
+_pending_details = {}
+_pending_touch = {}
+_pending_validated = {}
+_pending_lock = threading.Lock()
+_flush_wanted = threading.Event()
+_writer = None
+
+
+def art_path(filename):
+    """Local path of an artwork file."""
+    return os.path.join(ART_DIR, filename)
+
+
+def blob_name(digest):
+    """File name of the artwork content with a SHA-256 hex digest."""
+    return f"blob_{digest[:32]}.jpg"
+
+
+def _connect():
+    """Connection of the calling thread, or None if the store is unavailable."""
+    global _enabled, _initialized
+    if not _enabled:
+        return None
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        return conn
+    try:
+        conn = sqlite3.connect(STORE_PATH, timeout=5)
+        with _init_lock:
+            if not _initialized:
+                # Readers do not block the writer thread, and commits skip the full fsync
+                conn.execute("PRAGMA journal_mode=WAL")
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                while version in _MIGRATIONS:
+                    conn.executescript(_MIGRATIONS[version])
+                    version += 1
+                if version != SCHEMA_VERSION:
+                    conn.executescript("DROP TABLE IF EXISTS art; DROP TABLE IF EXISTS details;")
+                conn.executescript(_SCHEMA)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                conn.commit()
+                _initialized = True
+        conn.execute("PRAGMA synchronous=NORMAL")
+    except sqlite3.Error as e:
+        log.warning("Persistent store unavailable, continuing without it", path=STORE_PATH, error=e)
+        _enabled = False
+        return None
+    _local.conn = conn
+    return conn
+
+
+def _start_writer():
+    global _writer
+    with _pending_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, name="store-writer", daemon=True)
+            _writer.start()
+            # Writes still queued when the app exits would otherwise be lost
+            atexit.register(flush)
+    _flush_wanted.set()
+
+
+def _write_loop():
+    while True:
+        _flush_wanted.wait()
+        time.sleep(FLUSH_INTERVAL)
+        _flush_wanted.clear()
+        try:
+            flush()
+        except Exception as e:
+            log.error("Writing the persistent store failed", error=e)
+
+
+def flush():
+    """Commit queued writes in one transaction, then keep artwork within ART_CACHE_MB."""
+    with _pending_lock:
+        art, details = dict(_pending_art), dict(_pending_details)
+        touched, validated = dict(_pending_touch), dict(_pending_validated)
+        _pending_details.clear()
+        _pending_touch.clear()
+        _pending_validated.clear()
+    conn = _connect()
+    if conn is None or not (art or details or touched or validated):
+        return
+    # Content hashes the rewritten rows refer to now, so blobs nothing refers to any more can go
+    replaced = [conn.execute("SELECT hash FROM art WHERE host = ? AND path = ?", key).fetchone() for key in art]
+    old_hashes = {row[0] for row in replaced if row} - {entry["hash"] for entry in art.values()}
+    with conn:
+        conn.executemany(f"INSERT OR REPLACE INTO art (host, path, {', '.join(_ART_COLUMNS)}) VALUES ({', '.join('?' * (len(_ART_COLUMNS) + 2))})",
+                         [(host, path, *(row[column] for column in _ART_COLUMNS)) for (host, path), row in art.items()])
+        conn.executemany("UPDATE art SET last_used = ? WHERE host = ? AND path = ?",
+                         [(used, host, path) for (host, path), used in touched.items()])
+        conn.executemany("UPDATE art SET validated = ? WHERE host = ? AND path = ?",
+                         [(checked, host, path) for (host, path), checked in validated.items()])
+        conn.executemany("INSERT OR REPLACE INTO details (host, key, payload, expires) VALUES (?, ?, ?, ?)",
+                         [(host, key, *row) for (host, key), row in details.items()])
+        conn.execute("DELETE FROM details WHERE expires < ?", (time.time(),))
+    with _pending_lock:
+        for key, row in art.items():
+            if _pending_art.get(key) == row:
+                del _pending_art[key]
+    _release(conn, old_hashes)
+    if art:
+        _evict(conn)
+
+
+def _release(conn, hashes):
+    """Remove the blobs of content hashes that no indexed or queued art path refers to any more."""
+    with _pending_lock:
+        queued = {entry["hash"] for entry in _pending_art.values()}
+    released = 0
+    for digest in set(hashes) - queued:
+        if conn.execute("SELECT 1 FROM art WHERE hash = ? LIMIT 1", (digest,)).fetchone():
+            continue
+        try:
+            os.remove(art_path(blob_name(digest)))
+            released += 1
+        except OSError:
+            pass
+    return released
+
+
+def _evict(conn):
+    """
+    Remove the least recently used artwork while it takes more than ART_CACHE_BYTES.
+
+    Identical images share one blob, so only distinct content counts, and a blob is freed once
+    the last art path referring to it is evicted.
+    """
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM art GROUP BY hash)").fetchone()[0]
+    if total <= ART_CACHE_BYTES:
+        return
+    rows = conn.execute("SELECT host, path, file, size, hash FROM art ORDER BY last_used").fetchall()
+    references = Counter(row[4] for row in rows)
+    removed, unreferenced = [], set()
+    for host, path, filename, size, digest in rows:
+        if total <= ART_CACHE_BYTES:
+            break
+        removed.append((host, path))
+        try:
+            os.remove(art_path(filename))
+        except OSError:
+            pass
+        references[digest] -= 1
+        if not references[digest]:
+            unreferenced.add(digest)
+            total -= size
+    with conn:
+        conn.executemany("DELETE FROM art WHERE host = ? AND path = ?", removed)
+    released = _release(conn, unreferenced)
+    log.info("Evicted least recently used artwork", files=len(removed), images=released)
+
+
+def art_entry(host_name, path):
+    """
+    Index row of a Kodi art path downloaded before, marking it as used.
+
+    Returns:
+        dict: file (name under ART_DIR), size, hash, last_used, etag, last_modified, texture, validated
+        (time it was last checked against Kodi) and placeholder, or None if it is not indexed or the file
+        is gone
+    """
+    key = (host_name, path)
+    with _pending_lock:
+        entry = _pending_art.get(key)
+    if entry is None:
+        conn = _connect()
+        found = conn.execute(f"SELECT {', '.join(_ART_COLUMNS)} FROM art WHERE host = ? AND path = ?",
+                             key).fetchone() if conn else None
+        entry = dict(zip(_ART_COLUMNS, found)) if found else None
+    if entry is None or not os.path.exists(art_path(entry["file"])):
+        metrics.cache_miss("art_index")
+        return None
+    metrics.cache_hit("art_index")
+    with _pending_lock:
+        _pending_touch[key] = time.time()
+        validated = _pending_validated.get(key)
+    _start_writer()
+    return dict(entry, validated=max(entry["validated"], validated or 0),
+                placeholder=json.loads(entry["placeholder"]) if entry["placeholder"] else None)
+
+
+def record_art(host_name, path, filename, size, digest, etag=None, last_modified=None, texture=None,
+               placeholder=None):
+    """
+    Queue the index row of a downloaded artwork file.
+
+    Args:
+        host_name (str): Kodi the art belongs to
+        path (str): Kodi art path
+        filename (str): File name under ART_DIR
+        size (int): File size in bytes
+        digest (str): SHA-256 of the content
+        etag (str): ETag header of the download, if any
+        last_modified (str): Last-Modified header of the download, if any
+        texture (str): Hash Kodi's thumbnail cache keeps of the original, if any
+        placeholder (dict): Blurred preview from placeholders.make(), if any
+    """
+    if not _enabled:
+        return
+    now = time.time()
+    with _pending_lock:
+        _pending_art[(host_name, path)] = {
+            "file": filename, "size": size, "hash": digest, "last_used": now,
+            "etag": etag, "last_modified": last_modified, "texture": texture, "validated": now,
+            "placeholder": json.dumps(placeholder) if placeholder else None,
+        }
+    _start_writer()
+
+
+def load_placeholder(host_name, path):
+    """
+    Placeholder stored with a Kodi art path, without marking the art as used.
+
+    Returns:
+        tuple: (placeholder dict or None if the row has none, file name under ART_DIR), or None if
+        the art path is not indexed
+    """
+    with _pending_lock:
+        entry = _pending_art.get((host_name, path))
+    if entry is not None:
+        found = (entry["placeholder"], entry["file"])
+    else:
+        conn = _connect()
+        found = conn.execute("SELECT placeholder, file FROM art WHERE host = ? AND path = ?",
+                             (host_name, path)).fetchone() if conn else None
+    if found is None:
+        return None
+    return (json.loads(found[0]) if found[0] else None), found[1]
+
+
+def mark_validated(host_name, path):
+    """Queue that a stored artwork file was found unchanged in Kodi just now."""
+    if not _enabled:
+        return
+    with _pending_lock:
+        _pending_validated[(host_name, path)] = time.time()
+    _start_writer()
+
+
+def load_details(host_name, key):
+    """Library detail response stored by save_details(), or None if missing or expired."""
+    with _pending_lock:
+        row = _pending_details.get((host_name, key))
+    if row is None:
+        conn = _connect()
+        row = conn.execute("SELECT payload, expires FROM details WHERE host = ? AND key = ?",
+                           (host_name, key)).fetchone() if conn else None
+    if row is None or row[1] < time.time():
+        return None
+    return json.loads(row[0])
+
+
+def save_details(host_name, key, response, ttl):
+    """Queue a library detail response to be kept for ttl seconds."""
+    if not _enabled:
+        return
+    with _pending_lock:
+        _pending_details[(host_name, key)] = (json.dumps(response), time.time() + ttl)
+    _start_writer()
+
+
+def reclaim(started):
+    """
+    Remove artwork files the index does not know and index rows whose file is gone.
+
+    Only files older than started are touched, so downloads running meanwhile are left alone.
+
+    Returns:
+        int: Number of files removed
+    """
+    conn = _connect()
+    if conn is None:
+        return 0
+    rows = conn.execute("SELECT file, hash FROM art").fetchall()
+    with _pending_lock:
+        rows.extend((entry["file"], entry["hash"]) for entry in _pending_art.values())
+    indexed = {filename for filename, _ in rows} | {blob_name(digest) for _, digest in rows}
+    removed = 0
+    try:
+        names = os.listdir(ART_DIR)
+    except OSError as e:
+        log.warning("Could not list artwork folder", path=ART_DIR, error=e)
+        return 0
+    for name in names:
+        if name in indexed or not _ART_FILE.match(name):
+            continue
+        path = art_path(name)
+        try:
+            if os.path.getmtime(path) < started:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    missing = [row for row in conn.execute("SELECT host, path, file, hash FROM art") if not os.path.exists(art_path(row[2]))]
+    with conn:
+        conn.executemany("DELETE FROM art WHERE host = ? AND path = ?", [row[:2] for row in missing])
+    removed += _release(conn, {row[3] for row in missing})
+    if removed or missing:
+        log.info("Reclaimed orphaned artwork", files=removed, stale_rows=len(missing))
+    return removed
@@ -0,0 +1,139 @@
+"""
+Compact tile for Kodi Now Playing application.
+A small now playing page for dashboard tiles such as a Homarr iframe: poster thumbnail, title, one line of
+context and a progress bar. It uses the same playing item as the pages but only fetches the poster (or
+album cover), and is rendered once per item; progress comes from the JSON API, so an unchanged tile is a 304.
+"""
+import hashlib
+import json
+from html import escape
+
+import artwork
+import mediaproxy
+import metrics
+from cache import TTLCache
+from parser import item_key
+
+# Poster width in pixels, twice the displayed size for high-density screens
+POSTER_WIDTH = 320
+# Art types a tile shows, in order of preference
+POSTER_TYPES = ("poster", "thumbnail")
+
+# (html, etag) per host and item
+_tiles = TTLCache("tile", maxsize=32)
+
+STYLE = """
+body { margin: 0; height: 100vh; display: flex; align-items: center; gap: 12px; padding: 0 12px; box-sizing: border-box;
+  background: #222; color: #fff; font: 14px sans-serif; overflow: hidden; }
+img { height: calc(100vh - 24px); max-height: 240px; border-radius: 4px; }
+div { flex: 1; min-width: 0; }
+p { margin: 0 0 4px; white-space: nowrap; overflow: hidden; text-overflow: ellipsis; }
+.t { font-weight: bold; font-size: 1.15em; }
+.s { color: #bbb; }
+.p { height: 4px; background: #444; border-radius: 2px; margin-top: 8px; }
+#bar { height: 4px; width: 0; background: #4caf50; border-radius: 2px; }
+"""
+
+# Reloads the tile when another item (or nothing) plays and moves the bar; suspended while hidden
+SCRIPT = """
+(function () {
+  const key = %(key)s, bar = document.getElementById('bar');
+  let etag = null, progress = null;
+  function draw() {
+    if (!bar || !progress || !progress.duration) return;
+    const elapsed = progress.elapsed + (progress.paused ? 0 : Date.now() / 1000 - progress.as_of);
+    bar.style.width = Math.min(100, elapsed * 100 / progress.duration) + '%%';
+  }
+  function refresh() {
+    fetch(%(api)s, { headers: etag ? { 'If-None-Match': etag } : {}, cache: 'no-store' })
+      .then(res => {
+        if (res.status === 304) return null;
+        etag = res.headers.get('ETag');
+        return res.json();
+      })
+      .then(snapshot => {
+        if (snapshot && !snapshot.error) {
+          if ((snapshot.playing ? snapshot.item.key : null) !== key) return location.reload();
+          progress = snapshot.progress;
+        }
+        draw();
+      })
+      .catch(() => {});
+  }
+  refresh();
+  NowPlaying.every(5000, refresh);
+})();
+"""
+
+
+def _subtitle(item):
+    if item.get("showtitle"):
+        return f"{item['showtitle']} S{item.get('season') or 0:02d}E{item.get('episode') or 0:02d}"
+    if item.get("artist"):
+        return ", ".join(item["artist"]) + (f" - {item['album']}" if item.get("album") else "")
+    return str(item.get("year") or "")
+
+
+def poster_url(host, item):
+    """
+    URL of the tile's poster. Only this one image is downloaded, in the background, and /media waits for
+    it; the art path's own file is linked rather than the shared blob, so the URL and the tile's ETag are
+    the same before and after the download.
+
+    Returns:
+        str: /media URL, or None if the item has no poster or cover
+    """
+    sources = artwork.art_sources(item)
+    art_type = next((name for name in POSTER_TYPES if sources.get(name)), None)
+    if art_type is None:
+        return None
+    if mediaproxy.ENABLED:
+        return f"/media/p/{mediaproxy.make_ref(host, item, art_type, sources[art_type])}.jpg"
+    artwork.start_downloads(host, item, (art_type,))
+    return f"/media/{artwork.file_name(host.name, sources[art_type])}"
+
+
+def _page(body, key, host_path):
+    script = SCRIPT % {"key": json.dumps(key), "api": json.dumps(f"/api/nowplaying{host_path}?details=0")}
+    html = (f"<!DOCTYPE html><html><head><meta name=\"viewport\" content=\"width=device-width\">"
+            f"<style>{STYLE}</style></head><body>{body}"
+            f"<script src=\"/static/nowplaying.js\"></script><script>{script}</script></body></html>")
+    return html, hashlib.sha1(html.encode()).hexdigest()[:16]
+
+
+def render(host, item, host_path=""):
+    """
+    Tile of the playing item.
+
+    Args:
+        host (KodiHost): Kodi the item is playing on
+        item (dict): Media item from library.fetch_playing()
+        host_path (str): Route suffix of the Kodi host, e.g. "/livingroom" ("" for the default host)
+
+    Returns:
+        tuple: (html, etag)
+    """
+    key = item_key(item)
+    poster = poster_url(host, item)
+    cache_key = (host.name, host_path, key, poster)
+    cached = _tiles.get(cache_key)
+    if cached is not None:
+        return cached
+    with metrics.RENDER_SECONDS.time(media_type="tile"):
+        image = f"<img src=\"{escape(poster)}?w={POSTER_WIDTH}\" alt=\"\">" if poster else ""
+        title = item.get("title") or item.get("label") or ""
+        body = (f"{image}<div><p class=\"t\">{escape(title)}</p>"
+                f"<p class=\"s\">{escape(_subtitle(item))}</p><div class=\"p\"><div id=\"bar\"></div></div></div>")
+        tile = _page(body, key, host_path)
+    _tiles.set(cache_key, tile)
+    return tile
+
+
+def render_idle(host_path=""):
+    """
+    Tile shown while nothing plays.
+
+    Returns:
+        tuple: (html, etag)
+    """
+    return _page("<div><p class=\"s\">Nothing playing</p></div>", None, host_path)
@@ -0,0 +1,167 @@
+"""
+Request tracing for Kodi Now Playing application.
+Collects timed spans per request and reports them as a Server-Timing header and a slowest-requests log.
+
+Configured through environment variables:
+    TRACING        1 to enable span collection and the Server-Timing header (default off)
+    TRACE_SLOWEST  Number of slowest traces kept for /debug/traces (default 20)
+"""
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+
+import log
+
+TRACING = os.getenv("TRACING", "0").lower() in ("1", "true", "yes", "on")
+TRACE_SLOWEST = int(os.getenv("TRACE_SLOWEST", "20"))
+
+_current = contextvars.ContextVar("nowplaying_trace", default=None)
+_slowest = []
+_slowest_lock = threading.Lock()
+_sequence = itertools.count()
+
+
+class Trace:
+    """Spans recorded while handling one request, as (name, offset, duration) in seconds."""
+
+    __slots__ = ("route", "start", "spans", "token")
+
+    def __init__(self, route):
+        self.route = route
+        self.start = time.perf_counter()
+        self.spans = []
+        self.token = None
+
+    def add(self, name, start, end):
+        self.spans.append((name, start - self.start, end - start))
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class _Span:
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.trace.add(self.name, self.start, time.perf_counter())
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name):
+    """
+    Time a block as a span of the current request's trace.
+
+    Args:
+        name (str): Span name, e.g. "render" or "rpc.Player.GetItem"
+
+    Returns:
+        A context manager; a shared no-op one when tracing is off or no trace is active
+    """
+    trace = _current.get()
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name)
+
+
+def record(name, start, end=None):
+    """Record a span from a perf_counter() start time that the caller already measured."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, start, time.perf_counter() if end is None else end)
+
+
+def current():
+    """Return the active Trace, or None."""
+    return _current.get()
+
+
+def begin(route):
+    """Start a trace for the current request when tracing is enabled."""
+    if not TRACING:
+        return None
+    trace = Trace(route)
+    trace.token = _current.set(trace)
+    return trace
+
+
+def finish():
+    """
+    Close the current trace and keep it if it is among the slowest.
+
+    Returns:
+        str: Server-Timing header value, or None when no trace is active
+    """
+    trace = _current.get()
+    if trace is None:
+        return None
+    total = time.perf_counter() - trace.start
+    _current.reset(trace.token)
+
+    # Repeated spans (several PrepareDownload calls, say) are summed into one entry
+    totals = {}
+    for name, _, duration in trace.spans:
+        count, summed = totals.get(name, (0, 0.0))
+        totals[name] = (count + 1, summed + duration)
+    entries = [
+        f'{name};dur={summed * 1000:.1f}' + (f';desc="x{count}"' if count > 1 else "")
+        for name, (count, summed) in totals.items()
+    ]
+    entries.append(f"total;dur={total * 1000:.1f}")
+
+    if TRACE_SLOWEST > 0:
+        _keep_if_slow(trace, total)
+    return ", ".join(entries)
+
+
+def _keep_if_slow(trace, total):
+    entry = (total, next(_sequence), trace)
+    with _slowest_lock:
+        if len(_slowest) < TRACE_SLOWEST:
+            heapq.heappush(_slowest, entry)
+        elif total > _slowest[0][0]:
+            heapq.heapreplace(_slowest, entry)
+        else:
+            return
+    log.info("Slow request trace", route=trace.route, total_ms=round(total * 1000, 1),
+             spans=[(name, round(duration * 1000, 1)) for name, _, duration in trace.spans])
+
+
+def slowest():
+    """
+    Return the slowest kept traces, slowest first.
+
+    Returns:
+        list: One dict per trace with route, total and per-span offsets and durations in milliseconds
+    """
+    with _slowest_lock:
+        entries = sorted(_slowest, reverse=True)
+    return [
+        {
+            "route": trace.route,
+            "total_ms": round(total * 1000, 1),
+            "spans": [
+                {"name": name, "offset_ms": round(offset * 1000, 1), "duration_ms": round(duration * 1000, 1)}
+                for name, offset, duration in trace.spans
+            ],
+        }
+        for total, _, trace in entries
+    ]